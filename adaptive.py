@@ -0,0 +1,159 @@
+"""
+Adaptive frame-skip and resolution control for the face recognition loop.
+
+Instead of always processing every other frame at 1/4 size, the controller
+measures how long each processed frame takes and picks the downscale factor
+that keeps it within a latency budget; skipping frames cannot make a single
+frame faster. Face size feeds in too: small (far away) faces raise the
+resolution so HOG can still find them, large (close) faces lower it because
+the detail is not needed. The skip ratio answers throughput instead: it is
+raised only when the processing time per offered frame exceeds the time
+between frames (the loop falls behind the camera), and lowered again when
+processing more frames would still keep up.
+"""
+
+import time
+import threading
+from collections import deque
+
+# Downscale factors the controller moves between (1/8 ... 1/2 size)
+SCALES = (0.125, 1 / 6.0, 0.25, 1 / 3.0, 0.5)
+
+
+class AdaptiveController:
+    """Chooses the downscale factor for a per-frame latency budget and the frame skip for throughput"""
+    def __init__(self, target_latency=0.1, min_face=40, max_face=120, scales=SCALES,
+                 initial_scale=0.25, skip=2, max_skip=6, adjust_every=5, smoothing=0.3,
+                 capture_fps=0.0, capacity=1.0, stats=None, name=None):
+        self.target_latency = target_latency  # seconds per processed frame; 0 keeps settings fixed
+        self.min_face = min_face  # face height (pixels, at detection scale) below which to scale up
+        self.max_face = max_face  # face height above which detail is wasted
+        self.scales = scales
+        self.scale_index = min(range(len(scales)), key=lambda i: abs(scales[i] - initial_scale))
+        self.skip = skip  # process one frame in every `skip`
+        self.max_skip = max_skip
+        self.adjust_every = adjust_every
+        self.smoothing = smoothing
+        # Nominal camera rate; 0 uses the measured rate frames are offered at (right when
+        # stale frames are dropped, as the pipeline's grabber does)
+        self.capture_fps = capture_fps
+        self.capacity = capacity  # frames processed at once for this camera (worker processes)
+        self.stats = stats
+        # Camera name: with several cameras the gauges are published per camera ('skip:cam1')
+        self.name = name
+        self.lock = threading.Lock()
+        self.latency = None  # smoothed processing time per frame
+        self.frame_counter = 0
+        self.updates = 0
+        self.processed = deque(maxlen=50)  # completion times for the achieved rate
+        self.offered = deque(maxlen=50)  # times should_process was asked, for the offered rate
+
+    @property
+    def enabled(self):
+        return self.target_latency > 0
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    def should_process(self):
+        """True for one frame in every `skip`"""
+        with self.lock:
+            self.offered.append(time.time())
+            self.frame_counter += 1
+            return self.frame_counter % self.skip == 0
+
+    def update(self, duration, face_locations, scale=None):
+        """Feed back one processed frame: its processing time and its faces (full-frame boxes)"""
+        with self.lock:
+            self.processed.append(time.time())
+            self.latency = duration if self.latency is None else \
+                self.smoothing * duration + (1 - self.smoothing) * self.latency
+            self.updates += 1
+            if self.enabled and self.updates % self.adjust_every == 0:
+                self._adjust(face_locations, scale or self.scale)
+            self._publish()
+
+    def _adjust(self, face_locations, scale):
+        over = self.latency > self.target_latency * 1.15
+        under = self.latency < self.target_latency * 0.6
+        small = large = False
+        if face_locations:
+            smallest = min(bottom - top for top, right, bottom, left in face_locations) * scale
+            small = smallest < self.min_face
+            large = smallest > self.max_face
+
+        # Resolution is what sets the time of one frame
+        if small and self.scale_index < len(self.scales) - 1 and self._fits(self.scale_index + 1):
+            self._set(scale_index=self.scale_index + 1, reason="faces small")
+        elif large and self.scale_index > 0:
+            self._set(scale_index=self.scale_index - 1, reason="faces large")
+        elif over and not small and self.scale_index > 0:
+            self._set(scale_index=self.scale_index - 1, reason="over budget")
+        else:
+            # Skip is what sets how many frames there are to process
+            load = self.load()
+            if load is None:
+                return
+            if load > 1.15 and self.skip < self.max_skip:
+                self._set(skip=self.skip + 1, reason=f"falling behind the camera, load {load:.2f}")
+            elif self.skip > 1 and self.load(self.skip - 1) < 0.85:
+                self._set(skip=self.skip - 1, reason=f"keeping up, load {load:.2f}")
+
+    def _fits(self, scale_index):
+        """Whether the latency at another scale (detection cost grows with the pixel count) is in budget"""
+        predicted = self.latency * (self.scales[scale_index] / self.scale) ** 2
+        return predicted <= self.target_latency * 1.15
+
+    def offered_fps(self):
+        """Rate frames arrive at: the nominal camera rate, or the measured one"""
+        if self.capture_fps > 0:
+            return self.capture_fps
+        return self._rate(self.offered)
+
+    def load(self, skip=None):
+        """
+        Processing time needed per second of frames at `skip` (default: the
+        current one) over the capacity; above 1 frames pile up or are dropped
+        """
+        rate = self.offered_fps()
+        if self.latency is None or not rate:
+            return None
+        return self.latency * rate / ((skip or self.skip) * self.capacity)
+
+    def _set(self, skip=None, scale_index=None, reason=""):
+        old = (self.skip, self.scale)
+        if skip is not None:
+            self.skip = skip
+        if scale_index is not None:
+            self.scale_index = scale_index
+            # Latency at a new resolution is unknown; start measuring afresh
+            self.latency = None
+        print(f"[ADAPT] skip 1/{old[0]} -> 1/{self.skip}, scale {old[1]:.3f} -> {self.scale:.3f} ({reason})")
+
+    @staticmethod
+    def _rate(times):
+        if len(times) < 2:
+            return 0.0
+        span = times[-1] - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+    def achieved_fps(self):
+        """Processed frames per second over the recent window"""
+        return self._rate(self.processed)
+
+    def status(self):
+        """Current settings and measurements"""
+        return {
+            'scale': self.scale,
+            'skip': self.skip,
+            'latency_ms': 1000.0 * (self.latency or 0.0),
+            'target_ms': 1000.0 * self.target_latency,
+            'processed_fps': self.achieved_fps(),
+            'load': self.load() or 0.0,
+        }
+
+    def _publish(self):
+        if self.stats:
+            for key, value in self.status().items():
+                self.stats.set_gauge(f"{key}:{self.name}" if self.name else key, value)
@@ -0,0 +1,228 @@
+"""
+Approximate nearest-neighbour matching for very large face galleries.
+
+IVFGallery is a FaceGallery with an inverted-file index on top: a k-means
+coarse quantizer splits the encodings into `nlist` cells, a query only looks
+at the `nprobe` closest cells, and the candidates found there are re-ranked
+with exact distances. Raising `nprobe` trades latency for recall; probing
+every cell is exactly the brute-force search.
+"""
+
+import math
+
+import numpy as np
+
+from gallery import DEFAULT_TOLERANCE, ENCODING_SIZE, FaceGallery, pairwise_distances, top_k
+
+DEFAULT_NPROBE = 8
+# Below this many identities brute force is as fast as the index, so it is not trained
+MIN_TRAIN_SIZE = 1000
+
+
+def kmeans(points, nlist, iterations=10, sample_size=100000, seed=0):
+    """Train `nlist` centroids on (a sample of) the points with Lloyd's algorithm"""
+    rng = np.random.default_rng(seed)
+    if len(points) > sample_size:
+        points = points[rng.choice(len(points), sample_size, replace=False)]
+    points = np.asarray(points, dtype=np.float32)
+    centroids = points[rng.choice(len(points), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_to_centroids(points, centroids)
+        counts = np.bincount(assignment, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty cells from random points so every cell stays useful
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+
+def assign_to_centroids(points, centroids, chunk_size=20000):
+    """Index of the nearest centroid for every point, computed in chunks to bound memory"""
+    centroid_sq = (centroids * centroids).sum(axis=1)
+    assignment = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        # |p|^2 is constant per row, so it does not affect the argmin
+        scores = centroid_sq[None, :] - 2.0 * (chunk @ centroids.T)
+        assignment[start:start + chunk_size] = np.argmin(scores, axis=1)
+    return assignment
+
+
+class IVFGallery(FaceGallery):
+    """FaceGallery searched through an IVF (k-means cells + exact re-ranking) index"""
+    def __init__(self, encodings=None, names=None, tolerance=DEFAULT_TOLERANCE,
+                 dim=ENCODING_SIZE, nlist=None, nprobe=DEFAULT_NPROBE, capacity=64):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self._centroid_sq = None
+        self._lists = []  # cell id -> list of row indices
+        self._list_cache = {}  # cell id -> cached np.array of its rows
+        self._assign = []  # row index -> cell id (-1 while untrained)
+        super().__init__(encodings, names, tolerance, dim, capacity)
+
+    @classmethod
+    def from_gallery(cls, gallery, nlist=None, nprobe=DEFAULT_NPROBE):
+        """Build an IVF index over the identities of an existing FaceGallery"""
+        index = cls.from_matrix(gallery.names, gallery.encodings, tolerance=gallery.tolerance,
+                                nlist=nlist, nprobe=nprobe)
+        index.version = gallery.version
+        index.train()
+        return index
+
+    @classmethod
+    def from_matrix(cls, names, matrix, **kwargs):
+        """Wrap an existing matrix (see FaceGallery.from_matrix); the index starts untrained"""
+        index = super().from_matrix(names, matrix, **kwargs)
+        index._assign = [-1] * len(index)
+        return index
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self, nlist=None, iterations=10):
+        """(Re)build the coarse quantizer and assign every identity to a cell"""
+        with self.lock:
+            if self._size < MIN_TRAIN_SIZE:
+                # Too small to benefit; matching stays brute force
+                self.centroids = None
+                return False
+            nlist = nlist or self.nlist or int(math.sqrt(self._size))
+            self.nlist = max(1, min(nlist, self._size))
+            matrix = self._matrix[:self._size]
+            self.centroids = kmeans(matrix, self.nlist, iterations)
+            self._centroid_sq = (self.centroids * self.centroids).sum(axis=1)
+            assignment = assign_to_centroids(matrix, self.centroids)
+            self._assign = assignment.tolist()
+            order = np.argsort(assignment, kind='stable')
+            bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[c]:bounds[c + 1]].tolist() for c in range(self.nlist)]
+            self._list_cache = {}
+            return True
+
+    def _cell_of(self, encoding):
+        scores = self._centroid_sq - 2.0 * (self.centroids @ encoding)
+        return int(np.argmin(scores))
+
+    def _move(self, row, cell):
+        """Put a row in a cell, taking it out of its previous one"""
+        previous = self._assign[row]
+        if previous == cell:
+            return
+        if previous >= 0:
+            self._lists[previous].remove(row)
+            self._list_cache.pop(previous, None)
+        if cell >= 0:
+            self._lists[cell].append(row)
+            self._list_cache.pop(cell, None)
+        self._assign[row] = cell
+
+    def add(self, name, encoding):
+        """Add or replace an identity and file it under its nearest cell"""
+        with self.lock:
+            super().add(name, encoding)
+            row = self._rows[name]
+            if row == len(self._assign):
+                self._assign.append(-1)
+            if self.trained:
+                self._move(row, self._cell_of(self._matrix[row]))
+
+    def add_many(self, names, encodings):
+        """Add several identities, assigning all new rows to cells in one batch"""
+        with self.lock:
+            super().add_many(names, encodings)
+            # Replacements and repeated names go through add(), which files its rows
+            # itself; only rows appended by the batch path are still unassigned
+            start = len(self._assign)
+            self._assign.extend([-1] * (self._size - start))
+            if self.trained and self._size > start:
+                cells = assign_to_centroids(self._matrix[start:self._size], self.centroids)
+                for row, cell in zip(range(start, self._size), cells.tolist()):
+                    self._move(row, cell)
+
+    def remove(self, name):
+        """Remove an identity; the last row takes its slot, as in FaceGallery"""
+        with self.lock:
+            row = self._rows.get(name)
+            if row is None:
+                return False
+            last = self._size - 1
+            self._move(row, -1)
+            if row != last:
+                cell = self._assign[last]
+                if cell >= 0:
+                    members = self._lists[cell]
+                    members[members.index(last)] = row
+                    self._list_cache.pop(cell, None)
+                self._assign[row] = cell
+            self._assign.pop()
+            return super().remove(name)
+
+    def _cell_rows(self, cell):
+        rows = self._list_cache.get(cell)
+        if rows is None:
+            rows = np.array(self._lists[cell], dtype=np.int64)
+            self._list_cache[cell] = rows
+        return rows
+
+    def match(self, face_encodings, k=1, nprobe=None):
+        """Top-k identities per query, searching only the `nprobe` closest cells"""
+        if len(face_encodings) == 0:
+            return []
+        with self.lock:
+            if not self.trained:
+                return super().match(face_encodings, k)
+            queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.dim)
+            nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+            coarse = self._centroid_sq[None, :] - 2.0 * (queries @ self.centroids.T)
+            if nprobe < self.nlist:
+                probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+            else:
+                probes = np.tile(np.arange(self.nlist), (len(queries), 1))
+            results = []
+            for query, cells in zip(queries, probes):
+                candidates = np.concatenate([self._cell_rows(c) for c in cells])
+                if len(candidates) == 0:
+                    results.append([])
+                    continue
+                # Exact re-ranking of everything found in the probed cells
+                distances = pairwise_distances(query[None, :], self._matrix[candidates],
+                                               self._sq_norms[candidates])[0]
+                results.append(top_k(distances, candidates, self._names, k))
+            return results
+
+    def save(self, path):
+        """Write the encodings, names and trained index to one .npz file"""
+        with self.lock:
+            np.savez(
+                path,
+                encodings=self._matrix[:self._size],
+                names=np.array(self.names, dtype=str),
+                centroids=self.centroids if self.trained else np.zeros((0, self.dim), np.float32),
+                assign=np.array(self._assign, dtype=np.int64),
+                params=np.array([self.nprobe, self.tolerance, self.dim], dtype=np.float64),
+            )
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save() without retraining"""
+        with np.load(path, allow_pickle=False) as data:
+            nprobe, tolerance, dim = data['params']
+            index = cls(data['encodings'], data['names'].tolist(), float(tolerance), int(dim),
+                        nprobe=int(nprobe))
+            centroids = data['centroids']
+            assignment = data['assign']
+        if len(centroids):
+            index.centroids = centroids.astype(np.float32)
+            index._centroid_sq = (index.centroids * index.centroids).sum(axis=1)
+            index.nlist = len(centroids)
+            index._assign = assignment.tolist()
+            index._lists = [[] for _ in range(index.nlist)]
+            for row, cell in enumerate(index._assign):
+                index._lists[cell].append(row)
+        return index
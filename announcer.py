@@ -0,0 +1,131 @@
+"""
+Bounded, deduplicating queue of spoken announcements.
+
+Text-to-speech runs at speaking speed, far slower than frames arrive, so an
+unbounded queue of greetings and alerts ends up minutes behind reality.
+The Announcer keeps only a few pending messages. A message repeated within
+`dedup_window` is dropped, and a message that is already pending is replaced
+by the newer one (latest wins). When the queue is full, the
+lowest-priority message gives way. Messages that waited longer than `max_age`
+are never spoken, and consecutive announcements are at least
+`min_interval` apart.
+"""
+
+import time
+import threading
+import itertools
+
+# Lower number = higher priority
+GREETING = 0
+ALERT = 1
+
+
+class Announcement:
+    def __init__(self, text, priority, key, created_at, seq):
+        self.text = text
+        self.priority = priority
+        self.key = key
+        self.created_at = created_at
+        self.seq = seq
+
+
+class Announcer:
+    """Priority queue of announcements with deduplication, rate limiting and a size bound"""
+    def __init__(self, max_pending=4, dedup_window=10.0, min_interval=1.0, max_age=5.0, stats=None):
+        self.max_pending = max_pending
+        self.dedup_window = dedup_window  # seconds during which the same message is not repeated
+        self.min_interval = min_interval  # seconds between the start of two announcements
+        self.max_age = max_age  # pending messages older than this are stale and skipped
+        self.stats = stats
+        self.condition = threading.Condition()
+        self.pending = {}  # key -> Announcement
+        self.last_announced = {}  # key -> time it was last accepted
+        self.last_spoken_at = 0.0
+        self.stopped = False
+        self.spoken = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.stale = 0
+        self._seq = itertools.count()
+
+    def announce(self, text, priority=ALERT, key=None):
+        """Offer a message; returns False if it was deduplicated or dropped"""
+        key = key or text
+        now = time.time()
+        with self.condition:
+            if key in self.pending:
+                # Latest wins: refresh the pending copy instead of queueing a second one
+                self.pending[key] = Announcement(text, min(priority, self.pending[key].priority), key,
+                                                 now, next(self._seq))
+                self._count('deduplicated')
+                return False
+            if now - self.last_announced.get(key, 0.0) < self.dedup_window:
+                self._count('deduplicated')
+                return False
+            if len(self.pending) >= self.max_pending:
+                # Evict the least important, oldest message, unless the new one is even less important
+                victim = max(self.pending.values(), key=lambda a: (a.priority, -a.seq))
+                if victim.priority < priority:
+                    self._count('dropped')
+                    return False
+                del self.pending[victim.key]
+                self._count('dropped')
+            self.pending[key] = Announcement(text, priority, key, now, next(self._seq))
+            self.last_announced[key] = now
+            if len(self.last_announced) > 256:
+                self.last_announced = {k: t for k, t in self.last_announced.items()
+                                       if now - t < self.dedup_window}
+            self._publish()
+            self.condition.notify()
+            return True
+
+    def next(self, timeout=1.0):
+        """Wait for the most important pending message; None on timeout or after stop()"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+                for key in [k for k, a in self.pending.items() if now - a.created_at > self.max_age]:
+                    del self.pending[key]
+                    self._count('stale')
+                wait = deadline - now
+                if self.pending:
+                    # Rate limit: newer or more important messages can still arrive while waiting
+                    wait = min(wait, self.last_spoken_at + self.min_interval - now)
+                    if wait <= 0:
+                        announcement = min(self.pending.values(), key=lambda a: (a.priority, a.seq))
+                        del self.pending[announcement.key]
+                        self.last_spoken_at = now
+                        self.spoken += 1
+                        self._publish()
+                        return announcement.text
+                if deadline - now <= 0:
+                    return None
+                self.condition.wait(wait)
+            return None
+
+    def stop(self):
+        """Wake the speaker thread and make next() return None from now on"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def _count(self, name):
+        setattr(self, name, getattr(self, name) + 1)
+        if self.stats:
+            self.stats.increment(f"announce_{name}")
+
+    def _publish(self):
+        if self.stats:
+            self.stats.set_gauge('announce_depth', len(self.pending))
+
+    def status(self):
+        """Queue depth and how many messages were spoken, merged, dropped or went stale"""
+        with self.condition:
+            return {
+                'depth': len(self.pending),
+                'spoken': self.spoken,
+                'deduplicated': self.deduplicated,
+                'dropped': self.dropped,
+                'stale': self.stale,
+            }
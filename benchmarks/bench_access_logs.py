@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard access-log queries on a large synthetic access_logs table,
+before and after the index migration.
+
+A temporary database is filled with `--rows` events spread over a year.
+The dashboard queries are timed on the bare table (the pre-migration schema),
+then DatabaseManager is opened on the same file, which applies the index
+migration, and the queries are timed again. Deep pages are fetched with
+OFFSET (unindexed) and with keyset cursors (indexed).
+
+    python benchmarks/bench_access_logs.py
+    python benchmarks/bench_access_logs.py --rows 5000000
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager, sql_timestamp
+
+EVENTS = ("Authorized Access", "Door Opened", "Door Locked", "Unknown Person Detected")
+
+
+def fill(path, rows, people, chunk=200000):
+    """Create the original (unindexed) schema and insert synthetic events"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE access_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            event_type TEXT NOT NULL,
+            person_name TEXT,
+            details TEXT
+        )
+    ''')
+    rng = np.random.default_rng(0)
+    start = time.time() - 365 * 86400
+    step = 365 * 86400 / rows
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        kinds = rng.integers(0, len(EVENTS), n)
+        persons = rng.integers(0, people, n)
+        conn.executemany(
+            "INSERT INTO access_logs (timestamp, event_type, person_name) VALUES (?, ?, ?)",
+            [(sql_timestamp(start + (offset + i) * step), EVENTS[k],
+              f"person_{p}" if k != 3 else "N/A") for i, (k, p) in enumerate(zip(kinds, persons))])
+        conn.commit()
+    conn.close()
+
+
+def timed(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return 1000.0 * best
+
+
+def run_queries(label, conn, db, repeats, deep_page, page=100):
+    recent = "SELECT id, timestamp, event_type, person_name, details FROM access_logs " \
+             "ORDER BY timestamp DESC, id DESC LIMIT ?"
+    results = {
+        'recent 100': timed(lambda: conn.execute(recent, (page,)).fetchall(), repeats),
+        'one person (all rows)': timed(lambda: conn.execute(
+            "SELECT id, timestamp, event_type, details FROM access_logs WHERE person_name = ? "
+            "ORDER BY timestamp DESC", ("person_7",)).fetchall(), repeats),
+        'one person, page of 100': timed(lambda: conn.execute(
+            "SELECT id FROM access_logs WHERE person_name = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            ("person_7", page)).fetchall(), repeats),
+        'one day, page of 100': timed(lambda: conn.execute(
+            "SELECT id FROM access_logs WHERE timestamp >= ? AND timestamp < ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (sql_timestamp(time.time() - 100 * 86400), sql_timestamp(time.time() - 99 * 86400), page)
+        ).fetchall(), repeats),
+        f'page {deep_page} via OFFSET': timed(lambda: conn.execute(
+            recent + " OFFSET ?", (page, deep_page * page)).fetchall(), repeats),
+    }
+    if db is not None:
+        # Walk to the deep page once to get its cursor, then time fetching the page after it
+        cursor = conn.execute("SELECT timestamp, id FROM access_logs ORDER BY timestamp DESC, id DESC "
+                              "LIMIT 1 OFFSET ?", (deep_page * page - 1,)).fetchone()
+        results[f'page {deep_page} via cursor'] = timed(
+            lambda: db.query_access_logs(page, before=cursor), repeats)
+    for name, ms in results.items():
+        print(f"{label:>10}  {name:<28} {ms:>10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000, help="Synthetic access_logs rows")
+    parser.add_argument('--people', type=int, default=500, help="Distinct person names")
+    parser.add_argument('--repeats', type=int, default=3, help="Best-of repeats per query")
+    parser.add_argument('--deep-page', type=int, default=1000, help="Page number for the pagination test")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_logs_')
+    try:
+        path = os.path.join(directory, 'door_system.db')
+        start = time.perf_counter()
+        fill(path, args.rows, args.people)
+        print(f"Filled {args.rows} rows in {time.perf_counter() - start:.1f} s\n")
+
+        conn = sqlite3.connect(path)
+        run_queries('no index', conn, None, args.repeats, args.deep_page)
+        conn.close()
+
+        start = time.perf_counter()
+        db = DatabaseManager(path)
+        print(f"\nMigration (index build) took {time.perf_counter() - start:.1f} s\n")
+        run_queries('indexed', db._connection(), db, args.repeats, args.deep_page)
+        db.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk enrollment vs enrolling people one at a time with register.py.
+
+A temporary export of `--people` folders with `--images` synthetic JPEGs each
+is generated, or a real export is used with `--source`. The old path calls
+register.encode_user_faces per person: serial decoding and encoding, then one
+gallery version and one users transaction per person. It runs on the first
+`--baseline` people only, because its gallery writes grow with every user.
+bulk_enroll then enrolls everyone with a process pool and batched commits.
+Both report images per second.
+
+    python benchmarks/bench_bulk_enroll.py
+    python benchmarks/bench_bulk_enroll.py --source ~/hr_export.zip --workers 8
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def make_export(directory, people, images, size=(240, 320)):
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    for person in range(people):
+        folder = os.path.join(directory, f"person_{person:05d}")
+        os.makedirs(folder)
+        for number in range(images):
+            pixels = rng.integers(0, 255, (size[0], size[1], 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(os.path.join(folder, f"{number}.jpg"), quality=85)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help="Existing export (directory or zip) instead of synthetic images")
+    parser.add_argument('--people', type=int, default=200, help="Synthetic people")
+    parser.add_argument('--images', type=int, default=3, help="Synthetic images per person")
+    parser.add_argument('--baseline', type=int, default=50, help="People enrolled the old way")
+    parser.add_argument('--workers', type=int, default=None, help="Encoding processes (default: one per core)")
+    parser.add_argument('--batch-size', type=int, default=500, help="People per transaction")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_bulk_enroll_')
+    source_path = os.path.abspath(args.source) if args.source else os.path.join(directory, 'export')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        if not args.source:
+            make_export(source_path, args.people, args.images)
+        # Imported here so the database and known_faces/ are the temporary ones
+        import register
+        import bulk_enroll
+        from database import db_manager
+        from gallery_store import GalleryStore
+
+        source = bulk_enroll.ImageSource(source_path)
+        people = bulk_enroll.people_from_folders(source.files())
+        total = sum(len(refs) for refs in people.values())
+
+        # Old way: copy a person's images into known_faces/ and encode them serially
+        os.makedirs('known_faces')
+        baseline = sorted(people)[:args.baseline]
+        count = 0
+        start = time.perf_counter()
+        for name in baseline:
+            for number, ref in enumerate(people[name], 1):
+                with open(os.path.join('known_faces', f"{name}_{number}.jpg"), 'wb') as f:
+                    f.write(source.read(ref))
+                count += 1
+            register.encode_user_faces(name)
+        old = time.perf_counter() - start
+        print(f"register.encode_user_faces: {len(baseline)} people, {count} images in {old:.1f}s "
+              f"({count / old:.1f} images/s)")
+
+        shutil.rmtree('known_faces')
+        enroller = bulk_enroll.BulkEnroller(source, GalleryStore('known_faces', change_log=db_manager), db_manager,
+                                            'known_faces', workers=args.workers, batch_size=args.batch_size,
+                                            overwrite=True, progress_interval=10.0)
+        start = time.perf_counter()
+        enroller.run(people)
+        new = time.perf_counter() - start
+        print(f"bulk_enroll ({enroller.workers} workers): {enroller.enrolled} people, {total} images in {new:.1f}s "
+              f"({total / new:.1f} images/s, {enroller.batches} batch(es))")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
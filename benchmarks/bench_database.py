@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark: access-log inserts and dashboard read latency, per-call connections
+vs DatabaseManager's long-lived WAL connections.
+
+Two scenarios are run against a temporary database for each variant:
+  - inserts/sec of log_access_event from a single thread
+  - the same writer running flat out while a reader thread polls
+    get_recent_access_logs (the dashboard's query), reporting read latency
+
+    python benchmarks/bench_database.py
+    python benchmarks/bench_database.py --seconds 5 --seed-rows 50000
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import DatabaseManager
+
+
+class LegacyDatabaseManager(DatabaseManager):
+    """The pre-pooling access path: connect, execute, commit and close on every call"""
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        # The old database was never switched to WAL
+        self.close()
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+    def log_access_event(self, event_type, person_name=None, details=None):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO access_logs (event_type, person_name, details) VALUES (?, ?, ?)",
+                     (event_type, person_name, details))
+        conn.commit()
+        conn.close()
+
+    def get_recent_access_logs(self, limit=50):
+        conn = sqlite3.connect(self.db_path)
+        logs = conn.execute(
+            "SELECT id, timestamp, event_type, person_name, details FROM access_logs "
+            "ORDER BY timestamp DESC LIMIT ?", (limit,)).fetchall()
+        conn.close()
+        return logs
+
+
+def seed(db, rows):
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany("INSERT INTO access_logs (event_type, person_name) VALUES (?, ?)",
+                     [("Authorized Access", f"person_{i % 100}") for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def insert_rate(db, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        db.log_access_event("Authorized Access", "bench", "cam0")
+        count += 1
+    return count / seconds
+
+
+def concurrent(db, seconds):
+    """Writer flat out on one thread, dashboard reader polling on another"""
+    stop = threading.Event()
+    writes = [0]
+    read_times = []
+    errors = []
+
+    def writer():
+        while not stop.is_set():
+            try:
+                db.log_access_event("Door Opened", "bench", "cam0")
+                writes[0] += 1
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                db.get_recent_access_logs(100)
+                read_times.append(time.perf_counter() - start)
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    reads = np.array(read_times) * 1000.0
+    return writes[0] / seconds, reads, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=3.0, help="Duration of each scenario")
+    parser.add_argument('--seed-rows', type=int, default=10000, help="Rows in access_logs before timing")
+    args = parser.parse_args()
+
+    print(f"{'variant':>8} {'inserts/s':>10} {'+reader ins/s':>14} {'read p50':>9} {'read p95':>9} "
+          f"{'read max':>9} {'errors':>7}")
+    for label, cls in (('legacy', LegacyDatabaseManager), ('pooled', DatabaseManager)):
+        directory = tempfile.mkdtemp(prefix='bench_db_')
+        try:
+            db = cls(os.path.join(directory, 'door_system.db'))
+            seed(db, args.seed_rows)
+            rate = insert_rate(db, args.seconds)
+            contended, reads, errors = concurrent(db, args.seconds)
+            print(f"{label:>8} {rate:>10.0f} {contended:>14.0f} {np.percentile(reads, 50):>7.2f}ms "
+                  f"{np.percentile(reads, 95):>7.2f}ms {reads.max():>7.2f}ms {errors:>7}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: alert e-mail cost for the caller, inline SMTP vs MailDispatcher.
+
+A local SMTP stand-in (smtp_stub.py) with a configurable per-message delay
+receives the alerts. The inline path is the original EmailNotifier code
+(connect, send and quit per alert on the caller's thread); the dispatcher
+path only queues the alert. The dispatcher run also injects temporary
+failures and dropped connections to exercise reconnects and retries, and
+reports how long delivery took and how many e-mails the digests saved.
+
+    python benchmarks/bench_email.py
+    python benchmarks/bench_email.py --alerts 50 --delay 0.5 --digest 2
+"""
+
+import os
+import sys
+import time
+import shutil
+import smtplib
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from mail_dispatcher import MailDispatcher, build_message
+from smtp_stub import SMTPStub
+
+SENDER = 'door@example.com'
+RECIPIENT = 'security@example.com'
+
+
+def send_inline(port, subject, body, attachment):
+    """The pre-dispatcher EmailNotifier.send_notification path (without TLS/login)"""
+    msg = build_message(SENDER, RECIPIENT, subject, body, [attachment])
+    server = smtplib.SMTP('127.0.0.1', port)
+    server.sendmail(SENDER, RECIPIENT, msg.as_string())
+    server.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--alerts', type=int, default=20, help="Alerts to send per variant")
+    parser.add_argument('--interval', type=float, default=0.05, help="Seconds between alerts")
+    parser.add_argument('--delay', type=float, default=0.2, help="Stub server delay per message")
+    parser.add_argument('--digest', type=float, default=1.0, help="Dispatcher digest window in seconds")
+    parser.add_argument('--fail-every', type=int, default=4, help="Stub refuses every n-th message")
+    parser.add_argument('--drop-every', type=int, default=7, help="Stub drops the connection every n-th message")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_email_')
+    attachment = os.path.join(directory, 'unknown.jpg')
+    with open(attachment, 'wb') as f:
+        f.write(os.urandom(60 * 1024))
+    try:
+        stub = SMTPStub(port=0, delay=args.delay).start()
+        caller = []
+        for i in range(args.alerts):
+            start = time.perf_counter()
+            send_inline(stub.port, f"Security Alert {i}", "Unknown person", attachment)
+            caller.append(time.perf_counter() - start)
+            time.sleep(args.interval)
+        caller = np.array(caller) * 1000.0
+        print(f"inline      caller blocked: mean {caller.mean():7.1f} ms  max {caller.max():7.1f} ms  "
+              f"({len(stub.received)} e-mails, {stub.connections} connections)")
+        stub.stop()
+
+        stub = SMTPStub(port=0, delay=args.delay, fail_every=args.fail_every,
+                        drop_every=args.drop_every).start()
+        dispatcher = MailDispatcher('127.0.0.1', stub.port, SENDER, RECIPIENT,
+                                    outbox_dir=os.path.join(directory, 'outbox'),
+                                    digest_window=args.digest, retry_base=0.5)
+        dispatcher.start()
+        caller = []
+        start_all = time.perf_counter()
+        for i in range(args.alerts):
+            start = time.perf_counter()
+            dispatcher.submit(f"Security Alert {i}", "Unknown person", attachment)
+            caller.append(time.perf_counter() - start)
+            time.sleep(args.interval)
+        left = dispatcher.flush(timeout=60)
+        while dispatcher.outbox and time.perf_counter() - start_all < 60:
+            time.sleep(0.1)
+        delivered = time.perf_counter() - start_all
+        dispatcher.stop()
+        caller = np.array(caller) * 1000.0
+        print(f"dispatcher  caller blocked: mean {caller.mean():7.3f} ms  max {caller.max():7.3f} ms  "
+              f"({len(stub.received)} e-mails, {stub.connections} connections, "
+              f"{dispatcher.failures} failed attempts retried, {len(dispatcher.outbox)} unsent)")
+        print(f"            all {args.alerts} alerts delivered {delivered:.1f} s after the first")
+        stub.stop()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: re-encoding enrollment images with and without the encoding cache.
+
+`--images` synthetic JPEGs (or the images in `--source`) are encoded three
+ways: the old load_image_file + face_encodings, the cache when it is empty
+(every image is a miss and is stored), and the cache again (every image is
+a hit). Then one image in ten is modified and they are encoded once more,
+which is what re-averaging a user or re-running a bulk enrollment after a
+few photos changed costs.
+
+    python benchmarks/bench_encoding_cache.py
+    python benchmarks/bench_encoding_cache.py --source known_faces
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', help="Directory of .jpg images instead of synthetic ones")
+    parser.add_argument('--images', type=int, default=100, help="Synthetic images")
+    args = parser.parse_args()
+
+    import face_recognition
+    from PIL import Image
+    from encoding_cache import EncodingCache
+
+    if args.source:
+        images = []
+        for file in sorted(os.listdir(args.source)):
+            if file.lower().endswith(('.jpg', '.jpeg', '.png')):
+                with open(os.path.join(args.source, file), 'rb') as f:
+                    images.append(f.read())
+    else:
+        rng = np.random.default_rng(0)
+        images = []
+        for _ in range(args.images):
+            out = io.BytesIO()
+            Image.fromarray(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)).save(out, 'JPEG', quality=85)
+            images.append(out.getvalue())
+
+    directory = tempfile.mkdtemp(prefix='bench_encoding_cache_')
+    try:
+        start = time.perf_counter()
+        for data in images:
+            face_recognition.face_encodings(face_recognition.load_image_file(io.BytesIO(data)))
+        old = time.perf_counter() - start
+
+        cache = EncodingCache(os.path.join(directory, 'encoding_cache.db'))
+        start = time.perf_counter()
+        for data in images:
+            cache.encode(data)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for data in images:
+            cache.encode(data)
+        warm = time.perf_counter() - start
+
+        # A tenth of the images change (a trailing byte is enough to change the hash)
+        changed = [data + b'\0' if i % 10 == 0 else data for i, data in enumerate(images)]
+        start = time.perf_counter()
+        for data in changed:
+            cache.encode(data)
+        partial = time.perf_counter() - start
+
+        count = len(images)
+        print(f"{count} images")
+        print(f"no cache:              {old:7.2f}s ({old / count * 1000:6.1f} ms/image)")
+        print(f"cache, cold (misses):  {cold:7.2f}s ({cold / count * 1000:6.1f} ms/image)")
+        print(f"cache, warm (hits):    {warm:7.2f}s ({warm / count * 1000:6.1f} ms/image)")
+        print(f"cache, 10% changed:    {partial:7.2f}s ({partial / count * 1000:6.1f} ms/image)")
+        status = cache.status()
+        print(f"cache: {status['entries']} entries, {status['size_mb']:.2f} MB, "
+              f"{status['total_hits']} hits, {status['total_misses']} misses")
+        cache.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
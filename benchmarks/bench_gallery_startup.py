@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: gallery startup time, per-user .npy files vs the consolidated store.
+
+For each gallery size a temporary known_faces directory is filled with
+<name>_encoding.npy files, loaded the old way (listdir + one np.load per
+user), converted, and then loaded through GalleryStore (one index read and
+one memory-mapped matrix).
+
+    python benchmarks/bench_gallery_startup.py
+    python benchmarks/bench_gallery_startup.py --sizes 1000 20000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gallery import FaceGallery
+from gallery_store import GalleryStore
+
+
+def load_legacy(directory):
+    """The pre-store startup path from main.py"""
+    encodings, names = [], []
+    for file in os.listdir(directory):
+        if file.endswith('_encoding.npy'):
+            names.append(file.replace('_encoding.npy', ''))
+            encodings.append(np.load(os.path.join(directory, file)))
+    return FaceGallery(encodings, names)
+
+
+def best_of(repeats, fn):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(size, repeats, rng):
+    directory = tempfile.mkdtemp(prefix='gallery_bench_')
+    try:
+        for i in range(size):
+            np.save(os.path.join(directory, f"user_{i}_encoding.npy"), rng.normal(0, 0.1, 128))
+        store = GalleryStore(directory)
+
+        legacy_time, legacy = best_of(repeats, lambda: load_legacy(directory))
+        start = time.perf_counter()
+        store.convert_legacy()
+        convert_time = time.perf_counter() - start
+        store_time, gallery = best_of(repeats, store.load_gallery)
+        assert len(gallery) == len(legacy) == size
+
+        query = rng.normal(0, 0.1, (1, 128))
+        match_time, _ = best_of(repeats, lambda: gallery.identify(query))
+        print(f"{size:>8,} users  legacy={1000 * legacy_time:9.1f} ms  store={1000 * store_time:7.2f} ms  "
+              f"x{legacy_time / max(store_time, 1e-9):7.1f}  (convert {convert_time:.2f}s, "
+              f"first match on mmap {1000 * match_time:.2f} ms)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print("Best-of-%d load times (warm page cache)" % args.repeats)
+    for size in args.sizes:
+        run(size, args.repeats, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard log queries before and after archiving old access logs.
+
+A temporary database is filled with `--rows` events spread evenly over
+`--months` months. The /logs queries are timed on the full table: the newest
+page, a page filtered by a rare event type, a filter nothing matches (a full
+scan), a page for one person, and the last week. Then rows older than `--keep-days` are moved to monthly archives
+(followed by VACUUM) and the same queries are timed on the small hot table.
+It also times reading an archived month on demand, cold and cached, and
+reports the database and archive sizes.
+
+    python benchmarks/bench_log_archive.py
+    python benchmarks/bench_log_archive.py --rows 5000000 --months 36
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+EVENTS = ("Door Opened", "Authorized Access", "Door Locked", "Unknown Person Detected", "Error")
+
+
+def timed(fn, repeats=10):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000.0
+
+
+def database_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000000, help="Events in the database")
+    parser.add_argument('--months', type=int, default=24, help="Months the events are spread over")
+    parser.add_argument('--keep-days', type=float, default=90, help="Days kept in the hot table")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_log_archive_')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        # Imported here so the database and archive directory are the temporary ones
+        from database import db_manager, sql_timestamp
+        from log_archive import LogArchive
+
+        now = time.time()
+        span = args.months * 30 * 86400
+        step = span / args.rows
+        for offset in range(0, args.rows, 100000):
+            batch = []
+            for i in range(offset, min(args.rows, offset + 100000)):
+                # "Error" is rare: one event in a thousand
+                event = EVENTS[4] if i % 1000 == 999 else EVENTS[i % 4]
+                batch.append((now - span + i * step, event, f"person_{i % 500}", None))
+            db_manager.log_access_events(batch)
+
+        week = sql_timestamp(now - 7 * 86400)
+        queries = [
+            ("newest 100", lambda: db_manager.query_access_logs(100)),
+            ("event=Error page", lambda: db_manager.query_access_logs(100, event_type="Error")),
+            ("no match (scan)", lambda: db_manager.query_access_logs(100, event_type="Tamper")),
+            ("person page", lambda: db_manager.query_access_logs(100, person_name="person_42")),
+            ("last 7 days", lambda: db_manager.query_access_logs(1000, since=week)),
+        ]
+
+        def measure():
+            return [timed(fn) for _, fn in queries]
+
+        size_before = database_size(db_manager.db_path)
+        before = measure()
+
+        archive = LogArchive(db_manager)
+        start = time.perf_counter()
+        moved = archive.archive(args.keep_days)
+        archive_time = time.perf_counter() - start
+        start = time.perf_counter()
+        db_manager.vacuum()
+        vacuum_time = time.perf_counter() - start
+        size_after = database_size(db_manager.db_path)
+        after = measure()
+
+        print(f"{'query':<18} {'full table':>11} {'hot table':>11}")
+        for (name, _), old, new in zip(queries, before, after):
+            print(f"{name:<18} {old:>9.2f}ms {new:>9.2f}ms")
+        status = archive.status()
+        print(f"archived {moved} rows into {status['archives']} monthly files in {archive_time:.1f}s "
+              f"(VACUUM {vacuum_time:.1f}s)")
+        print(f"database {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB; "
+              f"archives {status['bytes'] / 1e6:.1f} MB")
+
+        # On-demand reads of an archived month, e.g. /logs?archive=1&person=...&until=...
+        months = db_manager.get_log_archives()
+        month = months[len(months) // 2]
+        _, until = month[0], month[4]
+        archive.cache.clear()
+        start = time.perf_counter()
+        archive.query(100, person_name="person_42", until=until)
+        cold = (time.perf_counter() - start) * 1000.0
+        warm = timed(lambda: archive.query(100, person_name="person_42", until=until))
+        print(f"archived month {month[0]} ({month[2]} rows): person page {cold:.0f} ms cold, {warm:.2f} ms cached")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
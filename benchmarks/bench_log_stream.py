@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of keeping dashboards up to date with the access log.
+
+A temporary database is filled with `--rows` events. Then it times one
+dashboard poll of /logs in three ways: a full re-fetch of the newest 100
+rows, a conditional GET answered with 304 Not Modified, and an incremental
+?since_id= poll with nothing new. Finally `--clients` /logs/stream
+subscribers are connected while events are logged. It reports how many
+database polls the shared watcher made, compared with per-client polling,
+and the delay from logging an event to each client receiving it.
+
+    python benchmarks/bench_log_stream.py
+    python benchmarks/bench_log_stream.py --rows 1000000 --clients 50
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def timed(fn, repeats=20):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000, help="Events in the database")
+    parser.add_argument('--clients', type=int, default=20, help="Concurrent /logs/stream clients")
+    parser.add_argument('--events', type=int, default=20, help="Events logged while clients are connected")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_log_stream_')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        # Imported here so the dashboard's database is the temporary one
+        import web_dashboard
+        from database import db_manager
+        client = web_dashboard.app.test_client()
+
+        start = time.time() - 365 * 86400
+        for offset in range(0, args.rows, 100000):
+            db_manager.log_access_events([(start + i * 60, "Door Opened", f"person_{i % 500}", None)
+                                          for i in range(offset, min(args.rows, offset + 100000))])
+
+        etag = client.get('/logs').headers['ETag']
+        last_id = db_manager.get_latest_log_id()
+        full = timed(lambda: client.get('/logs'))
+        conditional = timed(lambda: client.get('/logs', headers={'If-None-Match': etag}))
+        incremental = timed(lambda: client.get(f'/logs?since_id={last_id}'))
+        print(f"full poll (100 rows):        {full:7.2f} ms")
+        print(f"conditional poll (304):      {conditional:7.2f} ms")
+        print(f"incremental poll (since_id): {incremental:7.2f} ms")
+
+        watcher = web_dashboard.log_watcher
+        delays = []
+        lock = threading.Lock()
+        logged_at = {}
+
+        def listen():
+            response = client.get('/logs/stream', buffered=False)
+            received = 0
+            for chunk in response.response:
+                chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                if chunk.startswith('id:'):
+                    event_id = int(chunk.split()[1])
+                    with lock:
+                        delays.append(time.time() - logged_at.get(event_id, time.time()))
+                    received += 1
+                    if received >= args.events:
+                        break
+            response.close()
+
+        threads = [threading.Thread(target=listen, daemon=True) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        while watcher.status()['subscribers'] < args.clients:
+            time.sleep(0.01)
+        polls_before = watcher.polls
+        run_start = time.time()
+        for i in range(args.events):
+            now = time.time()
+            db_manager.log_access_events([(now, "Authorized Access", f"person_{i}", None)])
+            logged_at[db_manager.get_latest_log_id()] = now
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join(30)
+        elapsed = time.time() - run_start
+        polls = watcher.polls - polls_before
+        per_client = args.clients * elapsed / watcher.interval
+        delays = np.array(delays) * 1000.0
+        print(f"stream: {args.clients} clients, {len(delays)} events delivered, "
+              f"{polls} DB polls (per-client polling at the same rate: ~{per_client:.0f})")
+        print(f"        delivery delay median {np.median(delays):.0f} ms, max {delays.max():.0f} ms")
+        watcher.stop()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: importing door_access.log into the database.
+
+A synthetic CSV log of `--rows` lines (one event a minute, in DoorLogger's
+format) is written to a temporary directory. The old migrate_logs inserted
+and committed one row at a time; it is timed on the first `--baseline` rows.
+The streaming migrate_logs then imports the whole file in chunks, and is run
+a second time to show that a re-run only checks the high-water mark.
+
+    python benchmarks/bench_migrate_logs.py
+    python benchmarks/bench_migrate_logs.py --rows 5000000 --chunk-rows 100000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+EVENTS = ("Door Opened", "Authorized Access", "Door Locked", "Unknown Person Detected")
+
+
+def write_log(path, rows):
+    start = time.time() - rows * 60
+    with open(path, 'w') as f:
+        f.write("Timestamp,Event,Person\n")
+        for i in range(rows):
+            stamp = datetime.fromtimestamp(start + i * 60).strftime("%Y-%m-%d %H:%M:%S")
+            person = "N/A" if i % 4 == 2 else f"person_{i % 300}"
+            f.write(f"{stamp},{EVENTS[i % 4]},{person}\n")
+
+
+def legacy_migrate_logs(db, log_file, limit):
+    """The old per-row migrate_logs (which also dropped the timestamp)"""
+    count = 0
+    with open(log_file, 'r') as f:
+        next(f)
+        for line in f:
+            if count >= limit:
+                break
+            parts = line.strip().split(',', 2)
+            if len(parts) == 3:
+                timestamp_str, event, person = parts
+                datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
+                db.log_access_event(event, person if person != "N/A" else None)
+                count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help="Lines in the synthetic log")
+    parser.add_argument('--baseline', type=int, default=5000, help="Lines imported the old way")
+    parser.add_argument('--chunk-rows', type=int, default=50000, help="Rows per transaction")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_migrate_logs_')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        write_log('door_access.log', args.rows)
+        # Imported here so the database is the temporary one
+        import migrate_data
+        from database import db_manager, DatabaseManager
+
+        legacy_db = DatabaseManager('legacy.db')
+        start = time.perf_counter()
+        count = legacy_migrate_logs(legacy_db, 'door_access.log', args.baseline)
+        old = time.perf_counter() - start
+        print(f"old per-row import: {count} rows in {old:.2f}s ({count / old:.0f} rows/s)")
+
+        start = time.perf_counter()
+        count = migrate_data.migrate_logs('door_access.log', args.chunk_rows)
+        new = time.perf_counter() - start
+        print(f"streaming import:   {count} rows in {new:.2f}s ({count / new:.0f} rows/s)")
+
+        start = time.perf_counter()
+        migrate_data.migrate_logs('door_access.log', args.chunk_rows)
+        print(f"re-run (nothing new): {(time.perf_counter() - start) * 1000:.1f} ms")
+        oldest = db_manager.query_access_logs(1, since_id=0)[0]
+        print(f"first imported row keeps its time: {oldest[1]} UTC")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
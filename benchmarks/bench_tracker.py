@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: face encode calls with and without the cross-frame tracker.
+
+Replays a recorded video through detection, the tracker and matching against
+the known_faces gallery, once encoding every face on every frame and once
+with tracker-driven skipping, and reports encode calls per second, processing
+rate and how often the two runs disagree on identities.
+
+    python benchmarks/bench_tracker.py --video hallway.mp4
+    python benchmarks/bench_tracker.py --video hallway.mp4 --refresh-interval 5 --every 2
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import face_recognition
+
+from gallery_store import GalleryStore
+from pipeline import prepare_frame
+from tracker import FaceTracker, encode_faces
+
+
+def replay(video, gallery, refresh_interval, every, limit):
+    """Run the serial detect/encode/track loop over the video; returns stats and names per frame"""
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open video {video}")
+    tracker = FaceTracker(refresh_interval=refresh_interval)
+    encode_calls = faces = processed = 0
+    names_per_frame = []
+    encode_time = 0.0
+    start = time.perf_counter()
+    frame_index = 0
+    while limit is None or processed < limit:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        frame_index += 1
+        if frame_index % every:
+            continue
+        rgb_small_frame = prepare_frame(frame)
+        face_locations = face_recognition.face_locations(rgb_small_frame)
+        encode_start = time.perf_counter()
+        face_encodings = encode_faces(rgb_small_frame, face_locations, tracker.skip_boxes())
+        encode_time += time.perf_counter() - encode_start
+        tracked = tracker.update(face_locations, face_encodings, gallery.identify)
+        encode_calls += sum(encoding is not None for encoding in face_encodings)
+        faces += len(face_locations)
+        processed += 1
+        names_per_frame.append([name for name, _, _ in tracked])
+    capture.release()
+    elapsed = time.perf_counter() - start
+    return {
+        'frames': processed,
+        'faces': faces,
+        'encode_calls': encode_calls,
+        'encode_time': encode_time,
+        'elapsed': elapsed,
+    }, names_per_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', required=True, help="Recorded video to replay")
+    parser.add_argument('--known-faces', default='known_faces')
+    parser.add_argument('--refresh-interval', type=int, default=10)
+    parser.add_argument('--every', type=int, default=2, help="Process every Nth frame (main.py uses 2)")
+    parser.add_argument('--limit', type=int, default=None, help="Stop after this many processed frames")
+    args = parser.parse_args()
+
+    gallery = GalleryStore(args.known_faces).load_gallery()
+    print(f"Gallery: {len(gallery)} identities")
+
+    baseline, baseline_names = replay(args.video, gallery, 0, args.every, args.limit)
+    tracked, tracked_names = replay(args.video, gallery, args.refresh_interval, args.every, args.limit)
+
+    for label, run in (("encode every face", baseline), (f"tracker (refresh {args.refresh_interval})", tracked)):
+        print(f"{label:<24} frames={run['frames']:<6} faces={run['faces']:<6} "
+              f"encode calls={run['encode_calls']:<6} ({run['encode_calls'] / run['elapsed']:6.1f}/s)  "
+              f"encode time={run['encode_time']:6.1f}s  {run['frames'] / run['elapsed']:5.1f} frames/s")
+
+    saved = baseline['encode_calls'] - tracked['encode_calls']
+    print(f"Encode calls avoided: {saved} ({100.0 * saved / max(baseline['encode_calls'], 1):.1f}%)")
+
+    # Identity agreement, ignoring faces the tracker could not attribute on a frame
+    compared = disagree = 0
+    for base, track in zip(baseline_names, tracked_names):
+        for a, b in zip(base, track):
+            if b is not None:
+                compared += 1
+                disagree += a != b
+    print(f"Identity disagreements: {disagree}/{compared}")
+
+
+if __name__ == '__main__':
+    main()
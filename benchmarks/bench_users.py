@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard user list with the cached registry vs the old directory scan.
+
+A temporary known_faces/ directory, gallery and database are grown to each
+size in `--sizes` (one image file and one gallery entry per user). At each
+size it times the old get_registered_users (two directory listings, list
+membership checks and a full users query per page load) and the rendered
+/ and /users pages and an /api/users search served from the registry, plus
+the one-off reload after a user is added.
+
+    python benchmarks/bench_users.py
+    python benchmarks/bench_users.py --sizes 1000,50000,100000
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def legacy_registered_users(db, store, directory):
+    """The pre-registry web_dashboard.get_registered_users"""
+    user_dict = {}
+    for db_user in db.get_all_users():
+        user_dict[db_user[1]] = {'name': db_user[1], 'trained': False, 'created_at': db_user[2],
+                                 'last_seen': db_user[3], 'access_count': db_user[4]}
+    trained_names = set(store.names())
+    for username in trained_names:
+        if username in user_dict:
+            user_dict[username]['trained'] = True
+        else:
+            user_dict[username] = {'name': username, 'trained': True, 'created_at': None,
+                                   'last_seen': None, 'access_count': 0}
+    encoding_files = [f for f in os.listdir(directory) if f.endswith('_encoding.npy')]
+    for file in os.listdir(directory):
+        if file.endswith('.jpg') and '_' in file and not file.startswith('.'):
+            username = '_'.join(file.split('_')[:-1])
+            trained = f"{username}_encoding.npy" in encoding_files or username in trained_names
+            if username in user_dict:
+                user_dict[username]['trained'] = trained
+            else:
+                user_dict[username] = {'name': username, 'trained': trained, 'created_at': None,
+                                       'last_seen': None, 'access_count': 0}
+    return list(user_dict.values())
+
+
+def timed(fn, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default="1000,10000,50000", help="Comma-separated user counts")
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+
+    directory = tempfile.mkdtemp(prefix='bench_users_')
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        os.makedirs('known_faces')
+        shutil.copytree(os.path.join(ROOT, 'templates'), 'templates')
+        # Imported here so the dashboard's database and known_faces/ are the temporary ones
+        import web_dashboard
+        from database import db_manager
+        client = web_dashboard.app.test_client()
+        store = web_dashboard.gallery_store
+        rng = np.random.default_rng(0)
+
+        count = 0
+        print(f"{'users':>7}  {'old scan':>9}  {'/ page':>8}  {'/users':>8}  {'search':>8}  {'reload':>8}")
+        for size in sizes:
+            names = [f"person_{i:06d}" for i in range(count, size)]
+            for name in names:
+                open(os.path.join('known_faces', f"{name}_1.jpg"), 'wb').close()
+            version = store.put_many({name: rng.random(128) for name in names})
+            db_manager.save_enrollments([(name, True, version, [f"known_faces/{name}_1.jpg"]) for name in names])
+            count = size
+
+            old = timed(lambda: legacy_registered_users(db_manager, store, 'known_faces'), 3)
+            client.get('/api/users')  # first use after the change reloads the registry
+            index = timed(lambda: client.get('/'))
+            users = timed(lambda: client.get('/users'))
+            search = timed(lambda: client.get('/api/users?q=person_00&page=2'))
+            db_manager.add_user(f"zz_added_{size}")
+            start = time.perf_counter()
+            client.get('/')
+            reload = (time.perf_counter() - start) * 1000.0
+            print(f"{size:>7}  {old:>7.1f}ms  {index:>6.1f}ms  {users:>6.1f}ms  {search:>6.1f}ms  {reload:>6.1f}ms")
+        print(f"(registry: {web_dashboard.registry.reloads} full reload(s), {web_dashboard.registry.patches} incremental update(s))")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Minimal local SMTP stand-in for testing e-mail alerts without a real server.
+
+Accepts EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP and QUIT (no TLS, no AUTH),
+optionally waits before answering each DATA to mimic a slow server, and can
+refuse every n-th message or drop the connection to exercise retries.
+Received messages are counted and optionally saved as .eml files.
+
+    python benchmarks/smtp_stub.py --port 2525 --save-dir received
+    SMTP_SERVER=localhost SMTP_PORT=2525 python main.py
+
+Use from Python (as bench_email.py does):
+
+    server = SMTPStub(port=0, delay=0.5)
+    server.start()   # server.port holds the bound port
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import socketserver
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        stub = self.server.stub
+        stub.connections += 1
+        self.reply("220 smtp-stub ready")
+        in_data, lines = False, []
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip("\r\n")
+            if in_data:
+                if line != ".":
+                    lines.append(line[1:] if line.startswith("..") else line)
+                    continue
+                in_data = False
+                time.sleep(stub.delay)
+                if stub.refuse(self):
+                    continue
+                stub.deliver("\r\n".join(lines))
+                lines = []
+                self.reply("250 OK: queued")
+                continue
+            command = line[:4].upper()
+            if command == "EHLO":
+                self.reply("250-smtp-stub")
+                self.reply("250 8BITMIME")
+            elif command in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStub:
+    """Threaded stand-in SMTP server"""
+    def __init__(self, host='127.0.0.1', port=2525, delay=0.0, fail_every=0, drop_every=0, save_dir=None):
+        self.delay = delay  # seconds to wait before accepting each message
+        self.fail_every = fail_every  # answer every n-th message with a temporary error
+        self.drop_every = drop_every  # close the connection instead of answering every n-th message
+        self.save_dir = save_dir
+        self.received = []
+        self.attempts = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), _Handler)
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def refuse(self, handler):
+        """Apply the configured failure modes; True if the message was not accepted"""
+        with self.lock:
+            self.attempts += 1
+            attempt = self.attempts
+        if self.drop_every and attempt % self.drop_every == 0:
+            handler.connection.close()
+            return True
+        if self.fail_every and attempt % self.fail_every == 0:
+            handler.reply("451 Temporary failure, try again later")
+            return True
+        return False
+
+    def deliver(self, message):
+        with self.lock:
+            self.received.append(message)
+            count = len(self.received)
+        if self.save_dir:
+            os.makedirs(self.save_dir, exist_ok=True)
+            with open(os.path.join(self.save_dir, f"message_{count:05d}.eml"), 'w') as f:
+                f.write(message)
+        subject = next((l[9:] for l in message.splitlines() if l.startswith("Subject: ")), "")
+        print(f"[SMTP-STUB] Message {count}: {subject}")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP stand-in server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds before accepting each message")
+    parser.add_argument('--fail-every', type=int, default=0, help="Temporarily refuse every n-th message")
+    parser.add_argument('--drop-every', type=int, default=0, help="Drop the connection on every n-th message")
+    parser.add_argument('--save-dir', default=None, help="Save received messages as .eml files here")
+    args = parser.parse_args()
+
+    stub = SMTPStub(args.host, args.port, args.delay, args.fail_every, args.drop_every, args.save_dir)
+    print(f"SMTP stub listening on {args.host}:{stub.port} (Ctrl+C to stop)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Received {len(stub.received)} message(s) over {stub.connections} connection(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Bulk enrollment from a photo export (directory or .zip).
+
+Two layouts are accepted:
+  - one folder per person:  <source>/<name>/<any>.jpg
+  - a manifest CSV with `name` and `image` columns, image paths relative to
+    the source (`--manifest`, or manifest.csv at the top of the source)
+
+Images are decoded and encoded in a pool of worker processes. Each person's
+encodings are averaged like register.py does. Every `--batch-size` people are
+written together: one gallery version, their images copied into known_faces/
+as <name>_<n>.jpg, and one transaction for the users rows. After each batch
+the enrolled names are appended to a state file. A crashed or interrupted run
+started again with the same arguments skips the people that are already
+done. Images with no face, several faces or errors are listed in a CSV
+report. Images encoded in an earlier run come from the encoding cache.
+
+    python bulk_enroll.py hr_export.zip
+    python bulk_enroll.py photos/ --manifest photos/people.csv --workers 8
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import time
+import zipfile
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from enrollment import encode_image, _init_worker
+from encoding_cache import CACHE_FILE, EncodingCache
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+MANIFEST_FILE = 'manifest.csv'
+
+
+# --- Sources ---
+class ImageSource:
+    """Reads image files from a directory or a zip archive by relative path"""
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.is_zip = zipfile.is_zipfile(self.path) if os.path.isfile(self.path) else False
+        if not self.is_zip and not os.path.isdir(self.path):
+            raise ValueError(f"{path} is neither a directory nor a zip file")
+        self.archive = zipfile.ZipFile(self.path) if self.is_zip else None
+
+    def files(self):
+        """Relative paths of every file in the source, '/'-separated"""
+        if self.is_zip:
+            return [info.filename for info in self.archive.infolist() if not info.is_dir()]
+        files = []
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                files.append(os.path.relpath(os.path.join(root, name), self.path).replace(os.sep, '/'))
+        return files
+
+    def read(self, ref):
+        if self.is_zip:
+            return self.archive.read(ref)
+        with open(os.path.join(self.path, ref), 'rb') as f:
+            return f.read()
+
+    def exists(self, ref):
+        if self.is_zip:
+            try:
+                self.archive.getinfo(ref)
+                return True
+            except KeyError:
+                return False
+        return os.path.isfile(os.path.join(self.path, ref))
+
+
+def is_image(ref):
+    name = ref.rsplit('/', 1)[-1]
+    return ref.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.') and '__MACOSX' not in ref
+
+
+def valid_name(name):
+    return bool(name) and not name.startswith('.') and '/' not in name and '\\' not in name
+
+
+def people_from_folders(files):
+    """{name: [image refs]} from <name>/<image> paths (one shared top folder, as zips often have, is skipped)"""
+    images = sorted(ref for ref in files if is_image(ref))
+    tops = {ref.split('/', 1)[0] for ref in images}
+    strip = len(tops) == 1 and all(ref.count('/') >= 2 for ref in images)
+    people = {}
+    for ref in images:
+        parts = ref.split('/')[1:] if strip else ref.split('/')
+        if len(parts) < 2:
+            print(f"[BULK] Skipping {ref}: not inside a person's folder")
+            continue
+        people.setdefault(parts[0].strip(), []).append(ref)
+    return people
+
+
+def people_from_manifest(text):
+    """{name: [image refs]} from a CSV with name and image columns"""
+    reader = csv.DictReader(io.StringIO(text))
+    columns = {column.strip().lower(): column for column in reader.fieldnames or []}
+    if 'name' not in columns or 'image' not in columns:
+        raise ValueError("Manifest needs 'name' and 'image' columns")
+    people = {}
+    for row in reader:
+        name = (row[columns['name']] or '').strip()
+        image = (row[columns['image']] or '').strip().replace('\\', '/')
+        if name and image:
+            people.setdefault(name, []).append(image)
+    return people
+
+
+def read_manifest(source, manifest):
+    """Manifest text from a file on disk, or from inside the source"""
+    if os.path.isfile(manifest):
+        with open(manifest, newline='', encoding='utf-8-sig') as f:
+            return f.read()
+    return source.read(manifest).decode('utf-8-sig')
+
+
+# --- Worker process side ---
+_sources = {}
+
+
+def encode_source_image(path, ref):
+    """Encode every face in one image of the source (runs in a worker process)"""
+    try:
+        source = _sources.get(path)
+        if source is None:
+            source = _sources[path] = ImageSource(path)
+        return encode_image(source.read(ref))
+    except Exception as e:
+        return None, f"{e}"
+
+
+# --- Resume state and report ---
+class EnrollmentState:
+    """Append-only record of the people already handled for one source"""
+    def __init__(self, path, source, restart=False):
+        self.path = path
+        self.done = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path) as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('source') != source:
+                    raise ValueError(f"{path} belongs to {header.get('source')}; use --state or --restart")
+                for line in f:
+                    try:
+                        self.done.update(json.loads(line))
+                    except ValueError:
+                        break  # torn last line from a crash; that batch is redone
+        else:
+            with open(path, 'w') as f:
+                f.write(json.dumps({'source': source, 'started_at': time.time()}) + '\n')
+
+    def mark(self, names):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(sorted(names)) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(names)
+
+
+class Report:
+    """CSV of every image or person that was not enrolled cleanly"""
+    FIELDS = ['name', 'image', 'problem', 'faces', 'detail']
+
+    def __init__(self, path, append):
+        new = not append or not os.path.exists(path)
+        self.file = open(path, 'w' if new else 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(self.FIELDS)
+        self.counts = {}
+
+    def add(self, name, image, problem, faces='', detail=''):
+        self.writer.writerow([name, image, problem, faces, detail])
+        self.counts[problem] = self.counts.get(problem, 0) + 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# --- Enrollment ---
+class BulkEnroller:
+    """Encodes people's images in a process pool and commits them in batches"""
+    def __init__(self, source, store, db, directory='known_faces', workers=None, batch_size=500,
+                 skip_multiple=False, overwrite=False, report=None, state=None, progress_interval=2.0,
+                 cache_path=None):
+        self.source = source
+        self.store = store
+        self.db = db
+        self.directory = directory
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.skip_multiple = skip_multiple  # drop images with several faces instead of using the first
+        self.overwrite = overwrite  # re-enroll people who are already in the gallery
+        self.report = report
+        self.state = state
+        self.progress_interval = progress_interval
+        self.cache_path = cache_path  # encoding cache shared by the workers, None to always encode
+        self.images_done = 0
+        self.images_total = 0
+        self.enrolled = 0
+        self.failed = 0
+        self.skipped = 0
+        self.batches = 0
+
+    def run(self, people):
+        """Enroll {name: [image refs]}; returns the number of people enrolled"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.store.ensure_converted()
+        existing = set(self.store.names())
+        self.old_images = {}
+        for file in os.listdir(self.directory):
+            if file.endswith('.jpg') and '_' in file and not file.startswith('.'):
+                self.old_images.setdefault(file.rsplit('_', 1)[0], []).append(file)
+
+        todo = []
+        for name, refs in sorted(people.items()):
+            if self.state is not None and name in self.state.done:
+                continue
+            if not valid_name(name):
+                self._problem(name, '', 'invalid_name')
+                continue
+            if name in existing and not self.overwrite:
+                self.skipped += 1
+                continue
+            missing = [ref for ref in refs if not self.source.exists(ref)]
+            for ref in missing:
+                self._problem(name, ref, 'missing')
+            refs = [ref for ref in refs if ref not in missing]
+            if refs:
+                todo.append((name, refs))
+            else:
+                self._problem(name, '', 'no_images')
+        self.images_total = sum(len(refs) for _, refs in todo)
+        print(f"[BULK] {len(todo)} people ({self.images_total} images) to enroll, "
+              f"{self.skipped} already enrolled, {len(self.state.done) if self.state else 0} done in an earlier run")
+
+        self.started = time.time()
+        self.last_progress = self.started
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.cache_path,)) as executor:
+            for name, refs, results in self._encoded(executor, todo):
+                encoding, used = self._person_encoding(name, refs, results)
+                if encoding is None:
+                    self.failed += 1
+                    self._problem(name, '', 'not_enrolled', detail="no usable face in any image")
+                    continue
+                batch.append((name, encoding, used))
+                if len(batch) >= self.batch_size:
+                    self.commit(batch)
+                    batch = []
+                self._progress()
+            if batch:
+                self.commit(batch)
+        self._progress(final=True)
+        return self.enrolled
+
+    def _encoded(self, executor, todo):
+        """Yield (name, refs, results) in order, keeping a bounded number of images in flight"""
+        pending = deque()
+        window = self.workers * 8
+        path = self.source.path
+        for name, refs in todo:
+            pending.append((name, refs, [executor.submit(encode_source_image, path, ref) for ref in refs]))
+            while sum(len(item[2]) for item in pending) > window:
+                yield self._collect(pending.popleft())
+        while pending:
+            yield self._collect(pending.popleft())
+
+    def _collect(self, item):
+        name, refs, futures = item
+        results = [future.result() for future in futures]
+        self.images_done += len(refs)
+        return name, refs, results
+
+    def _person_encoding(self, name, refs, results):
+        """Average encoding over the person's usable images, and the images it used"""
+        encodings, used = [], []
+        for ref, (faces, error) in zip(refs, results):
+            if error:
+                self._problem(name, ref, 'error', detail=error)
+            elif not faces:
+                self._problem(name, ref, 'no_face', 0)
+            elif len(faces) > 1 and self.skip_multiple:
+                self._problem(name, ref, 'multiple_faces', len(faces), "skipped")
+            else:
+                if len(faces) > 1:
+                    self._problem(name, ref, 'multiple_faces', len(faces), "used the first face")
+                encodings.append(faces[0])
+                used.append(ref)
+        if not encodings:
+            return None, []
+        return np.mean(encodings, axis=0), used
+
+    def commit(self, batch):
+        """Gallery entries, images and users rows for one batch of people"""
+        staged = []
+        try:
+            for name, _, refs in batch:
+                for number, ref in enumerate(refs, 1):
+                    path = os.path.join(self.directory, f"{name}_{number}.jpg")
+                    temp = os.path.join(self.directory, f".{name}_{number}.jpg.bulk.tmp")
+                    with open(temp, 'wb') as f:
+                        f.write(self._jpeg(self.source.read(ref)))
+                    staged.append((name, temp, path))
+            version = self.store.put_many({name: encoding for name, encoding, _ in batch})
+        except Exception:
+            for _, temp, _ in staged:
+                if os.path.exists(temp):
+                    os.remove(temp)
+            raise
+        paths = {}
+        for name, temp, path in staged:
+            os.replace(temp, path)
+            paths.setdefault(name, []).append(path)
+        # Images left over from an earlier, larger enrollment of the same person
+        for name, _, _ in batch:
+            keep = {os.path.basename(path) for path in paths[name]}
+            for file in self.old_images.get(name, []):
+                if file not in keep:
+                    try:
+                        os.remove(os.path.join(self.directory, file))
+                    except OSError:
+                        pass
+        self.db.save_enrollments([(name, True, version, paths[name]) for name, _, _ in batch])
+        if self.report is not None:
+            self.report.flush()
+        if self.state is not None:
+            self.state.mark([name for name, _, _ in batch])
+        self.enrolled += len(batch)
+        self.batches += 1
+        print(f"[BULK] Committed {len(batch)} people (gallery version {version})")
+
+    def _jpeg(self, data):
+        """Image bytes as JPEG, so known_faces/ keeps a single format"""
+        if data[:3] == b'\xff\xd8\xff':
+            return data
+        from PIL import Image
+        out = io.BytesIO()
+        Image.open(io.BytesIO(data)).convert('RGB').save(out, 'JPEG', quality=95)
+        return out.getvalue()
+
+    def _problem(self, name, image, problem, faces='', detail=''):
+        if self.report is not None:
+            self.report.add(name, image, problem, faces, detail)
+
+    def _progress(self, final=False):
+        now = time.time()
+        if not final and now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.images_done / elapsed
+        remaining = (self.images_total - self.images_done) / rate if rate > 0 else 0
+        print(f"[BULK] {self.images_done}/{self.images_total} images ({rate:.1f}/s), "
+              f"{self.enrolled} people enrolled, {self.failed} failed"
+              + (f", ~{remaining:.0f}s left" if not final else f" in {elapsed:.1f}s"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="Directory or .zip with the photos")
+    parser.add_argument('--manifest', help="CSV with name,image columns (a path on disk or inside the source)")
+    parser.add_argument('--dir', default='known_faces', help="known_faces directory")
+    parser.add_argument('--workers', type=int, default=None, help="Encoding processes (default: one per core)")
+    parser.add_argument('--batch-size', type=int, default=500, help="People written per transaction")
+    parser.add_argument('--report', default='bulk_enroll_report.csv', help="CSV of images that were not used")
+    parser.add_argument('--state', default='bulk_enroll.state', help="Progress file used to resume")
+    parser.add_argument('--restart', action='store_true', help="Ignore progress from an earlier run")
+    parser.add_argument('--overwrite', action='store_true', help="Re-enroll people already in the gallery")
+    parser.add_argument('--skip-multiple', action='store_true',
+                        help="Do not use images with more than one face (default: use the first face)")
+    parser.add_argument('--no-cache', action='store_true', help="Encode every image, ignoring the encoding cache")
+    args = parser.parse_args()
+
+    try:
+        source = ImageSource(args.source)
+        manifest = args.manifest
+        if manifest is None and source.exists(MANIFEST_FILE):
+            manifest = MANIFEST_FILE
+        if manifest:
+            people = people_from_manifest(read_manifest(source, manifest))
+        else:
+            people = people_from_folders(source.files())
+        state = EnrollmentState(args.state, source.path, restart=args.restart)
+    except (ValueError, OSError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+    if not people:
+        print("Error: No images found")
+        return 1
+
+    from database import db_manager
+    from gallery_store import GalleryStore
+    store = GalleryStore(args.dir, change_log=db_manager)
+    report = Report(args.report, append=bool(state.done))
+    cache = None if args.no_cache else EncodingCache(os.path.join(args.dir, CACHE_FILE))
+    before = cache.status() if cache else None
+    enroller = BulkEnroller(source, store, db_manager, args.dir, workers=args.workers,
+                            batch_size=args.batch_size, skip_multiple=args.skip_multiple,
+                            overwrite=args.overwrite, report=report, state=state,
+                            cache_path=cache.path if cache else None)
+    try:
+        enroller.run(people)
+    except KeyboardInterrupt:
+        print("[BULK] Interrupted; run the same command again to continue")
+        return 1
+    finally:
+        report.close()
+    if cache:
+        after = cache.status()
+        print(f"Encoding cache: {after['total_hits'] - before['total_hits']} hits, "
+              f"{after['total_misses'] - before['total_misses']} misses ({after['entries']} images cached)")
+    problems = ', '.join(f"{count} {problem}" for problem, count in sorted(report.counts.items()))
+    print(f"Enrolled {enroller.enrolled} people in {enroller.batches} batch(es). "
+          f"Report: {args.report}" + (f" ({problems})" if problems else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,158 @@
 import sqlite3
 import os
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 import json
 
+# Per-connection settings. WAL lets the dashboard read while the door process
+# writes; NORMAL sync is safe with WAL and avoids an fsync on every commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",  # KiB, i.e. 8 MB of page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Schema migrations applied on top of the base tables, tracked in PRAGMA user_version.
+# Append new (version, description, statements) entries; never edit applied ones.
+MIGRATIONS = (
+    (1, "index access_logs by time and by person", (
+        "CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp ON access_logs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_access_logs_person ON access_logs (person_name, timestamp)",
+    )),
+    (2, "add the episodes table", (
+        """CREATE TABLE IF NOT EXISTS episodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            episode_key TEXT UNIQUE NOT NULL,
+            person_name TEXT NOT NULL,
+            camera TEXT,
+            started_at TIMESTAMP NOT NULL,
+            last_seen TIMESTAMP NOT NULL,
+            detections INTEGER NOT NULL,
+            best_distance REAL,
+            closed INTEGER NOT NULL DEFAULT 0
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_episodes_started ON episodes (started_at)",
+        "CREATE INDEX IF NOT EXISTS idx_episodes_person ON episodes (person_name, started_at)",
+    )),
+    (3, "add the captures table", (
+        """CREATE TABLE IF NOT EXISTS captures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            captured_at TIMESTAMP NOT NULL,
+            camera TEXT,
+            crop_path TEXT NOT NULL,
+            thumb_path TEXT,
+            box TEXT,
+            encoding BLOB
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_captures_time ON captures (captured_at)",
+    )),
+    (4, "add the visitors table", (
+        """CREATE TABLE IF NOT EXISTS visitors (
+            visitor_id TEXT PRIMARY KEY,
+            first_seen TIMESTAMP NOT NULL,
+            last_seen TIMESTAMP NOT NULL,
+            sightings INTEGER NOT NULL,
+            encoding BLOB NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_visitors_last_seen ON visitors (last_seen)",
+    )),
+    (5, "track enrollment state of users", (
+        "ALTER TABLE users ADD COLUMN trained INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN encoding_version INTEGER",
+        "ALTER TABLE users ADD COLUMN image_paths TEXT",
+        # Every change to users is logged by name, so cached copies only reload what changed
+        """CREATE TABLE IF NOT EXISTS user_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            person_name TEXT NOT NULL
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS users_inserted AFTER INSERT ON users
+           BEGIN INSERT INTO user_changes (person_name) VALUES (NEW.name); END""",
+        """CREATE TRIGGER IF NOT EXISTS users_updated AFTER UPDATE ON users
+           BEGIN
+               INSERT INTO user_changes (person_name) VALUES (NEW.name);
+               INSERT INTO user_changes (person_name) SELECT OLD.name WHERE OLD.name != NEW.name;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS users_deleted AFTER DELETE ON users
+           BEGIN INSERT INTO user_changes (person_name) VALUES (OLD.name); END""",
+    )),
+    (6, "add the import_marks table", (
+        # How far each log file has been imported into access_logs, to resume without duplicates
+        """CREATE TABLE IF NOT EXISTS import_marks (
+            source TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            fingerprint TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    )),
+    (7, "add the log_archives table", (
+        # Monthly compressed files holding access_logs rows moved out of the hot table
+        """CREATE TABLE IF NOT EXISTS log_archives (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            first_timestamp TIMESTAMP,
+            last_timestamp TIMESTAMP,
+            bytes INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+    )),
+    (8, "log only enrollment changes of users", (
+        # update_user_access runs on every door entry; it must not count as a change to the user list
+        "DROP TRIGGER IF EXISTS users_updated",
+        """CREATE TRIGGER users_updated AFTER UPDATE OF name, trained, encoding_version, image_paths ON users
+           BEGIN
+               INSERT INTO user_changes (person_name) VALUES (NEW.name);
+               INSERT INTO user_changes (person_name) SELECT OLD.name WHERE OLD.name != NEW.name;
+           END""",
+    )),
+)
+
+def sql_timestamp(timestamp):
+    """Format a time.time() value like SQLite's CURRENT_TIMESTAMP (UTC)"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
 class DatabaseManager:
     """Manages the SQLite database for the face recognition door system"""
     
     def __init__(self, db_path="door_system.db"):
         self.db_path = db_path
+        # One long-lived connection per thread (and per process, for forked workers)
+        self._local = threading.local()
         self.init_database()
     
+    def _connection(self):
+        """Return this thread's connection, opening and configuring it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # sqlite3 caches prepared statements per connection, so repeated
+            # queries are only parsed once for the lifetime of the thread
+            conn = sqlite3.connect(self.db_path, timeout=5.0, cached_statements=256)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def close(self):
+        """Close the calling thread's connection (it is reopened on next use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    def vacuum(self):
+        """Rebuild the database file so space freed by deleted rows is returned to the disk"""
+        conn = self._connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
         # Create users table
@@ -37,12 +177,48 @@ class DatabaseManager:
             )
         ''')
         
+        # Create gallery_changes table (generation counter for live gallery reloads)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                gallery_version INTEGER NOT NULL,
+                operation TEXT NOT NULL,
+                person_name TEXT NOT NULL
+            )
+        ''')
+        
         conn.commit()
-        conn.close()
+        self.migrate()
+    
+    def schema_version(self):
+        """Number of the last applied migration"""
+        return self._connection().execute("PRAGMA user_version").fetchone()[0]
+    
+    def migrate(self):
+        """Apply pending MIGRATIONS, each in its own transaction"""
+        conn = self._connection()
+        for version, description, statements in MIGRATIONS:
+            if self.schema_version() >= version:
+                continue
+            # IMMEDIATE takes the write lock first, so only one process applies a migration
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                print(f"[DB] Applying migration {version}: {description}")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
     
     def add_user(self, name):
         """Add a new user to the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
         try:
@@ -54,85 +230,433 @@ class DatabaseManager:
             return True
         except sqlite3.IntegrityError:
             # User already exists
+            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def delete_user(self, name):
         """Delete a user from the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
-        cursor.execute("DELETE FROM users WHERE name = ?", (name,))
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor.execute("DELETE FROM users WHERE name = ?", (name,))
         return cursor.rowcount > 0
     
     def get_all_users(self):
         """Retrieve all users from the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id, name, created_at, last_seen, access_count FROM users ORDER BY name")
         users = cursor.fetchall()
         
-        conn.close()
         return users
     
+    def save_enrollments(self, enrollments):
+        """
+        Insert or update users from (name, trained, encoding_version, image_paths)
+        tuples in one transaction; access statistics are kept
+        """
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            cursor.executemany(
+                """INSERT INTO users (name, trained, encoding_version, image_paths) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (name) DO UPDATE SET
+                       trained = excluded.trained, encoding_version = excluded.encoding_version,
+                       image_paths = excluded.image_paths""",
+                [(name, int(trained), encoding_version, json.dumps(list(image_paths or [])))
+                 for name, trained, encoding_version, image_paths in enrollments]
+            )
+    
+    def save_enrollment(self, name, encoding_version, image_paths=()):
+        """Record that a user's encoding was written to gallery version `encoding_version`"""
+        self.save_enrollments([(name, True, encoding_version, image_paths)])
+    
+    def get_user_registry(self, names=None):
+        """
+        Users (all, or only `names`) with their enrollment state, by name: (name,
+        trained, encoding_version, image_paths, created_at, last_seen, access_count)
+        """
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        query = "SELECT name, trained, encoding_version, image_paths, created_at, last_seen, access_count FROM users"
+        if names is None:
+            rows = cursor.execute(query + " ORDER BY name").fetchall()
+        else:
+            names = list(names)
+            rows = []
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                rows.extend(cursor.execute(query + f" WHERE name IN ({','.join('?' * len(chunk))})", chunk))
+            rows.sort()
+        users = [(name, bool(trained), version, json.loads(paths) if paths else [], created_at, last_seen, count)
+                 for name, trained, version, paths, created_at, last_seen, count in rows]
+        
+        return users
+    
+    def get_user_generation(self):
+        """Id of the latest change to the users table (0 if none)"""
+        conn = self._connection()
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM user_changes").fetchone()[0]
+    
+    def get_user_changes(self, since_id):
+        """
+        Names of users inserted, updated or deleted after change `since_id`, or
+        None if some of those changes were already pruned
+        """
+        conn = self._connection()
+        oldest = conn.execute("SELECT MIN(id) FROM user_changes").fetchone()[0]
+        if oldest is not None and since_id < oldest - 1:
+            return None
+        cursor = conn.execute("SELECT DISTINCT person_name FROM user_changes WHERE id > ?", (since_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def prune_user_changes(self, before_id):
+        """
+        Delete the user changes older than `before_id`; the newest row is always
+        kept so get_user_generation() never goes back
+        """
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM user_changes WHERE id < MIN(?, (SELECT MAX(id) FROM user_changes))", (before_id,))
+        return cursor.rowcount
+
+    def get_user_access(self, names):
+        """{name: (last_seen, access_count)} of the given users, read fresh from the users table"""
+        conn = self._connection()
+        names = list(names)
+        access = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            access.update((name, (last_seen, count)) for name, last_seen, count in conn.execute(
+                f"SELECT name, last_seen, access_count FROM users WHERE name IN ({','.join('?' * len(chunk))})",
+                chunk))
+        return access
+    
     def get_user(self, name):
         """Retrieve a specific user from the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT id, name, created_at, last_seen, access_count FROM users WHERE name = ?", (name,))
         user = cursor.fetchone()
         
-        conn.close()
         return user
     
     def update_user_access(self, name):
         """Update user's last seen time and increment access count"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            cursor.execute(
+                "UPDATE users SET last_seen = ?, access_count = access_count + 1 WHERE name = ?",
+                (datetime.now(), name)
+            )
+    
+    def log_access_event(self, event_type, person_name=None, details=None, timestamp=None):
+        """Log an access event to the database (timestamp: time.time() of the event, default now)"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            if timestamp is None:
+                cursor.execute(
+                    "INSERT INTO access_logs (event_type, person_name, details) VALUES (?, ?, ?)",
+                    (event_type, person_name, details)
+                )
+            else:
+                cursor.execute(
+                    "INSERT INTO access_logs (timestamp, event_type, person_name, details) VALUES (?, ?, ?, ?)",
+                    (sql_timestamp(timestamp), event_type, person_name, details)
+                )
+    
+    def log_access_events(self, events, episodes=(), visitors=()):
+        """
+        Log a batch of (timestamp, event_type, person_name, details) events and
+        insert/update episodes (episode_key, person_name, camera, started_at,
+        last_seen, detections, best_distance, closed) and unknown visitors
+        (visitor_id, first_seen, last_seen, sightings, encoding) in one transaction
+        """
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            cursor.executemany(
+                "INSERT INTO access_logs (timestamp, event_type, person_name, details) VALUES (?, ?, ?, ?)",
+                [(sql_timestamp(timestamp), event_type, person_name, details)
+                 for timestamp, event_type, person_name, details in events]
+            )
+            cursor.executemany(
+                """INSERT INTO episodes (episode_key, person_name, camera, started_at, last_seen,
+                                         detections, best_distance, closed)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (episode_key) DO UPDATE SET
+                       last_seen = excluded.last_seen, detections = excluded.detections,
+                       best_distance = excluded.best_distance, closed = excluded.closed""",
+                [(key, person_name, camera, sql_timestamp(started_at), sql_timestamp(last_seen),
+                  detections, best_distance, int(closed))
+                 for key, person_name, camera, started_at, last_seen, detections, best_distance, closed
+                 in episodes]
+            )
+            cursor.executemany(
+                """INSERT INTO visitors (visitor_id, first_seen, last_seen, sightings, encoding)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (visitor_id) DO UPDATE SET
+                       last_seen = excluded.last_seen, sightings = excluded.sightings""",
+                [(visitor_id, sql_timestamp(first_seen), sql_timestamp(last_seen), sightings, encoding)
+                 for visitor_id, first_seen, last_seen, sightings, encoding in visitors]
+            )
+    
+    def record_capture(self, captured_at, camera, crop_path, thumb_path, box, encoding=None):
+        """Record one saved unknown-face capture (box as (top, right, bottom, left), encoding as bytes)"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            cursor.execute(
+                "INSERT INTO captures (captured_at, camera, crop_path, thumb_path, box, encoding) VALUES (?, ?, ?, ?, ?, ?)",
+                (sql_timestamp(captured_at), camera, crop_path, thumb_path,
+                 ",".join(str(int(v)) for v in box) if box is not None else None, encoding)
+            )
+        return cursor.lastrowid
+    
+    def delete_captures(self, paths):
+        """Delete the capture records whose crop or thumbnail file was removed"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            paths = list(paths)
+            cursor.executemany("DELETE FROM captures WHERE crop_path = ? OR thumb_path = ?",
+                               [(path, path) for path in paths])
+    
+    def get_captures(self, limit=50):
+        """Retrieve recent captures (without encodings), newest first"""
+        conn = self._connection()
         cursor = conn.cursor()
         
         cursor.execute(
-            "UPDATE users SET last_seen = ?, access_count = access_count + 1 WHERE name = ?",
-            (datetime.now(), name)
+            "SELECT id, captured_at, camera, crop_path, thumb_path, box FROM captures "
+            "ORDER BY captured_at DESC, id DESC LIMIT ?",
+            (limit,)
         )
+        captures = cursor.fetchall()
         
-        conn.commit()
-        conn.close()
+        return captures
     
-    def log_access_event(self, event_type, person_name=None, details=None):
-        """Log an access event to the database"""
-        conn = sqlite3.connect(self.db_path)
+    def get_visitors(self, since=None, limit=512):
+        """
+        Remembered unknown visitors seen at or after `since` (epoch seconds), most
+        recent first, as (visitor_id, first_seen, last_seen, sightings, encoding)
+        with the times as epoch seconds
+        """
+        conn = self._connection()
         cursor = conn.cursor()
         
         cursor.execute(
-            "INSERT INTO access_logs (event_type, person_name, details) VALUES (?, ?, ?)",
-            (event_type, person_name, details)
+            "SELECT visitor_id, CAST(strftime('%s', first_seen) AS INTEGER), "
+            "CAST(strftime('%s', last_seen) AS INTEGER), sightings, encoding FROM visitors "
+            "WHERE last_seen >= ? ORDER BY last_seen DESC LIMIT ?",
+            (sql_timestamp(since or 0), limit)
         )
+        visitors = cursor.fetchall()
         
-        conn.commit()
-        conn.close()
+        return visitors
+    
+    def get_episodes(self, limit=50, person_name=None, open_only=False):
+        """Retrieve recent episodes, newest first"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        where, params = [], []
+        if person_name:
+            where.append("person_name = ?")
+            params.append(person_name)
+        if open_only:
+            where.append("closed = 0")
+        cursor.execute(
+            "SELECT id, person_name, camera, started_at, last_seen, detections, best_distance, closed "
+            "FROM episodes" + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY started_at DESC, id DESC LIMIT ?",
+            params + [limit]
+        )
+        episodes = cursor.fetchall()
+        
+        return episodes
     
     def get_recent_access_logs(self, limit=50):
         """Retrieve recent access logs"""
-        conn = sqlite3.connect(self.db_path)
+        return self.query_access_logs(limit)
+    
+    def query_access_logs(self, limit=50, before=None, after=None, event_type=None, person_name=None,
+                          since=None, until=None, since_id=None):
+        """
+        Retrieve one page of access logs, newest first.
+        
+        before/after are (timestamp, id) cursors taken from the last/first row of
+        a previous page and return the older/newer rows next to it; since/until
+        bound the timestamp (UTC, 'YYYY-MM-DD[ HH:MM:SS]', until is exclusive).
+        since_id returns the rows written after that id instead, oldest first.
+        """
+        conn = self._connection()
         cursor = conn.cursor()
         
+        where, params = [], []
+        if event_type:
+            where.append("event_type = ?")
+            params.append(event_type)
+        if person_name:
+            where.append("person_name = ?")
+            params.append(person_name)
+        if since:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            where.append("timestamp < ?")
+            params.append(until)
+        # Keyset pagination: seek past the cursor in the index instead of OFFSET-scanning
+        if before:
+            where.append("(timestamp, id) < (?, ?)")
+            params.extend(before)
+        if after:
+            where.append("(timestamp, id) > (?, ?)")
+            params.extend(after)
+        if since_id is not None:
+            # Ids grow in write order, so this is exact even for late-written events
+            where.append("id > ?")
+            params.append(since_id)
+            sort = "id ASC"
+        else:
+            order = "ASC" if after and not before else "DESC"
+            sort = f"timestamp {order}, id {order}"
+        
         cursor.execute(
-            "SELECT id, timestamp, event_type, person_name, details FROM access_logs ORDER BY timestamp DESC LIMIT ?",
-            (limit,)
+            "SELECT id, timestamp, event_type, person_name, details FROM access_logs"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY {sort} LIMIT ?",
+            params + [limit]
         )
         logs = cursor.fetchall()
         
-        conn.close()
+        if since_id is None and after and not before:
+            logs.reverse()
         return logs
     
+    def get_archivable_months(self, cutoff):
+        """[(month 'YYYY-MM', rows)] of access_logs older than `cutoff` (UTC timestamp), oldest first"""
+        conn = self._connection()
+        return conn.execute(
+            "SELECT substr(timestamp, 1, 7) AS month, COUNT(*) FROM access_logs WHERE timestamp < ? "
+            "GROUP BY month ORDER BY month",
+            (cutoff,)
+        ).fetchall()
+    
+    def get_access_logs_between(self, since, until):
+        """All access_logs rows with since <= timestamp < until, in id order"""
+        conn = self._connection()
+        return conn.execute(
+            "SELECT id, timestamp, event_type, person_name, details FROM access_logs "
+            "WHERE timestamp >= ? AND timestamp < ? ORDER BY id",
+            (since, until)
+        ).fetchall()
+    
+    def delete_access_logs_between(self, since, until, max_id, chunk_size=5000):
+        """
+        Delete the rows with since <= timestamp < until and id <= max_id (those
+        read by get_access_logs_between; rows logged later have higher ids),
+        `chunk_size` per transaction so the door process is never kept waiting
+        for long; returns the number deleted
+        """
+        conn = self._connection()
+        deleted = 0
+        while True:
+            with conn:
+                cursor = conn.execute(
+                    "DELETE FROM access_logs WHERE id IN (SELECT id FROM access_logs "
+                    "WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?)",
+                    (since, until, max_id, chunk_size)
+                )
+            deleted += cursor.rowcount
+            if cursor.rowcount < chunk_size:
+                return deleted
+    
+    def record_log_archive(self, month, path, rows, first_timestamp, last_timestamp, size):
+        """Insert or update the entry of one monthly archive file"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """INSERT INTO log_archives (month, path, rows, first_timestamp, last_timestamp, bytes)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (month) DO UPDATE SET
+                       path = excluded.path, rows = excluded.rows, first_timestamp = excluded.first_timestamp,
+                       last_timestamp = excluded.last_timestamp, bytes = excluded.bytes,
+                       archived_at = CURRENT_TIMESTAMP""",
+                (month, path, rows, first_timestamp, last_timestamp, size)
+            )
+    
+    def get_log_archives(self):
+        """(month, path, rows, first_timestamp, last_timestamp, bytes, archived_at) of every archive, oldest first"""
+        conn = self._connection()
+        return conn.execute(
+            "SELECT month, path, rows, first_timestamp, last_timestamp, bytes, archived_at "
+            "FROM log_archives ORDER BY month"
+        ).fetchall()
+    
+    def get_archive_generation(self):
+        """Number of rows archived so far; changes whenever rows move out of access_logs"""
+        conn = self._connection()
+        return conn.execute("SELECT COALESCE(SUM(rows), 0) FROM log_archives").fetchone()[0]
+    
+    def get_import_mark(self, source):
+        """(position, rows, fingerprint) of the log file `source` imported so far, or None"""
+        conn = self._connection()
+        return conn.execute("SELECT position, rows, fingerprint FROM import_marks WHERE source = ?",
+                            (source,)).fetchone()
+    
+    def import_access_logs(self, source, events, position, rows, fingerprint=None):
+        """
+        Insert (local_time, event_type, person_name, details) events read from the
+        log file `source` and move its mark to `position`/`rows` in one transaction,
+        so an interrupted import resumes exactly after the last committed chunk.
+        local_time is 'YYYY-MM-DD HH:MM:SS' in this machine's time zone, as
+        DoorLogger writes it; events whose time does not parse are dropped.
+        Returns the number of events inserted.
+        """
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            # SQLite converts local time to UTC itself, much faster than datetime per row
+            cursor.executemany(
+                """INSERT INTO access_logs (timestamp, event_type, person_name, details)
+                   SELECT timestamp, ?, ?, ? FROM (SELECT datetime(?, 'utc') AS timestamp)
+                   WHERE timestamp IS NOT NULL""",
+                [(event_type, person_name, details, local_time)
+                 for local_time, event_type, person_name, details in events]
+            )
+            inserted = max(cursor.rowcount, 0)
+            cursor.execute(
+                """INSERT INTO import_marks (source, position, rows, fingerprint) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (source) DO UPDATE SET
+                       position = excluded.position, rows = excluded.rows,
+                       fingerprint = excluded.fingerprint, updated_at = CURRENT_TIMESTAMP""",
+                (source, position, rows + inserted, fingerprint)
+            )
+        return inserted
+    
+    def get_latest_log_id(self):
+        """Id of the newest access_logs row (0 if empty); changes whenever an event is logged"""
+        conn = self._connection()
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM access_logs").fetchone()[0]
+    
     def get_user_access_logs(self, person_name):
         """Retrieve access logs for a specific user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -141,9 +665,43 @@ class DatabaseManager:
         )
         logs = cursor.fetchall()
         
-        conn.close()
         return logs
 
+    def record_gallery_changes(self, gallery_version, added=(), removed=()):
+        """Record names added/replaced and removed by one gallery write"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        with conn:
+            cursor.executemany(
+                "INSERT INTO gallery_changes (gallery_version, operation, person_name) VALUES (?, ?, ?)",
+                [(gallery_version, 'put', name) for name in added] +
+                [(gallery_version, 'remove', name) for name in removed]
+            )
+    
+    def get_gallery_generation(self):
+        """Id of the latest gallery change (0 if there are none)"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM gallery_changes")
+        generation = cursor.fetchone()[0]
+        
+        return generation
+    
+    def get_gallery_changes(self, since_id):
+        """Retrieve gallery changes newer than since_id, oldest first"""
+        conn = self._connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "SELECT id, gallery_version, operation, person_name FROM gallery_changes WHERE id > ? ORDER BY id",
+            (since_id,)
+        )
+        changes = cursor.fetchall()
+        
+        return changes
+
 # Global database instance
 db_manager = DatabaseManager()
 
@@ -0,0 +1,245 @@
+"""
+Persistent cache of face encodings keyed by image content.
+
+Enrolling re-encoded every image from scratch: register.py re-encodes all
+<name>_*.jpg of a user to re-average them, and a bulk enrollment that is run
+again re-encodes the whole export. Detection and encoding take a large part
+of a second per image, so EncodingCache keeps the detected boxes and
+encodings of every image it has seen in a small SQLite file next to the
+gallery. The key is a hash of the image bytes plus the detection and encoding
+parameters. Changing a parameter misses the cache instead of returning
+encodings made differently. Only new or modified images are encoded.
+
+The cache is bounded by entry count and size. Once it goes over either limit
+it drops the least recently used entries. Hit and miss counts are kept per
+process and in the file. Each process opens its own connection, so the cache
+can be shared by the dashboard, its encoding workers and bulk_enroll.py.
+
+    python encoding_cache.py stats
+    python encoding_cache.py clear
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+
+import numpy as np
+
+CACHE_FILE = 'encoding_cache.db'
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS encodings (
+        key TEXT PRIMARY KEY,
+        boxes TEXT NOT NULL,
+        encodings BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_encodings_last_used ON encodings (last_used)",
+    """CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""",
+    "INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)",
+)
+
+
+def image_hash(image_bytes):
+    return hashlib.blake2b(image_bytes, digest_size=20).hexdigest()
+
+
+class EncodingCache:
+    """Boxes and encodings of images, looked up by content hash and parameters"""
+    def __init__(self, path, max_entries=100000, max_mb=256, model='hog', upsample=1,
+                 num_jitters=1, encoding_model='small', prune_every=200):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.model = model  # face detector, 'hog' or 'cnn'
+        self.upsample = upsample
+        self.num_jitters = num_jitters
+        self.encoding_model = encoding_model  # landmark model, 'small' or 'large'
+        self.params = f"{model}/{upsample}/{num_jitters}/{encoding_model}"
+        self.prune_every = prune_every  # stores between checks of the size limits
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.stores = 0
+        self.conn = None
+        self.pid = None
+
+    def _connection(self):
+        # Not shared with a parent process after a fork
+        if self.conn is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self.conn, self.pid = conn, os.getpid()
+        return self.conn
+
+    def key(self, image_bytes):
+        return f"{image_hash(image_bytes)}:{self.params}"
+
+    def get(self, key):
+        """(boxes, encodings) for a key, or None"""
+        conn = self._connection()
+        # encode() carries on after a failed lookup or store, so a failure must not leave a transaction open
+        with conn:
+            row = conn.execute("SELECT boxes, encodings FROM encodings WHERE key = ?", (key,)).fetchone()
+            counter = 'misses' if row is None else 'hits'
+            if row is not None:
+                conn.execute("UPDATE encodings SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (counter,))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        boxes = [tuple(box) for box in json.loads(row[0])]
+        encodings = list(np.frombuffer(row[1], dtype=np.float64).reshape(-1, 128)) if boxes else []
+        return boxes, encodings
+
+    def put(self, key, boxes, encodings):
+        blob = np.asarray(encodings, dtype=np.float64).reshape(-1, 128).tobytes()
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO encodings (key, boxes, encodings, size, created_at, last_used) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, json.dumps([list(box) for box in boxes]), blob, len(blob) + len(key), now, now))
+        self.stores += 1
+        if self.stores % self.prune_every == 0:
+            self.prune()
+
+    def encode(self, image_bytes):
+        """
+        Boxes and encodings of every face in an image (as face_recognition
+        returns them), from the cache or computed and stored
+        """
+        key = self.key(image_bytes)
+        try:
+            cached = self.get(key)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"[ENCCACHE] Lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        import face_recognition
+        from PIL import Image
+        image = np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+        boxes = face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model=self.model)
+        encodings = face_recognition.face_encodings(image, boxes, num_jitters=self.num_jitters,
+                                                    model=self.encoding_model) if boxes else []
+        try:
+            self.put(key, boxes, encodings)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"[ENCCACHE] Could not store encodings: {e}")
+        return boxes, list(encodings)
+
+    def encode_file(self, path):
+        with open(path, 'rb') as f:
+            return self.encode(f.read())
+
+    def prune(self):
+        """Drop least recently used entries until both limits hold again; returns how many"""
+        conn = self._connection()
+        count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM encodings").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return 0
+        # Down to 90% of the limits, so pruning is not repeated on every store
+        keep_count = int(self.max_entries * 0.9)
+        keep_bytes = int(self.max_bytes * 0.9)
+        removed = 0
+        with conn:
+            for key, entry_size in conn.execute("SELECT key, size FROM encodings ORDER BY last_used").fetchall():
+                if count <= keep_count and size <= keep_bytes:
+                    break
+                conn.execute("DELETE FROM encodings WHERE key = ?", (key,))
+                count -= 1
+                size -= entry_size
+                removed += 1
+        print(f"[ENCCACHE] Pruned {removed} entries ({count} left)")
+        return removed
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM encodings")
+            conn.execute("UPDATE counters SET value = 0")
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def status(self):
+        """Entries and size of the cache, with this process's and all-time hit/miss counts"""
+        conn = self._connection()
+        count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM encodings").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM counters"))
+        return {
+            'entries': count,
+            'size_mb': size / (1024 * 1024),
+            'max_entries': self.max_entries,
+            'max_mb': self.max_bytes / (1024 * 1024),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'total_hits': counters.get('hits', 0),
+            'total_misses': counters.get('misses', 0),
+        }
+
+    def close(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.conn.close()
+        self.conn = None
+
+
+def default_cache(directory='known_faces', **kwargs):
+    """The cache that lives next to the gallery in a known_faces directory"""
+    return EncodingCache(os.path.join(directory, CACHE_FILE), **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the face encoding cache")
+    parser.add_argument('command', choices=['stats', 'clear', 'prune'])
+    parser.add_argument('--dir', default='known_faces', help="known_faces directory")
+    parser.add_argument('--max-entries', type=int, default=100000, help="Entry limit used by prune")
+    parser.add_argument('--max-mb', type=float, default=256, help="Size limit in MB used by prune")
+    args = parser.parse_args()
+
+    cache = default_cache(args.dir, max_entries=args.max_entries, max_mb=args.max_mb)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.path}")
+    elif args.command == 'prune':
+        print(f"Removed {cache.prune()} entries")
+    if args.command != 'clear':
+        status = cache.status()
+        lookups = status['total_hits'] + status['total_misses']
+        print(f"{cache.path}: {status['entries']} images, {status['size_mb']:.1f} MB "
+              f"(limits {status['max_entries']} images, {status['max_mb']:.0f} MB)")
+        print(f"All-time hits {status['total_hits']}, misses {status['total_misses']}"
+              + (f" (hit rate {status['total_hits'] / lookups:.0%})" if lookups else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
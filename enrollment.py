@@ -0,0 +1,290 @@
+"""
+Background enrollment for registrations made through the web dashboard.
+
+Registering used to write the uploaded image into known_faces/, read it back
+with PIL and run face_recognition inside the Flask request, which held the
+request (and the development server) for seconds. The dashboard now decodes
+the image in memory and hands it to EnrollmentQueue, which returns a job at
+once. Encoding runs in a pool of worker processes, one per core, so several
+enrollments proceed in parallel. A committer thread takes finished encodings
+and writes them together: the gallery entries in one new gallery version,
+then the images (renamed into place), then the users rows. If any step
+fails, the steps already done are undone, so a failed enrollment leaves
+nothing behind. A pool whose worker died is replaced. Job status can be
+polled by id. Images the workers have encoded before are answered from the
+encoding cache.
+"""
+
+import io
+import os
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from encoding_cache import CACHE_FILE, EncodingCache
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+# --- Worker process side ---
+_cache = None
+
+
+def _init_worker(cache_path=None):
+    """Load the dlib models and open the encoding cache once per worker process"""
+    global face_recognition, _cache
+    import face_recognition
+    _cache = EncodingCache(cache_path) if cache_path else None
+
+
+def encode_image(image_bytes):
+    """
+    Decode an image from memory and encode every face in it (runs in a worker
+    process); returns (encodings, error message)
+    """
+    if _cache is not None:
+        try:
+            _, encodings = _cache.encode(image_bytes)
+        except OSError as e:
+            return None, f"Invalid image: {e}"
+        return [np.asarray(encoding) for encoding in encodings], None
+    from PIL import Image
+    import face_recognition
+    try:
+        image = np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+    except Exception as e:
+        return None, f"Invalid image: {e}"
+    return [np.asarray(encoding) for encoding in face_recognition.face_encodings(image)], None
+
+
+class EnrollmentJob:
+    """One registration on its way through the pool"""
+    def __init__(self, name, image_bytes):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.image_bytes = image_bytes
+        self.status = QUEUED
+        self.message = f"Encoding the face of {name}"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.encoding = None
+        self.attempts = 0
+
+    def finish(self, status, message):
+        self.status = status
+        self.message = message
+        self.finished_at = time.time()
+        self.image_bytes = None
+        self.encoding = None
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'message': self.message,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class EnrollmentQueue:
+    """Encodes registrations in a process pool and commits them in groups"""
+    def __init__(self, store, db, directory='known_faces', workers=None, max_pending=None,
+                 keep_finished=3600.0, cache_path=None):
+        self.store = store
+        self.db = db
+        self.directory = directory
+        self.cache_path = cache_path or os.path.join(directory, CACHE_FILE)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers  # more than this are refused as busy
+        self.keep_finished = keep_finished  # seconds a finished job can still be looked up
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.pending = {}  # name -> job, while queued, running or being committed
+        self.executor = None
+        self.committer = None
+        self.encoded = queue.Queue()
+        self.commits = 0
+        self.pool_restarts = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.cache_path,))
+
+    def start(self):
+        """Start the worker pool and the committer (done on first submit if not called)"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._new_executor()
+                self.committer = threading.Thread(target=self._commit_loop, daemon=True)
+                self.committer.start()
+
+    def _replace_executor(self, broken):
+        """Swap a pool whose worker died for a new one; every job of that pool fails, so only the first swaps"""
+        with self.lock:
+            if self.executor is not broken:
+                return
+            self.executor = self._new_executor()
+            self.pool_restarts += 1
+        print("[ENROLL] An encoding worker died; started a new worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job):
+        """Send a job to the pool, replacing the pool once if it turns out to be broken"""
+        job.attempts += 1
+        executor = self.executor
+        try:
+            future = executor.submit(encode_image, job.image_bytes)
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            executor = self.executor
+            future = executor.submit(encode_image, job.image_bytes)
+        future.add_done_callback(lambda f: self._encoded(job, f, executor))
+
+    def submit(self, name, image_bytes):
+        """Queue one registration; returns the job, or None if too many are pending"""
+        self.start()
+        with self.lock:
+            self._prune()
+            if name in self.pending:
+                raise ValueError(f"User {name} is already being registered")
+            if len(self.pending) >= self.max_pending:
+                return None
+            job = EnrollmentJob(name, image_bytes)
+            self.jobs[job.id] = job
+            self.pending[name] = job
+        try:
+            self._run(job)
+        except Exception as e:
+            self._done(job, FAILED, f"Could not start encoding: {e}")
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _encoded(self, job, future, executor):
+        try:
+            encodings, error = future.result()
+        except BrokenProcessPool as e:
+            self._replace_executor(executor)
+            # The job may only have shared the pool with the image that killed it: try once more
+            if job.attempts < 2:
+                try:
+                    self._run(job)
+                    return
+                except Exception as retry_error:
+                    e = retry_error
+            encodings, error = None, f"Encoding failed: {e}"
+        except Exception as e:
+            encodings, error = None, f"Encoding failed: {e}"
+        if error or not encodings:
+            self._done(job, FAILED, error or "Failed to generate face encoding. Please ensure a "
+                                             "clear face image with good lighting.")
+            return
+        if len(encodings) > 1:
+            print(f"Warning: Multiple faces found in the image for {job.name}. Using the first one.")
+        job.encoding = encodings[0]
+        job.status = RUNNING
+        job.message = f"Saving the registration of {job.name}"
+        self.encoded.put(job)
+
+    def _commit_loop(self):
+        while True:
+            jobs = [self.encoded.get()]
+            # Everything that finished meanwhile shares one gallery version
+            while True:
+                try:
+                    jobs.append(self.encoded.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.commit(jobs)
+            except Exception as e:
+                print(f"[ENROLL] Failed to commit {len(jobs)} registration(s): {e}")
+                for job in jobs:
+                    self._done(job, FAILED, f"Failed to save registration: {e}")
+
+    def commit(self, jobs):
+        """Write images, gallery entries and users rows for encoded jobs, all or nothing per group"""
+        os.makedirs(self.directory, exist_ok=True)
+        staged = []
+        placed = []  # (path, backup of the file it replaced or None)
+        version = None
+        # Encodings replaced by this commit, restored if it fails
+        previous = {job.name: self.store.get(job.name) for job in jobs if job.name in self.store}
+        try:
+            for job in jobs:
+                path = os.path.join(self.directory, f"{job.name}_1.jpg")
+                # Hidden temporary name: not picked up as an image until it is renamed
+                temp = os.path.join(self.directory, f".{job.name}_1.jpg.{job.id}.tmp")
+                with open(temp, 'wb') as f:
+                    f.write(job.image_bytes)
+                staged.append((job, temp, path))
+            version = self.store.put_many({job.name: job.encoding for job in jobs})
+            for job, temp, path in staged:
+                backup = None
+                if os.path.exists(path):
+                    backup = os.path.join(self.directory, f".{job.name}_1.jpg.{job.id}.old")
+                    os.replace(path, backup)
+                placed.append((path, backup))
+                os.replace(temp, path)
+            self.db.save_enrollments([(job.name, True, version, [path]) for job, _, path in staged])
+        except Exception:
+            self._rollback(jobs, staged, placed, version, previous)
+            raise
+        for _, backup in placed:
+            if backup:
+                os.remove(backup)
+        self.commits += 1
+        print(f"[ENROLL] Registered {', '.join(job.name for job in jobs)} (gallery version {version})")
+        for job in jobs:
+            self._done(job, DONE, f"User {job.name} registered successfully with face capture.")
+
+    def _rollback(self, jobs, staged, placed, version, previous):
+        """Undo a failed commit: gallery entries first, so the door never matches a half-saved user"""
+        if version is not None:
+            try:
+                self.store.update(put=previous, remove=[job.name for job in jobs if job.name not in previous])
+            except Exception as e:
+                print(f"[ENROLL] Could not remove {len(jobs)} gallery entries after a failed commit: {e}")
+        for path, backup in placed:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                if backup:
+                    os.replace(backup, path)
+            except OSError as e:
+                print(f"[ENROLL] Could not restore {path}: {e}")
+        for _, temp, _ in staged:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def _done(self, job, status, message):
+        with self.lock:
+            job.finish(status, message)
+            if self.pending.get(job.name) is job:
+                del self.pending[job.name]
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [i for i, job in self.jobs.items()
+                       if job.finished_at and now - job.finished_at > self.keep_finished]:
+            del self.jobs[job_id]
+
+    def is_pending(self, name):
+        with self.lock:
+            return name in self.pending
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
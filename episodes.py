@@ -0,0 +1,146 @@
+"""
+Coalescing of repeated detections into episodes.
+
+A person standing in front of the door is recognised on every processed
+frame. Instead of logging each detection, an episode is opened the first time
+an identity (or an unknown face) shows up on a camera. While the person stays,
+it is only updated in memory with the detection count, last-seen time and best
+match distance, and it is closed once nothing has matched it for
+`quiet_period` seconds. Episode rows are written through the EventWriter when
+an episode opens, every `update_interval` seconds while it stays open, and
+when it closes.
+"""
+
+import os
+import time
+import threading
+import itertools
+
+import numpy as np
+
+UNKNOWN = "Unknown"
+
+
+class Episode:
+    """One continuous presence of an identity in front of one camera"""
+    def __init__(self, key, name, camera, started_at, distance=None, encoding=None):
+        self.key = key
+        self.name = name
+        self.camera = camera
+        self.started_at = started_at
+        self.last_seen = started_at
+        self.detections = 1
+        self.best_distance = distance
+        self.encoding = encoding  # unknown faces: the encoding that identifies the visitor
+        self.closed = False
+        self.last_written = 0.0
+
+    def record(self):
+        """Row for DatabaseManager.log_access_events"""
+        return (self.key, self.name, self.camera, self.started_at, self.last_seen,
+                self.detections, self.best_distance, self.closed)
+
+
+class EpisodeTracker:
+    """Opens, updates and closes episodes; shared by every camera's decision stage"""
+    def __init__(self, writer=None, quiet_period=10.0, update_interval=30.0, unknown_tolerance=0.6):
+        self.writer = writer  # EventWriter (or anything with put_episode); None keeps episodes in memory
+        self.quiet_period = quiet_period
+        self.update_interval = update_interval
+        self.unknown_tolerance = unknown_tolerance  # unknown faces closer than this are the same visitor
+        self.lock = threading.Lock()
+        self.open = {}  # (camera, name) -> Episode for known people, (camera, key) for unknowns
+        self.last_expired = 0.0
+        self.opened = 0
+        self.detections = 0
+        self._ids = itertools.count(1)
+        self._prefix = f"{os.getpid()}-{int(time.time())}"
+
+    def observe(self, name, distance=None, encoding=None, camera=None, seen_at=None):
+        """
+        Count one detection; returns True if it opened a new episode.
+
+        Known people are matched by name. Unknown faces are matched to an open
+        unknown episode on the same camera by encoding (a face whose encoding
+        was skipped by the tracker joins the most recent one).
+        """
+        seen_at = seen_at or time.time()
+        with self.lock:
+            self.detections += 1
+            episode = self._find(name, encoding, camera)
+            if episode is not None:
+                episode.last_seen = max(episode.last_seen, seen_at)
+                episode.detections += 1
+                if distance is not None and (episode.best_distance is None or
+                                             self._better(name, distance, episode.best_distance)):
+                    episode.best_distance = distance
+                if seen_at - episode.last_written >= self.update_interval:
+                    self._write(episode)
+                return False
+
+            key = f"{self._prefix}-{next(self._ids)}"
+            episode = Episode(key, name, camera, seen_at, distance,
+                              encoding if name == UNKNOWN else None)
+            self.open[(camera, name if name != UNKNOWN else key)] = episode
+            self.opened += 1
+            self._write(episode)
+            return True
+
+    def _better(self, name, distance, best):
+        # Known: the closest match is the most confident; unknown: the farthest from everyone
+        return distance < best if name != UNKNOWN else distance > best
+
+    def _find(self, name, encoding, camera):
+        if name != UNKNOWN:
+            return self.open.get((camera, name))
+        candidates = [e for e in self.open.values() if e.name == UNKNOWN and e.camera == camera]
+        if not candidates:
+            return None
+        if encoding is None:
+            return max(candidates, key=lambda e: e.last_seen)
+        known = [e for e in candidates if e.encoding is not None]
+        if not known:
+            return None
+        distances = np.linalg.norm(np.array([e.encoding for e in known]) - encoding, axis=1)
+        best = int(np.argmin(distances))
+        return known[best] if distances[best] < self.unknown_tolerance else None
+
+    def expire(self, now=None):
+        """Close episodes that have been quiet for `quiet_period`; cheap to call every frame"""
+        now = now or time.time()
+        if now - self.last_expired < 0.5:
+            return 0
+        with self.lock:
+            self.last_expired = now
+            quiet = [k for k, e in self.open.items() if now - e.last_seen >= self.quiet_period]
+            for k in quiet:
+                self._close(self.open.pop(k))
+            return len(quiet)
+
+    def close_all(self):
+        """Close every open episode (on shutdown)"""
+        with self.lock:
+            for episode in self.open.values():
+                self._close(episode)
+            self.open = {}
+
+    def _close(self, episode):
+        episode.closed = True
+        self._write(episode)
+        duration = episode.last_seen - episode.started_at
+        print(f"[EPISODE] {episode.name}" + (f" at {episode.camera}" if episode.camera else "") +
+              f": {episode.detections} detection(s) over {duration:.1f} s")
+
+    def _write(self, episode):
+        episode.last_written = episode.last_seen
+        if self.writer:
+            self.writer.put_episode(episode.record())
+
+    def status(self):
+        """Open episodes and how many detections each record stood for"""
+        with self.lock:
+            return {
+                'open_episodes': len(self.open),
+                'episodes': self.opened,
+                'detections_per_episode': self.detections / self.opened if self.opened else 0.0,
+            }
@@ -0,0 +1,134 @@
+"""
+Asynchronous, batched writer for door access events.
+
+DoorLogger used to append to door_access.log and insert + commit into SQLite
+inline in the frame loop, so every slow SD-card write showed up as
+recognition latency. Events are now put on a bounded queue with the time
+they happened, and a background thread writes whatever has accumulated as
+one batch: a single database transaction, then a single append to the CSV
+log. A failed transaction is rolled back and retried a few times; the CSV
+lines are only written once it has committed, so the two logs stay in step.
+Events that still fail are counted (`events_failed` in [STATS]).
+Episode records (see episodes.py) and unknown visitors (see visitors.py)
+travel through the same queue and are upserted in the same transaction.
+The CSV log is rotated (see log_rotation.py) between batches.
+"""
+
+import time
+import queue
+import threading
+from datetime import datetime
+
+
+class EventWriter(threading.Thread):
+    """Background group-commit writer for (timestamp, event, person, details) records"""
+    def __init__(self, log_file, db, max_queue=10000, batch_size=500, flush_interval=0.5, rotator=None,
+                 retries=3, retry_delay=0.5, stats=None):
+        super().__init__(daemon=True)
+        self.log_file = log_file
+        self.db = db
+        self.rotator = rotator  # LogRotator, asked before each append
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # longest an event waits for company before it is written
+        self.retries = retries  # further attempts at a failed database transaction
+        self.retry_delay = retry_delay  # doubled after every failed attempt
+        self.stats = stats
+        self.stop_event = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def put(self, timestamp, event, person=None, details=None):
+        """Queue one event; never blocks (events are dropped and counted if the queue is full)"""
+        return self._enqueue('event', (timestamp, event, person, details))
+
+    def put_episode(self, record):
+        """Queue an insert/update of one episode row (see Episode.record)"""
+        return self._enqueue('episode', record)
+
+    def put_visitor(self, record):
+        """Queue an insert/update of one remembered unknown visitor (see Visitor.record)"""
+        return self._enqueue('visitor', record)
+
+    def _enqueue(self, kind, record):
+        try:
+            self.queue.put_nowait((kind, record))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"[LOG] Event queue full, {self.dropped} event(s) dropped")
+            return False
+
+    def run(self):
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            # Let a burst of events gather so they share one write
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                if self.stats:
+                    self.stats.increment('events_failed', len(batch))
+                print(f"[LOG] ERROR: Failed to write {len(batch)} event(s), {self.failed} so far: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, batch):
+        """Write one batch: one database transaction, then (once it committed) one CSV append"""
+        events = [record for kind, record in batch if kind == 'event']
+        # Only the latest state of each episode in the batch needs writing
+        episodes = list({record[0]: record for kind, record in batch if kind == 'episode'}.values())
+        visitors = list({record[0]: record for kind, record in batch if kind == 'visitor'}.values())
+        for attempt in range(self.retries + 1):
+            try:
+                # A failed transaction is rolled back, so retrying cannot duplicate rows
+                self.db.log_access_events(events, episodes, visitors)
+                break
+            except Exception as e:
+                if attempt == self.retries or self.stop_event.wait(self.retry_delay * 2 ** attempt):
+                    raise
+                print(f"[LOG] Database write of {len(batch)} event(s) failed, retrying: {e}")
+        if events:
+            lines = []
+            for timestamp, event, person, details in events:
+                local = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+                lines.append(f"{local},{event},{person}\n")
+            data = ''.join(lines)
+            if self.rotator:
+                self.rotator.before_write(len(data.encode()))
+            with open(self.log_file, 'a') as f:
+                f.write(data)
+        self.written += len(batch)
+        self.batches += 1
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        if timeout is None:
+            self.queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self.queue.unfinished_tasks
+
+    def stop(self, timeout=10.0):
+        """Write out everything still queued and stop the thread"""
+        self.stop_event.set()
+        self.join(timeout)
+        if self.batches:
+            print(f"[LOG] Event writer stopped: {self.written} event(s) in {self.batches} batch(es), "
+                  f"{self.dropped} dropped, {self.failed} failed")
@@ -0,0 +1,149 @@
+"""
+Background capture of unknown-visitor evidence.
+
+Instead of writing every unknown person's full-resolution frame from the
+recognition loop, the decision stage hands a copy of the frame to an
+EvidenceWriter. A background thread saves a cropped face (with some margin)
+and a small, more strongly compressed context thumbnail, then records
+timestamp, camera, box and encoding in the `captures` table. The crop is the
+image attached to the alert e-mail. The capture directory is kept within an
+age and total-size limit by deleting the oldest images (and their rows).
+"""
+
+import os
+import time
+import queue
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+CAPTURE_DIR = 'captured_images'
+
+
+def crop_box(frame, box, margin=0.3):
+    """Face box (top, right, bottom, left) grown by `margin` of its size, clipped to the frame"""
+    top, right, bottom, left = box
+    dy = int((bottom - top) * margin)
+    dx = int((right - left) * margin)
+    height, width = frame.shape[:2]
+    return max(0, top - dy), min(width, right + dx), min(height, bottom + dy), max(0, left - dx)
+
+
+class EvidenceWriter(threading.Thread):
+    """Writes face crops, context thumbnails and capture records off the recognition thread"""
+    def __init__(self, db, directory=CAPTURE_DIR, crop_quality=90, thumb_quality=60, thumb_width=320,
+                 margin=0.3, max_bytes=500 * 1024 * 1024, max_age_days=30, max_queue=16, stats=None):
+        super().__init__(daemon=True)
+        self.db = db
+        self.directory = directory
+        self.crop_quality = crop_quality
+        self.thumb_quality = thumb_quality
+        self.thumb_width = thumb_width
+        self.margin = margin
+        self.max_bytes = max_bytes  # 0 disables the size limit
+        self.max_age = max_age_days * 86400  # 0 disables the age limit
+        self.stats = stats
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stop_event = threading.Event()
+        self.last_cleanup = 0.0
+        self.saved = 0
+        self.dropped = 0
+        self.removed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def capture(self, frame, box, encoding=None, camera=None, captured_at=None, on_saved=None):
+        """
+        Queue one capture; on_saved(crop_path) is called from the writer thread
+        once the files exist. The frame is copied, so the caller may draw on it.
+        """
+        try:
+            self.queue.put_nowait((frame.copy(), box, encoding, camera, captured_at or time.time(), on_saved))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print("[CAPTURE] Capture queue full, evidence dropped")
+            return False
+
+    def run(self):
+        self.cleanup()
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            try:
+                item = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.save(*item)
+            except Exception as e:
+                print(f"[CAPTURE] Failed to save evidence: {e}")
+            if time.time() - self.last_cleanup > 60:
+                self.cleanup()
+
+    def save(self, frame, box, encoding, camera, captured_at, on_saved=None):
+        """Write the crop and thumbnail, record them, then run the callback"""
+        start = time.perf_counter()
+        stamp = datetime.fromtimestamp(captured_at).strftime("%Y%m%d_%H%M%S")
+        millis = int(captured_at * 1000) % 1000
+        prefix = f"unknown_person_{camera}" if camera else "unknown_person"
+        base = os.path.join(self.directory, f"{prefix}_{stamp}_{millis:03d}")
+
+        top, right, bottom, left = crop_box(frame, box, self.margin)
+        crop_path = base + "_face.jpg"
+        cv2.imwrite(crop_path, frame[top:bottom, left:right], [cv2.IMWRITE_JPEG_QUALITY, self.crop_quality])
+
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.thumb_width / float(width))
+        thumb = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        thumb_path = base + "_context.jpg"
+        cv2.imwrite(thumb_path, thumb, [cv2.IMWRITE_JPEG_QUALITY, self.thumb_quality])
+
+        blob = np.asarray(encoding, dtype=np.float32).tobytes() if encoding is not None else None
+        self.db.record_capture(captured_at, camera, crop_path, thumb_path, box, blob)
+        self.saved += 1
+        if self.stats:
+            self.stats.record('capture_write', time.perf_counter() - start)
+        print(f"[CAPTURE] Face saved: {crop_path}")
+        if on_saved:
+            on_saved(crop_path)
+
+    def cleanup(self):
+        """Delete captures past the age limit, then the oldest ones until under the size limit"""
+        self.last_cleanup = time.time()
+        # A crop and its thumbnail are kept or deleted together
+        groups = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.jpg') and os.path.isfile(path):
+                stat = os.stat(path)
+                base = name
+                for suffix in ('_face.jpg', '_context.jpg'):
+                    if name.endswith(suffix):
+                        base = name[:-len(suffix)]
+                mtime, size, paths = groups.get(base, (0.0, 0, []))
+                groups[base] = (max(mtime, stat.st_mtime), size + stat.st_size, paths + [path])
+        captures = sorted(groups.values())
+        total = sum(size for _, size, _ in captures)
+        doomed = []
+        for mtime, size, paths in captures:
+            too_old = self.max_age and self.last_cleanup - mtime > self.max_age
+            too_big = self.max_bytes and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            doomed.extend(paths)
+            total -= size
+        for path in doomed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if doomed:
+            self.removed += len(doomed)
+            self.db.delete_captures(doomed)
+            print(f"[CAPTURE] Retention removed {len(doomed)} old image(s)")
+        return len(doomed)
+
+    def stop(self, timeout=5.0):
+        """Finish queued captures and stop"""
+        self.stop_event.set()
+        self.join(timeout)
@@ -0,0 +1,186 @@
+"""
+In-memory gallery of known face encodings for the face recognition door system.
+
+All encodings live in one contiguous float32 matrix with a parallel names
+array, so every face found in a frame is matched against every identity with
+a single matrix product instead of per-face compare_faces/face_distance calls.
+"""
+
+import threading
+
+import numpy as np
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+ENCODING_SIZE = 128
+
+
+def pairwise_distances(queries, matrix, sq_norms):
+    """Euclidean distances between every query row and every matrix row, as an (N, M) array"""
+    # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, computed for all pairs in one product
+    sq = (queries * queries).sum(axis=1)[:, None] + sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+    np.maximum(sq, 0.0, out=sq)
+    return np.sqrt(sq)
+
+
+def top_k(distances, candidates, names, k):
+    """Sort the k closest candidates of one query into [(name, distance), ...]"""
+    k = min(k, len(candidates))
+    if k == 0:
+        return []
+    if k < len(candidates):
+        nearest = np.argpartition(distances, k - 1)[:k]
+    else:
+        nearest = np.arange(len(candidates))
+    nearest = nearest[np.argsort(distances[nearest])]
+    return [(names[candidates[j]], float(distances[j])) for j in nearest]
+
+
+class FaceGallery:
+    """Known face encodings stored as one float32 matrix with a parallel names array"""
+    def __init__(self, encodings=None, names=None, tolerance=DEFAULT_TOLERANCE,
+                 dim=ENCODING_SIZE, capacity=64):
+        self.tolerance = tolerance
+        self.dim = dim
+        self.lock = threading.RLock()
+        self.version = 0  # Version of the on-disk gallery this was loaded from
+        self._size = 0
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._names = np.empty(capacity, dtype=object)
+        self._rows = {}  # name -> row index
+        if encodings is not None:
+            self.add_many(names, encodings)
+
+    @classmethod
+    def from_matrix(cls, names, matrix, **kwargs):
+        """Wrap an existing (e.g. memory-mapped) matrix; it is only copied on first modification"""
+        gallery = cls(dim=matrix.shape[1] if matrix.ndim == 2 else ENCODING_SIZE, **kwargs)
+        size = len(names)
+        with gallery.lock:
+            gallery._matrix = matrix
+            gallery._sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype(np.float32)
+            gallery._names = np.empty(size, dtype=object)
+            gallery._names[:] = names
+            gallery._rows = {name: row for row, name in enumerate(names)}
+            gallery._size = size
+        return gallery
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    @property
+    def names(self):
+        """Names of all identities, in row order"""
+        with self.lock:
+            return list(self._names[:self._size])
+
+    @property
+    def encodings(self):
+        """Read-only view of the encoding matrix (one row per identity)"""
+        with self.lock:
+            view = self._matrix[:self._size]
+            view.flags.writeable = False
+            return view
+
+    def _reserve(self, needed):
+        """Grow the backing arrays (doubling) so that `needed` rows fit"""
+        capacity = self._matrix.shape[0]
+        if needed <= capacity and self._matrix.flags.writeable:
+            return
+        # A read-only (memory-mapped) matrix is copied the first time it changes
+        capacity = max(capacity, 64)
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        names = np.empty(capacity, dtype=object)
+        names[:self._size] = self._names[:self._size]
+        self._matrix, self._sq_norms, self._names = matrix, sq_norms, names
+
+    def add(self, name, encoding):
+        """Add an identity, or replace its encoding in place if it already exists"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self.lock:
+            row = self._rows.get(name)
+            self._reserve(self._size + (1 if row is None else 0))
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._rows[name] = row
+                self._names[row] = name
+            self._matrix[row] = encoding
+            self._sq_norms[row] = float(encoding @ encoding)
+
+    def add_many(self, names, encodings):
+        """Add several identities at once"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        names = list(names)
+        with self.lock:
+            if len(set(names)) != len(names) or any(name in self._rows for name in names):
+                # Replacements need the per-identity path
+                for name, encoding in zip(names, encodings):
+                    self.add(name, encoding)
+                return
+            start, end = self._size, self._size + len(names)
+            self._reserve(end)
+            self._matrix[start:end] = encodings
+            self._sq_norms[start:end] = (encodings * encodings).sum(axis=1)
+            self._names[start:end] = names
+            self._rows.update(zip(names, range(start, end)))
+            self._size = end
+
+    def remove(self, name):
+        """Remove an identity by moving the last row into its slot; returns False if unknown"""
+        with self.lock:
+            row = self._rows.pop(name, None)
+            if row is None:
+                return False
+            self._reserve(self._size)
+            last = self._size - 1
+            if row != last:
+                moved = self._names[last]
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._names[row] = moved
+                self._rows[moved] = row
+            self._names[last] = None
+            self._size -= 1
+            return True
+
+    def get(self, name):
+        """Return a copy of an identity's encoding, or None"""
+        with self.lock:
+            row = self._rows.get(name)
+            return None if row is None else self._matrix[row].copy()
+
+    def distances(self, face_encodings):
+        """Euclidean distances of N query encodings to all M identities, as an (N, M) array"""
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            return pairwise_distances(queries, self._matrix[:self._size], self._sq_norms[:self._size])
+
+    def match(self, face_encodings, k=1):
+        """Top-k identities for each query encoding: a list of [(name, distance), ...] per face"""
+        if len(face_encodings) == 0:
+            return []
+        with self.lock:
+            names = self._names[:self._size].copy()
+            distances = self.distances(face_encodings)
+        candidates = np.arange(len(names))
+        return [top_k(row, candidates, names, k) for row in distances]
+
+    def identify(self, face_encodings, unknown="Unknown"):
+        """Best match per face as (name, distance); name is `unknown` beyond the tolerance"""
+        identified = []
+        for candidates in self.match(face_encodings, k=1):
+            if candidates and candidates[0][1] <= self.tolerance:
+                identified.append(candidates[0])
+            else:
+                identified.append((unknown, candidates[0][1] if candidates else None))
+        return identified
@@ -0,0 +1,264 @@
+"""
+Consolidated on-disk gallery of known face encodings.
+
+Instead of one `<name>_encoding.npy` per user, every encoding lives in a single
+versioned matrix file (`gallery_v<N>.npy`, float32, one row per user) next to
+a small JSON index holding the current version and the row-aligned names and
+ids. Readers open exactly two files and memory-map the matrix, so startup cost
+does not grow with the number of users and the pages are shared between the
+door process and the dashboard.
+
+Writers never modify a matrix in place: they write the next version under a
+new file name and then atomically replace the index, so a reader always sees
+a consistent matrix/index pair. The previous matrix is kept until the write
+after next, for readers that read the old index just before the switch. A
+reader that is slower than two writes re-reads the index and tries again.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, FaceGallery
+
+INDEX_FILE = 'gallery_index.json'
+LOCK_FILE = 'gallery.lock'
+FORMAT_VERSION = 1
+LEGACY_SUFFIX = '_encoding.npy'
+# Times load() re-reads the index when the matrix it names was already deleted
+LOAD_RETRIES = 5
+
+
+class GalleryStore:
+    """Reads and writes the consolidated gallery in a known_faces directory"""
+    def __init__(self, directory='known_faces', dim=ENCODING_SIZE, change_log=None):
+        self.directory = directory
+        self.dim = dim
+        # Anything with record_gallery_changes(version, added, removed), normally db_manager;
+        # running door processes use it to pick up changes without restarting
+        self.change_log = change_log
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+
+    def exists(self):
+        """True if a consolidated gallery has been written"""
+        return os.path.exists(self.index_path)
+
+    # --- Reading ---
+    def read_index(self):
+        """Return the parsed index (version, matrix file, entries), or an empty one"""
+        if not self.exists():
+            return {'format': FORMAT_VERSION, 'version': 0, 'dim': self.dim,
+                    'matrix': None, 'next_id': 1, 'entries': []}
+        with open(self.index_path, 'r') as f:
+            return json.load(f)
+
+    def version(self):
+        """Current gallery version (0 if nothing has been written yet)"""
+        return self.read_index()['version']
+
+    def names(self):
+        """Names of all users in the gallery, in row order"""
+        return [entry['name'] for entry in self.read_index()['entries']]
+
+    def __contains__(self, name):
+        return name in self.names()
+
+    def load(self, mmap=True):
+        """Return (index, matrix); the matrix is memory-mapped read-only by default"""
+        for attempt in range(LOAD_RETRIES):
+            index = self.read_index()
+            if not index['matrix'] or not index['entries']:
+                return index, np.zeros((0, self.dim), dtype=np.float32)
+            matrix_path = os.path.join(self.directory, index['matrix'])
+            try:
+                return index, np.load(matrix_path, mmap_mode='r' if mmap else None)
+            except FileNotFoundError:
+                # Writers replaced this version twice since the index was read
+                if attempt == LOAD_RETRIES - 1:
+                    raise
+                time.sleep(0.01)
+
+    def load_gallery(self, gallery_class=FaceGallery, **kwargs):
+        """Build a gallery that uses the memory-mapped matrix until it is first modified"""
+        index, matrix = self.load()
+        names = [entry['name'] for entry in index['entries']]
+        gallery = gallery_class.from_matrix(names, matrix, **kwargs)
+        gallery.version = index['version']
+        return gallery
+
+    def get(self, name):
+        """Return a copy of one user's encoding, or None"""
+        index, matrix = self.load()
+        for row, entry in enumerate(index['entries']):
+            if entry['name'] == name:
+                return np.array(matrix[row])
+        return None
+
+    # --- Writing ---
+    def _acquire_lock(self, timeout=10.0, stale_after=30.0):
+        """Take the writer lock file, breaking it if a crashed writer left it behind"""
+        os.makedirs(self.directory, exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > stale_after:
+                        os.remove(self.lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Gallery is locked by another writer ({self.lock_path})")
+                time.sleep(0.05)
+
+    def _release_lock(self):
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def _write(self, index, matrix):
+        """Write a new matrix version and switch the index to it atomically"""
+        previous = index.get('matrix')
+        index['version'] += 1
+        index['format'] = FORMAT_VERSION
+        index['dim'] = self.dim
+        index['matrix'] = f"gallery_v{index['version']}.npy"
+
+        matrix_path = os.path.join(self.directory, index['matrix'])
+        with open(matrix_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+
+        tmp_index = self.index_path + '.tmp'
+        with open(tmp_index, 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, self.index_path)
+
+        # The previous version stays for readers that have just read the old
+        # index. Older ones can still be mapped by running readers; on platforms
+        # that refuse to delete them they are retried on the next write
+        for path in glob.glob(os.path.join(self.directory, 'gallery_v*.npy')):
+            if os.path.basename(path) not in (index['matrix'], previous):
+                try:
+                    os.remove(path)
+                except OSError:
+                    print(f"[GALLERY] Could not remove old gallery file {path}")
+        return index['version']
+
+    def update(self, put=None, remove=()):
+        """Apply additions/replacements ({name: encoding}) and removals in one new version"""
+        put = put or {}
+        self._acquire_lock()
+        try:
+            index, matrix = self.load(mmap=False)
+            entries = index['entries']
+            matrix = np.array(matrix, dtype=np.float32).reshape(-1, self.dim)
+
+            removed = set(remove)
+            keep = [row for row, entry in enumerate(entries) if entry['name'] not in removed]
+            entries = [entries[row] for row in keep]
+            matrix = matrix[keep]
+            rows = {entry['name']: row for row, entry in enumerate(entries)}
+
+            new_rows = []
+            for name, encoding in put.items():
+                encoding = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+                if name in rows:
+                    matrix[rows[name]] = encoding
+                else:
+                    entries.append({'id': index['next_id'], 'name': name})
+                    index['next_id'] += 1
+                    new_rows.append(encoding)
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+
+            index['entries'] = entries
+            version = self._write(index, matrix)
+        finally:
+            self._release_lock()
+        if self.change_log is not None:
+            self.change_log.record_gallery_changes(version, list(put), [n for n in removed if n not in put])
+        return version
+
+    def put(self, name, encoding):
+        """Add or replace one user's encoding; returns the new version"""
+        return self.update(put={name: encoding})
+
+    def put_many(self, encodings):
+        """Add or replace several users ({name: encoding}) in one version"""
+        return self.update(put=encodings)
+
+    def remove(self, name):
+        """Remove one user; returns the new version (unchanged if the user was absent)"""
+        if name not in self:
+            return self.version()
+        return self.update(remove=[name])
+
+    # --- Legacy layout ---
+    def legacy_files(self):
+        """Per-user <name>_encoding.npy files from the old layout"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.endswith(LEGACY_SUFFIX))
+
+    def convert_legacy(self, remove_legacy=False):
+        """Import every <name>_encoding.npy into the consolidated gallery; returns the count"""
+        encodings = {}
+        for file in self.legacy_files():
+            name = file[:-len(LEGACY_SUFFIX)]
+            try:
+                encodings[name] = np.load(os.path.join(self.directory, file))
+            except Exception as e:
+                print(f"[GALLERY] Error loading legacy encoding {file}: {e}")
+        if encodings:
+            self.put_many(encodings)
+            print(f"[GALLERY] Converted {len(encodings)} legacy encoding file(s) into {self.index_path}")
+        if remove_legacy:
+            for name in encodings:
+                os.remove(os.path.join(self.directory, f"{name}{LEGACY_SUFFIX}"))
+        return len(encodings)
+
+    def ensure_converted(self):
+        """Convert the legacy layout the first time a consolidated gallery is needed"""
+        if not self.exists() and self.legacy_files():
+            self.convert_legacy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the consolidated face gallery")
+    parser.add_argument('command', choices=['convert', 'list'])
+    parser.add_argument('--dir', default='known_faces', help="known_faces directory")
+    parser.add_argument('--remove-legacy', action='store_true',
+                        help="Delete <name>_encoding.npy files after converting them")
+    args = parser.parse_args()
+
+    from database import db_manager
+    store = GalleryStore(args.dir, change_log=db_manager)
+    if args.command == 'convert':
+        count = store.convert_legacy(remove_legacy=args.remove_legacy)
+        print(f"Converted {count} user(s); gallery version {store.version()}")
+    else:
+        index = store.read_index()
+        print(f"Gallery version {index['version']} ({len(index['entries'])} users)")
+        for entry in index['entries']:
+            print(f"  {entry['id']:>6}  {entry['name']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
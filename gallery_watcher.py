@@ -0,0 +1,73 @@
+"""
+Live reloading of the known-face gallery in a running door process.
+
+Every gallery write (web registration, deletion, register.py, migrations)
+records the affected names in the `gallery_changes` table of door_system.db.
+GalleryWatcher polls that table's generation counter from a background
+thread and applies only the delta to the in-memory gallery, so new users are
+recognised and deleted users rejected without restarting main.py.
+"""
+
+import time
+import threading
+
+import numpy as np
+
+
+class GalleryWatcher(threading.Thread):
+    """Applies gallery additions and removals recorded in the database to a live gallery"""
+    def __init__(self, gallery, store, db, since_id=0, interval=2.0):
+        super().__init__(daemon=True)
+        self.gallery = gallery
+        self.store = store
+        self.db = db
+        self.last_change_id = since_id
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.reloads = 0
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[GALLERY] Reload failed, will retry: {e}")
+
+    def poll(self):
+        """Apply any changes newer than the last one seen; returns the number of names touched"""
+        # Cheap check first: one indexed MAX(id) lookup per poll
+        if self.db.get_gallery_generation() <= self.last_change_id:
+            return 0
+        changes = self.db.get_gallery_changes(self.last_change_id)
+        if not changes:
+            return 0
+
+        # Only the last operation per name matters
+        latest = {}
+        for change_id, version, operation, name in changes:
+            latest[name] = operation
+        last_change_id = changes[-1][0]
+
+        # The store is written before its changes are recorded, so it is at least this new
+        index, matrix = self.store.load()
+        rows = {entry['name']: row for row, entry in enumerate(index['entries'])}
+
+        added = removed = 0
+        start = time.perf_counter()
+        for name, operation in latest.items():
+            row = rows.get(name)
+            if operation == 'remove' or row is None:
+                removed += int(self.gallery.remove(name))
+            else:
+                self.gallery.add(name, np.array(matrix[row]))
+                added += 1
+        self.gallery.version = index['version']
+        self.last_change_id = last_change_id
+        self.reloads += 1
+
+        print(f"[GALLERY] Reloaded +{added} -{removed} in {1000 * (time.perf_counter() - start):.1f} ms "
+              f"(version {index['version']}, {len(self.gallery)} users)")
+        return len(latest)
+
+    def stop(self):
+        self.stop_event.set()
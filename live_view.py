@@ -0,0 +1,120 @@
+"""
+Live view of the door cameras for the web dashboard.
+
+main.py owns the cameras, so the dashboard cannot open them itself. Instead
+the door process runs a LivePublisher thread that JPEG-encodes the newest
+annotated frame of each camera into `live/<camera>.jpg`, at a capped rate and
+only while a viewer heartbeat file is fresh. The dashboard streams those files
+as MJPEG and touches the heartbeat while a client is connected, so each frame
+is encoded once no matter how many people watch and nothing is encoded when
+nobody does.
+"""
+
+import os
+import time
+import threading
+
+import cv2
+
+LIVE_DIR = 'live'
+# A camera counts as watched for this long after the last viewer heartbeat
+VIEWER_TIMEOUT = 3.0
+BOUNDARY = 'frame'
+
+
+def frame_path(directory, camera):
+    return os.path.join(directory, f"{camera}.jpg")
+
+
+def heartbeat_path(directory, camera):
+    return os.path.join(directory, f"{camera}.viewers")
+
+
+def has_viewers(directory, camera, timeout=VIEWER_TIMEOUT):
+    """True if a dashboard client has asked for this camera recently"""
+    try:
+        return time.time() - os.path.getmtime(heartbeat_path(directory, camera)) < timeout
+    except OSError:
+        return False
+
+
+def touch_heartbeat(directory, camera):
+    """Mark the camera as watched (called by the dashboard while streaming)"""
+    os.makedirs(directory, exist_ok=True)
+    path = heartbeat_path(directory, camera)
+    with open(path, 'a'):
+        pass
+    os.utime(path, None)
+
+
+class LivePublisher(threading.Thread):
+    """Encodes the newest frame of each watched camera to disk at most `fps` times a second"""
+    def __init__(self, directory=LIVE_DIR, fps=5.0, quality=70, draw=None, stats=None):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.interval = 1.0 / fps
+        self.quality = quality
+        self.draw = draw  # draw(frame, face_locations, face_names) for un-annotated frames
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.pending = {}  # camera -> (frame, face_locations, face_names)
+        self.stop_event = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def offer(self, camera, frame, face_locations=(), face_names=()):
+        """Hand over the newest frame; only a reference is kept, so this costs the caller nothing"""
+        with self.lock:
+            self.pending[camera] = (frame, face_locations, face_names)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for camera, (frame, face_locations, face_names) in pending.items():
+                if not has_viewers(self.directory, camera):
+                    continue
+                try:
+                    self.publish(camera, frame, face_locations, face_names)
+                except Exception as e:
+                    print(f"[LIVE] Failed to publish frame for {camera}: {e}")
+
+    def publish(self, camera, frame, face_locations=(), face_names=()):
+        """Annotate a copy of the frame and replace the camera's JPEG atomically"""
+        start = time.perf_counter()
+        if face_locations and self.draw:
+            frame = frame.copy()
+            self.draw(frame, face_locations, face_names)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        path = frame_path(self.directory, camera)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(jpeg.tobytes())
+        os.replace(tmp_path, path)
+        if self.stats:
+            self.stats.record('live_encode', time.perf_counter() - start)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def mjpeg_stream(camera, directory=LIVE_DIR, fps=5.0):
+    """Yield multipart/x-mixed-replace chunks for one camera until the client disconnects"""
+    interval = 1.0 / max(fps, 0.1)
+    last_mtime = None
+    while True:
+        touch_heartbeat(directory, camera)
+        path = frame_path(directory, camera)
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime != last_mtime:
+                with open(path, 'rb') as f:
+                    jpeg = f.read()
+                last_mtime = mtime
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+        except OSError:
+            # No frame yet: the door process starts publishing on the next heartbeat check
+            pass
+        time.sleep(interval)
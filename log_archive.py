@@ -0,0 +1,249 @@
+"""
+Tiered storage for access_logs: a small hot table plus monthly archives.
+
+access_logs grew without bound, which slowed every dashboard query that is
+not a plain index seek and filled the SD card. LogArchive.archive() moves
+rows older than `keep_days` into one gzip-compressed CSV file per (UTC)
+month in log_archive/, named access_logs_<YYYY-MM>.csv.gz, with the columns
+of access_logs. It then deletes those rows from the hot table in short
+transactions. Each file is
+written completely and renamed into place before any row is deleted, and a
+re-run merges by id. An interrupted run therefore never loses or duplicates
+a row. Archives are listed in the log_archives table.
+
+Archived rows stay queryable: query() takes the same filters and
+(timestamp, id) cursors as DatabaseManager.query_access_logs. It opens only
+the months that can contain matching rows and keeps the last few it read in
+memory. The dashboard asks for them with /logs?archive=1.
+
+    python log_archive.py archive --keep-days 90 --vacuum
+    python log_archive.py list
+"""
+
+import io
+import os
+import csv
+import sys
+import gzip
+import time
+import bisect
+import argparse
+import threading
+from collections import OrderedDict
+
+from database import sql_timestamp
+
+ARCHIVE_DIR = 'log_archive'
+COLUMNS = ['id', 'timestamp', 'event_type', 'person_name', 'details']
+
+
+def month_range(month):
+    """First timestamp of a 'YYYY-MM' month and of the month after it"""
+    year, number = int(month[:4]), int(month[5:7])
+    following = f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+    return f"{month}-01 00:00:00", f"{following}-01 00:00:00"
+
+
+def merge_pages(first, second, limit, newer=False):
+    """
+    Combine two newest-first pages of (id, timestamp, ...) rows into one of
+    `limit` rows; with newer=True (an `after` cursor) the rows closest to the
+    cursor, i.e. the oldest, are kept
+    """
+    rows = sorted(first + second, key=lambda row: (row[1], row[0]), reverse=True)
+    return rows[-limit:] if newer else rows[:limit]
+
+
+class LogArchive:
+    """Moves old access_logs rows into monthly compressed files and reads them back"""
+    def __init__(self, db, directory=ARCHIVE_DIR, cache_size=2):
+        self.db = db
+        self.directory = directory
+        self.cache_size = cache_size  # months kept decoded in memory
+        self.cache = OrderedDict()  # path -> (mtime, rows, keys)
+        self.lock = threading.Lock()
+        self.loads = 0
+
+    def path(self, month):
+        return os.path.join(self.directory, f"access_logs_{month}.csv.gz")
+
+    # --- Archiving ---
+    def archive(self, keep_days=90, now=None):
+        """Move rows older than `keep_days` days into their month's archive; returns how many"""
+        cutoff = sql_timestamp((now or time.time()) - keep_days * 86400)
+        os.makedirs(self.directory, exist_ok=True)
+        moved = 0
+        for month, _ in self.db.get_archivable_months(cutoff):
+            since, until = month_range(month)
+            until = min(until, cutoff)
+            rows = self.db.get_access_logs_between(since, until)
+            if not rows:
+                continue
+            path = self.path(month)
+            # Rows archived by an earlier (possibly interrupted) run stay, once
+            archived = self._read(path) if os.path.exists(path) else []
+            seen = {row[0] for row in archived}
+            combined = archived + [tuple(row) for row in rows if row[0] not in seen]
+            combined.sort(key=lambda row: (row[1], row[0]))
+            size = self._write(path, combined)
+            self.db.record_log_archive(month, path, len(combined), combined[0][1], combined[-1][1], size)
+            self.db.delete_access_logs_between(since, until, max(row[0] for row in rows))
+            moved += len(rows)
+            print(f"[ARCHIVE] {month}: moved {len(rows)} rows to {path} "
+                  f"({len(combined)} rows, {size / 1024:.0f} KB)")
+        return moved
+
+    def _write(self, path, rows):
+        temp = path + '.tmp'
+        with open(temp, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as compressed:
+                with io.TextIOWrapper(compressed, encoding='utf-8', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(COLUMNS)
+                    writer.writerows(rows)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp, path)
+        return os.path.getsize(path)
+
+    def _read(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            # Empty person/details were NULL
+            return [(int(log_id), timestamp, event_type, person_name or None, details or None)
+                    for log_id, timestamp, event_type, person_name, details in reader]
+
+    # --- Querying ---
+    def _load(self, path):
+        """Rows of one archive sorted by (timestamp, id), with their keys for bisect"""
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            cached = self.cache.get(path)
+            if cached is not None and cached[0] == mtime:
+                self.cache.move_to_end(path)
+                return cached[1], cached[2]
+        rows = self._read(path)
+        keys = [(row[1], row[0]) for row in rows]
+        with self.lock:
+            self.cache[path] = (mtime, rows, keys)
+            self.cache.move_to_end(path)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.loads += 1
+        return rows, keys
+
+    def query(self, limit=50, before=None, after=None, event_type=None, person_name=None,
+              since=None, until=None):
+        """
+        One page of archived access logs, newest first, with the same filters and
+        cursors as DatabaseManager.query_access_logs
+        """
+        newer = bool(after and not before)
+        partitions = []
+        for month, path, rows, first, last, size, archived_at in self.db.get_log_archives():
+            if not rows or not os.path.exists(path):
+                continue
+            if (since and last < since) or (until and first >= until):
+                continue
+            if (before and first > before[0]) or (after and last < after[0]):
+                continue
+            partitions.append(path)
+        if not newer:
+            partitions.reverse()
+
+        page = []
+        for path in partitions:
+            rows, keys = self._load(path)
+            # Bound by time and cursor with bisect, then filter the rest
+            low, high = 0, len(rows)
+            if since:
+                low = max(low, bisect.bisect_left(keys, (since, -1)))
+            if until:
+                high = min(high, bisect.bisect_left(keys, (until, -1)))
+            if after:
+                low = max(low, bisect.bisect_right(keys, (after[0], after[1])))
+            if before:
+                high = min(high, bisect.bisect_left(keys, (before[0], before[1])))
+            indices = range(low, high) if newer else range(high - 1, low - 1, -1)
+            for i in indices:
+                row = rows[i]
+                if event_type and row[2] != event_type:
+                    continue
+                if person_name and row[3] != person_name:
+                    continue
+                page.append(row)
+                if len(page) >= limit:
+                    break
+            # Months do not overlap, so later partitions cannot hold closer rows
+            if len(page) >= limit:
+                break
+        if newer:
+            page.reverse()
+        return page
+
+    def status(self):
+        archives = self.db.get_log_archives()
+        return {
+            'archives': len(archives),
+            'rows': sum(archive[2] for archive in archives),
+            'bytes': sum(archive[5] or 0 for archive in archives),
+            'cached': len(self.cache),
+            'loads': self.loads,
+        }
+
+
+class LogArchiver(threading.Thread):
+    """Runs the retention job in the door process: at start-up and then every `interval` seconds"""
+    def __init__(self, archive, keep_days=90, interval=86400.0):
+        super().__init__(daemon=True)
+        self.archive = archive
+        self.keep_days = keep_days
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.runs = 0
+
+    def run(self):
+        # Let start-up (camera, gallery) finish first
+        if self.stop_event.wait(60):
+            return
+        while not self.stop_event.is_set():
+            try:
+                moved = self.archive.archive(self.keep_days)
+                if moved:
+                    print(f"[ARCHIVE] Moved {moved} access log rows older than {self.keep_days} days")
+            except Exception as e:
+                print(f"[ARCHIVE] Archiving failed: {e}")
+            self.runs += 1
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old access logs into monthly compressed files")
+    parser.add_argument('command', choices=['archive', 'list'])
+    parser.add_argument('--keep-days', type=float, default=90, help="Days of logs kept in the hot table")
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help="Archive directory")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="Shrink the database file afterwards (locks it for a while)")
+    args = parser.parse_args()
+
+    from database import db_manager
+    archive = LogArchive(db_manager, args.dir)
+    if args.command == 'archive':
+        start = time.perf_counter()
+        moved = archive.archive(args.keep_days)
+        print(f"Archived {moved} rows in {time.perf_counter() - start:.1f}s")
+        if args.vacuum and moved:
+            before = os.path.getsize(db_manager.db_path)
+            db_manager.vacuum()
+            print(f"Database file {before / 1e6:.1f} MB -> {os.path.getsize(db_manager.db_path) / 1e6:.1f} MB")
+    for month, path, rows, first, last, size, archived_at in db_manager.get_log_archives():
+        print(f"  {month}  {rows:>9} rows  {(size or 0) / 1024:>8.0f} KB  {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
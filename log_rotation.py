@@ -0,0 +1,114 @@
+"""
+Size- and age-based rotation of the CSV access log.
+
+door_access.log used to grow forever. LogRotator is asked before every
+append and rotates the file once it is larger than `max_bytes` or its first
+entry is older than `max_age` seconds. The current file is renamed to
+door_access.log.<YYYYmmdd-HHMMSS-microseconds> (so names sort in rotation
+order) and a new file with the header is started.
+The renamed file is then gzip-compressed on a background thread, so the
+writer only pays for two renames. Only the newest `keep` rotated files are
+kept. migrate_data.py can still import a rotated .gz file.
+"""
+
+import os
+import glob
+import gzip
+import time
+import shutil
+import threading
+from datetime import datetime
+
+HEADER = "Timestamp,Event,Person\n"
+
+
+class LogRotator:
+    """Decides when the CSV log is rotated and compresses and prunes old ones"""
+    def __init__(self, log_file, max_bytes=10 * 1024 * 1024, max_age=30 * 86400, keep=12, compress=True):
+        self.log_file = log_file
+        self.max_bytes = max_bytes  # 0 for no size limit
+        self.max_age = max_age  # seconds, 0 for no age limit
+        self.keep = keep  # rotated files kept, 0 keeps all
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.rotations = 0
+        self.compressors = []
+        self.size = None
+        self.started_at = None
+
+    def _load(self):
+        """Size of the current file and the time of its first entry"""
+        self.size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        self.started_at = time.time()
+        try:
+            with open(self.log_file) as f:
+                f.readline()
+                first = f.readline()
+            self.started_at = datetime.strptime(first[:19], "%Y-%m-%d %H:%M:%S").timestamp()
+        except (OSError, ValueError):
+            pass
+
+    def before_write(self, nbytes):
+        """Rotate first if appending `nbytes` would go over a limit; call before every append"""
+        with self.lock:
+            if self.size is None:
+                self._load()
+            has_entries = self.size > len(HEADER)
+            too_big = self.max_bytes and self.size + nbytes > self.max_bytes
+            too_old = self.max_age and time.time() - self.started_at > self.max_age
+            if has_entries and (too_big or too_old):
+                self.rotate()
+            self.size += nbytes
+
+    def rotate(self):
+        """Rename the current log aside and start a new one; compression happens in the background"""
+        rotated = f"{self.log_file}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        if os.path.exists(self.log_file):
+            os.replace(self.log_file, rotated)
+        with open(self.log_file, 'w') as f:
+            f.write(HEADER)
+        self.size = len(HEADER)
+        self.started_at = time.time()
+        self.rotations += 1
+        print(f"[LOG] Rotated {self.log_file} to {rotated}")
+        if self.compress:
+            self.compressors = [thread for thread in self.compressors if thread.is_alive()]
+            compressor = threading.Thread(target=self._finish, args=(rotated,), daemon=True)
+            compressor.start()
+            self.compressors.append(compressor)
+        else:
+            self.prune()
+        return rotated
+
+    def _finish(self, path):
+        try:
+            with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+        except OSError as e:
+            print(f"[LOG] Could not compress {path}: {e}")
+        self.prune()
+
+    def rotated_files(self):
+        """Rotated logs, oldest first"""
+        files = [path for path in glob.glob(glob.escape(self.log_file) + '.*') if not path.endswith('.tmp')]
+        return sorted(files, key=lambda path: path[len(self.log_file) + 1:].replace('.gz', ''))
+
+    def prune(self):
+        if not self.keep:
+            return 0
+        files = self.rotated_files()
+        removed = 0
+        for path in files[:-self.keep]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def wait(self, timeout=30.0):
+        """Wait for background compression to finish (used on shutdown)"""
+        for compressor in list(self.compressors):
+            compressor.join(timeout)
@@ -0,0 +1,165 @@
+"""
+Push new access log events to connected dashboards (Server-Sent Events).
+
+Polling /logs re-queried the newest rows for every client on every poll.
+LogWatcher is the only thing that polls the database now: one thread reads
+the rows added since the last id it saw, at most every `interval` seconds,
+and only while someone is subscribed. It hands each new row to every
+subscriber's bounded queue. A client that reconnects with Last-Event-ID
+(done by browsers automatically) is first sent the rows it missed. A client
+too slow to keep up with its queue is caught up from the database instead of
+holding back the others.
+"""
+
+import json
+import time
+import queue
+import threading
+
+
+class Subscription:
+    """One connected client's queue of new rows"""
+    def __init__(self, max_backlog):
+        self.queue = queue.Queue(maxsize=max_backlog)
+        self.overflowed = False
+
+
+class LogWatcher(threading.Thread):
+    """Single shared poller of access_logs that fans new rows out to all subscribers"""
+    def __init__(self, db, format_rows=None, interval=0.5, batch_size=500, max_backlog=1000,
+                 keepalive=15.0):
+        super().__init__(daemon=True)
+        self.db = db
+        self.format_rows = format_rows or (lambda rows: rows)  # rows -> JSON-serialisable dicts
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backlog = max_backlog  # rows buffered per client before it is caught up from the DB
+        self.keepalive = keepalive  # seconds between comment lines that keep proxies from closing idle streams
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.subscribers = set()
+        self.last_id = None
+        self.polls = 0
+        self.delivered = 0
+
+    def ensure_started(self):
+        with self.lock:
+            if not self.is_alive() and not self.stop_event.is_set():
+                self.last_id = self.db.get_latest_log_id()
+                self.start()
+
+    def subscribe(self):
+        """Register a client; returns (subscription, id of the newest row it will not be sent)"""
+        self.ensure_started()
+        subscription = Subscription(self.max_backlog)
+        with self.lock:
+            self.subscribers.add(subscription)
+            self.wakeup.set()
+            return subscription, self.last_id
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            if not self.subscribers:
+                # Nobody listening: no polling until the next subscriber arrives
+                self.wakeup.wait(self.keepalive)
+                self.wakeup.clear()
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[LOGSTREAM] Poll failed: {e}")
+            self.stop_event.wait(self.interval)
+
+    def poll(self):
+        """Read the rows added since the last poll and queue them for every subscriber"""
+        self.polls += 1
+        rows = self.db.query_access_logs(self.batch_size, since_id=self.last_id)
+        if not rows:
+            return 0
+        with self.lock:
+            for subscription in self.subscribers:
+                if subscription.overflowed:
+                    continue
+                for row in rows:
+                    try:
+                        subscription.queue.put_nowait(row)
+                    except queue.Full:
+                        subscription.overflowed = True
+                        break
+            self.last_id = rows[-1][0]
+            self.delivered += len(rows) * len(self.subscribers)
+        return len(rows)
+
+    def catch_up(self, subscription, since_id):
+        """Rows after `since_id` that this subscriber missed (reconnect or overflow), read from the DB"""
+        with self.lock:
+            # Rows up to last_id are no longer coming through the queue
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.overflowed = False
+            until_id = self.last_id
+        rows = []
+        while since_id < until_id:
+            batch = [row for row in self.db.query_access_logs(self.batch_size, since_id=since_id)
+                     if row[0] <= until_id]
+            if not batch:
+                break
+            rows.extend(batch)
+            since_id = batch[-1][0]
+        return rows
+
+    def stream(self, last_event_id=None):
+        """Yield text/event-stream chunks for one client until it disconnects"""
+        subscription, newest = self.subscribe()
+        sent_id = newest
+        try:
+            yield f"retry: {int(self.interval * 4000)}\n\n"
+            if last_event_id is not None and last_event_id < newest:
+                rows = self.catch_up(subscription, last_event_id)
+                yield from self._events(rows)
+                sent_id = rows[-1][0] if rows else newest
+            last_sent = time.time()
+            while not self.stop_event.is_set():
+                if subscription.overflowed:
+                    rows = self.catch_up(subscription, sent_id)
+                else:
+                    rows = self._drain(subscription)
+                rows = [row for row in rows if row[0] > sent_id]
+                if rows:
+                    yield from self._events(rows)
+                    sent_id = rows[-1][0]
+                    last_sent = time.time()
+                elif time.time() - last_sent >= self.keepalive:
+                    yield ": keepalive\n\n"
+                    last_sent = time.time()
+        finally:
+            self.unsubscribe(subscription)
+
+    def _drain(self, subscription):
+        try:
+            rows = [subscription.queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                rows.append(subscription.queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _events(self, rows):
+        for row, entry in zip(rows, self.format_rows(rows)):
+            yield f"id: {row[0]}\nevent: access\ndata: {json.dumps(entry)}\n\n"
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+
+    def status(self):
+        with self.lock:
+            return {'subscribers': len(self.subscribers), 'polls': self.polls,
+                    'last_id': self.last_id, 'delivered': self.delivered}
@@ -0,0 +1,339 @@
+"""
+Background e-mail dispatcher for security alerts.
+
+Sending an alert used to connect, STARTTLS, log in, send and quit inline in
+the recognition loop, which blocked it for seconds. MailDispatcher takes
+alerts off the caller's thread instead. Each alert is written to an on-disk
+outbox (one JSON file per message) and sent over one authenticated SMTP
+connection that is kept open between messages. A failed message is retried
+with exponential backoff and survives a restart of the door system. Errors
+that retrying cannot fix (rejected login, refused recipient, other 5xx
+replies), and messages that failed `max_attempts` times, are moved to
+outbox/failed/ instead. Alerts
+that arrive within `digest_window` of the previous e-mail are merged into one
+digest instead of each becoming a separate e-mail.
+"""
+
+import os
+import json
+import time
+import queue
+import smtplib
+import threading
+import itertools
+from datetime import datetime
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+OUTBOX_DIR = 'outbox'
+FAILED_DIR = 'failed'  # inside the outbox
+# Most attachments put in one digest e-mail; further images are only listed
+MAX_DIGEST_ATTACHMENTS = 10
+
+
+def is_permanent(error):
+    """True for SMTP errors that retrying the same message cannot fix"""
+    if isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPNotSupportedError)):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def build_message(sender, recipient, subject, body, attachment_paths=()):
+    """MIME message with the given files attached (missing files are skipped)"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    for path in attachment_paths:
+        if not path or not os.path.exists(path):
+            continue
+        with open(path, "rb") as attachment:
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(attachment.read())
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(path)}')
+        msg.attach(part)
+    return msg
+
+
+class MailDispatcher(threading.Thread):
+    """Sends queued alerts from a durable outbox over a persistent SMTP connection"""
+    def __init__(self, smtp_server, smtp_port, sender, recipient, username=None, password=None,
+                 outbox_dir=OUTBOX_DIR, use_tls=True, digest_window=60.0, retry_base=5.0,
+                 retry_max=600.0, max_attempts=20, idle_timeout=120.0, connect_timeout=10.0, stats=None):
+        super().__init__(daemon=True)
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender = sender
+        self.recipient = recipient
+        self.username = username
+        self.password = password
+        self.outbox_dir = outbox_dir
+        self.use_tls = use_tls
+        self.digest_window = digest_window  # 0 sends every alert as its own e-mail
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts  # failed sends before a message is given up on
+        self.idle_timeout = idle_timeout  # close the connection after this long without sending
+        self.connect_timeout = connect_timeout
+        self.stats = stats
+        self.incoming = queue.Queue()
+        self.outbox = {}  # file name -> message dict
+        self.unsaved = set()  # outbox files that could not be written yet (sent from memory meanwhile)
+        self.connection = None
+        self.last_used = 0.0
+        self.last_sent_at = 0.0
+        self.stop_event = threading.Event()
+        self.sent = 0
+        self.failures = 0
+        self.given_up = 0
+        self._ids = itertools.count(1)
+        os.makedirs(outbox_dir, exist_ok=True)
+        self._load_outbox()
+
+    # --- Caller side ---
+    def submit(self, subject, body, attachment_path=None, digest=True):
+        """
+        Queue an alert; returns immediately (the outbox is written by the dispatcher
+        thread). Returns False if the dispatcher thread is no longer running.
+        """
+        if self.ident is not None and not self.is_alive() and not self.stop_event.is_set():
+            print(f"[EMAIL] Dispatcher is not running; alert not queued: {subject}")
+            return False
+        self.incoming.put({
+            'subject': subject,
+            'body': body,
+            'attachments': [attachment_path] if attachment_path else [],
+            'digest': digest,
+            'created_at': time.time(),
+            'attempts': 0,
+            'next_attempt': 0.0,
+        })
+        return True
+
+    # --- Outbox ---
+    def _load_outbox(self):
+        """Pick up messages a previous run could not send"""
+        for file in sorted(os.listdir(self.outbox_dir)):
+            if not file.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.outbox_dir, file), 'r') as f:
+                    message = json.load(f)
+                message['next_attempt'] = 0.0
+                self.outbox[file] = message
+            except (OSError, ValueError) as e:
+                print(f"[EMAIL] Skipping unreadable outbox file {file}: {e}")
+        if self.outbox:
+            print(f"[EMAIL] {len(self.outbox)} unsent message(s) found in {self.outbox_dir}")
+
+    def _save(self, file, message):
+        path = os.path.join(self.outbox_dir, file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(message, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def _accept_incoming(self):
+        while True:
+            try:
+                message = self.incoming.get_nowait()
+            except queue.Empty:
+                break
+            if message['digest'] and self.digest_window > 0:
+                # The first alert after a quiet spell goes out at once; later ones wait for the digest
+                message['next_attempt'] = self.last_sent_at + self.digest_window
+            file = f"{int(message['created_at'] * 1000)}-{os.getpid()}-{next(self._ids)}.json"
+            self.outbox[file] = message
+            self._persist(file)
+        # Retry the ones a full or read-only disk refused earlier
+        for file in list(self.unsaved):
+            self._persist(file)
+        self._publish()
+
+    def _persist(self, file):
+        """Write a message to the outbox; on failure it stays queued in memory and is written later"""
+        try:
+            self._save(file, self.outbox[file])
+            self.unsaved.discard(file)
+        except OSError as e:
+            if file not in self.unsaved:
+                print(f"[EMAIL] Could not write {file} to {self.outbox_dir}, keeping it in memory: {e}")
+            self.unsaved.add(file)
+
+    def _remove(self, files):
+        for file in files:
+            self.outbox.pop(file, None)
+            self.unsaved.discard(file)
+            try:
+                os.remove(os.path.join(self.outbox_dir, file))
+            except OSError:
+                pass
+        self._publish()
+
+    # --- SMTP connection ---
+    def _connect(self):
+        connection = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.connect_timeout)
+        connection.ehlo()
+        if self.use_tls and connection.has_extn('starttls'):
+            connection.starttls()
+            connection.ehlo()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def _send(self, msg):
+        """Send over the open connection, reconnecting once if the server dropped it"""
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.sendmail(self.sender, self.recipient, msg.as_string())
+                self.last_used = time.time()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                self.connection = None
+                if attempt:
+                    raise e
+
+    # --- Dispatch loop ---
+    def run(self):
+        while True:
+            stopping = self.stop_event.is_set()
+            try:
+                self._accept_incoming()
+                # On the way out, alerts held back for a digest are sent straight away
+                self._dispatch_due(release_held=stopping)
+            except Exception as e:
+                print(f"[EMAIL] Dispatch error: {e}")
+            if stopping:
+                break
+            if self.connection is not None and time.time() - self.last_used > self.idle_timeout:
+                self._disconnect()
+            self.stop_event.wait(0.2)
+        self._disconnect()
+
+    def _dispatch_due(self, release_held=False):
+        now = time.time()
+        due = sorted((f for f, m in self.outbox.items()
+                      if m['next_attempt'] <= now or (release_held and m['attempts'] == 0)),
+                     key=lambda f: self.outbox[f]['created_at'])
+        if not due:
+            return
+        digest = [f for f in due if self.outbox[f]['digest']]
+        single = [f for f in due if not self.outbox[f]['digest']]
+        batches = [[f] for f in single]
+        if len(digest) == 1 or (digest and self.digest_window <= 0):
+            batches.extend([f] for f in digest)
+        elif digest:
+            batches.append(digest)
+        for files in batches:
+            self._deliver(files)
+
+    def _deliver(self, files):
+        messages = [self.outbox[f] for f in files]
+        if len(messages) == 1:
+            message = messages[0]
+            msg = build_message(self.sender, self.recipient, message['subject'], message['body'],
+                                message['attachments'])
+        else:
+            msg = self._digest(messages)
+        start = time.perf_counter()
+        try:
+            self._send(msg)
+        except Exception as e:
+            self.failures += 1
+            self._disconnect()
+            permanent = is_permanent(e)
+            retry = []
+            for file, message in zip(files, messages):
+                message['attempts'] += 1
+                if permanent or message['attempts'] >= self.max_attempts:
+                    message['error'] = str(e)
+                    self._give_up(file, message)
+                    continue
+                delay = min(self.retry_max, self.retry_base * 2 ** (message['attempts'] - 1))
+                message['next_attempt'] = time.time() + delay
+                self._persist(file)
+                retry.append(file)
+            if retry:
+                print(f"[EMAIL] Failed to send {len(retry)} message(s), retrying in {delay:.1f} s: {e}")
+            if len(retry) < len(files):
+                print(f"[EMAIL] ERROR: Gave up on {len(files) - len(retry)} message(s), moved to "
+                      f"{os.path.join(self.outbox_dir, FAILED_DIR)}: {e}")
+            self._publish()
+            return
+        if self.stats:
+            self.stats.record('email_send', time.perf_counter() - start)
+        self.sent += len(files)
+        self.last_sent_at = time.time()
+        self._remove(files)
+        print(f"[EMAIL] Notification sent: {msg['Subject']}")
+
+    def _give_up(self, file, message):
+        """Move a message that cannot be sent out of the retry queue into outbox/failed/"""
+        failed_dir = os.path.join(self.outbox_dir, FAILED_DIR)
+        self.outbox.pop(file, None)
+        self.unsaved.discard(file)
+        self.given_up += 1
+        try:
+            os.makedirs(failed_dir, exist_ok=True)
+            self._save(file, message)
+            os.replace(os.path.join(self.outbox_dir, file), os.path.join(failed_dir, file))
+        except OSError as e:
+            print(f"[EMAIL] Could not move {file} to {failed_dir}: {e}")
+
+    def _digest(self, messages):
+        lines = [f"{len(messages)} security alerts:", ""]
+        attachments = []
+        for message in messages:
+            when = datetime.fromtimestamp(message['created_at']).strftime('%Y-%m-%d %H:%M:%S')
+            lines.append(f"- {when}: {message['subject']}")
+            for path in message['attachments']:
+                if len(attachments) < MAX_DIGEST_ATTACHMENTS:
+                    attachments.append(path)
+                else:
+                    lines.append(f"  (image not attached: {os.path.basename(path)})")
+        subject = f"Security Alert Digest - {len(messages)} alerts"
+        return build_message(self.sender, self.recipient, subject, "\n".join(lines), attachments)
+
+    def flush(self, timeout=10.0):
+        """Wait until nothing queued is due any more; returns the number of messages still in the outbox"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.incoming.empty() and not any(m['next_attempt'] <= time.time()
+                                                 for m in list(self.outbox.values())):
+                break
+            time.sleep(0.05)
+        return len(self.outbox) + self.incoming.qsize()
+
+    def stop(self, timeout=10.0):
+        """Send what can be sent within the timeout; anything left stays in the outbox for next time"""
+        self.stop_event.set()
+        self.join(timeout)
+        print(f"[EMAIL] Dispatcher stopped: {self.sent} sent, {self.failures} failed attempt(s), "
+              f"{self.given_up} given up, {len(self.outbox)} left in {self.outbox_dir}")
+
+    def _publish(self):
+        if self.stats:
+            self.stats.set_gauge('outbox_depth', len(self.outbox))
+
+    def status(self):
+        return {'outbox': len(self.outbox), 'sent': self.sent, 'failures': self.failures,
+                'given_up': self.given_up}
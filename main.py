@@ -6,7 +6,7 @@ import sys
 import time
 from datetime import datetime
 import threading
-import queue
+import argparse
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -19,16 +19,40 @@ except ImportError:
     GPIO_AVAILABLE = False
 
 from database import db_manager
+from gallery import FaceGallery
+from gallery_store import GalleryStore
+from gallery_watcher import GalleryWatcher
+from ann_index import DEFAULT_NPROBE, IVFGallery
+from pipeline import FRAME_SCALE, PipelineStats, RecognitionPipeline, prepare_frame, scale_boxes
+from tracker import FaceTracker, encode_faces
+from motion import MotionGate
+from adaptive import AdaptiveController
+from live_view import LIVE_DIR, LivePublisher
+from event_writer import EventWriter
+from log_rotation import LogRotator
+from log_archive import LogArchive, LogArchiver
+from episodes import EpisodeTracker
+from announcer import ALERT, GREETING, Announcer
+from mail_dispatcher import MailDispatcher
+from evidence import CAPTURE_DIR, EvidenceWriter
+from visitors import VisitorCache
 
-# Global queue for text-to-speech greetings
-global_greeting_queue = queue.Queue()
+# Text-to-speech greetings and alerts (bounded and deduplicated; see announcer.py)
+announcer = Announcer()
 
 # --- Logging System ---
 class DoorLogger:
     """Handles logging of door access events"""
-    def __init__(self, log_file="door_access.log"):
+    def __init__(self, log_file="door_access.log", asynchronous=False, rotator=None):
         self.log_file = log_file
         self.ensure_log_file()
+        # Rotates and compresses the CSV log by size/age (None: it grows forever)
+        self.rotator = rotator
+        # With a writer thread the caller never touches the disk; events are group-committed
+        self.writer = None
+        if asynchronous:
+            self.writer = EventWriter(log_file, db_manager, rotator=rotator)
+            self.writer.start()
     
     def ensure_log_file(self):
         """Create log file if it doesn't exist"""
@@ -36,20 +60,34 @@ class DoorLogger:
             with open(self.log_file, 'w') as f:
                 f.write("Timestamp,Event,Person\n")
     
-    def log_event(self, event, person="N/A"):
-        """Log an event with timestamp"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"{timestamp},{event},{person}\n"
+    def log_event(self, event, person="N/A", details=None, timestamp=None):
+        """Log an event with the time it happened (details, e.g. the camera, only go to the database)"""
+        timestamp = timestamp or time.time()
+        local_time = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
         
         # Print to console
-        print(f"[LOG] {timestamp} - {event} - {person}")
+        print(f"[LOG] {local_time} - {event} - {person}" + (f" ({details})" if details else ""))
+        
+        if self.writer:
+            self.writer.put(timestamp, event, person, details)
+            return
         
         # Write to file
+        line = f"{local_time},{event},{person}\n"
+        if self.rotator:
+            self.rotator.before_write(len(line.encode()))
         with open(self.log_file, 'a') as f:
-            f.write(log_entry)
+            f.write(line)
         
         # Also log to database
-        db_manager.log_access_event(event, person)
+        db_manager.log_access_event(event, person, details, timestamp)
+    
+    def close(self):
+        """Write out any queued events"""
+        if self.writer:
+            self.writer.stop()
+        if self.rotator:
+            self.rotator.wait()
 
 # --- Email Notification System ---
 class EmailNotifier:
@@ -62,14 +100,30 @@ class EmailNotifier:
         self.password = password or os.getenv('SENDER_PASSWORD') or 'vrpo lozh zygn yzvw'
         self.recipient = recipient or os.getenv('RECIPIENT_EMAIL') or 'shresthamanjil29@gmail.com'
         self.enabled = True  # Always enable email notifications with defaults
+        self.dispatcher = None  # MailDispatcher once started; sending is then non-blocking
         
         if not self.enabled:
             print("[EMAIL] Email notifications disabled. Set SMTP credentials in environment variables to enable.")
     
+    def start_dispatcher(self, digest_window=60.0, stats=None):
+        """Hand notifications to a background sender with a persistent connection and outbox"""
+        self.dispatcher = MailDispatcher(self.smtp_server, self.smtp_port, self.email, self.recipient,
+                                         self.email, self.password, digest_window=digest_window,
+                                         stats=stats)
+        self.dispatcher.start()
+    
+    def close(self):
+        """Send what is still queued (unsent mail stays in the outbox for the next run)"""
+        if self.dispatcher:
+            self.dispatcher.stop()
+    
     def send_notification(self, subject, message, attachment_path=None):
         """Send an email notification with optional attachment"""
         if not self.enabled:
             return False
+        
+        if self.dispatcher:
+            return self.dispatcher.submit(subject, message, attachment_path)
             
         try:
             msg = MIMEMultipart()
@@ -125,50 +179,52 @@ class SimulatedGPIO:
             self.door_locked = True
             print(f"[GPIO] Pin {pin} set to LOW - Door LOCKED")
     
-    def cleanup(self):
+    def cleanup(self, pin=None):
         """Simulate GPIO cleanup"""
         print("[GPIO] Cleaning up GPIO resources")
 
 # --- Door Control System ---
 class DoorController:
     """Controls the door locking mechanism"""
-    def __init__(self, gpio_instance, logger, email_notifier=None):
+    def __init__(self, gpio_instance, logger, email_notifier=None, relay_pin=18, name=None):
         self.gpio = gpio_instance
         self.logger = logger
         self.email_notifier = email_notifier
+        self.relay_pin = relay_pin
+        self.name = name  # camera/door name recorded with its events when several doors are driven
         self.door_unlocked_time = None
         self.unlock_duration = 5  # seconds
         
         # Setup GPIO pin for relay
         if GPIO_AVAILABLE:
             GPIO.setmode(GPIO.BCM)
-            GPIO.setup(18, GPIO.OUT)
-            GPIO.output(18, GPIO.LOW)  # Ensure door is locked initially
+            GPIO.setup(self.relay_pin, GPIO.OUT)
+            GPIO.output(self.relay_pin, GPIO.LOW)  # Ensure door is locked initially
         else:
-            self.gpio.setup(18, "OUTPUT")
-            self.gpio.output(18, 0)  # Ensure door is locked initially
+            self.gpio.setup(self.relay_pin, "OUTPUT")
+            self.gpio.output(self.relay_pin, 0)  # Ensure door is locked initially
     
     def unlock_door(self, person_name="Unknown"):
         """Unlock the door for a specified duration"""
         if GPIO_AVAILABLE:
-            GPIO.output(18, GPIO.HIGH)
+            GPIO.output(self.relay_pin, GPIO.HIGH)
         else:
-            self.gpio.output(18, 1)
+            self.gpio.output(self.relay_pin, 1)
         
         self.door_unlocked_time = time.time()
-        self.logger.log_event("Door Opened", person_name)
+        self.logger.log_event("Door Opened", person_name, self.name)
         
         print(f"[DOOR] Door unlocked for {person_name}")
     
     def lock_door(self):
         """Lock the door"""
         if GPIO_AVAILABLE:
-            GPIO.output(18, GPIO.LOW)
+            GPIO.output(self.relay_pin, GPIO.LOW)
         else:
-            self.gpio.output(18, 0)
+            self.gpio.output(self.relay_pin, 0)
         
         self.door_unlocked_time = None
-        self.logger.log_event("Door Locked")
+        self.logger.log_event("Door Locked", details=self.name)
         print("[DOOR] Door locked")
     
     def check_door_status(self):
@@ -181,9 +237,9 @@ class DoorController:
         """Clean up GPIO resources"""
         self.lock_door()
         if GPIO_AVAILABLE:
-            GPIO.cleanup()
+            GPIO.cleanup(self.relay_pin)
         else:
-            self.gpio.cleanup()
+            self.gpio.cleanup(self.relay_pin)
 
 # --- User-Friendly Error for Library Issues ---
 def handle_library_error(e):
@@ -202,230 +258,635 @@ def handle_library_error(e):
     print("---")
     sys.exit(1)
 
+# --- Decision Stage ---
+class DecisionStage:
+    """Owns the door, greeting and unknown-person state and acts on recognised faces"""
+    def __init__(self, gallery, door_controller, logger, email_notifier, stats=None, tracker=None,
+                 camera=None, episodes=None, evidence=None, visitors=None):
+        self.gallery = gallery
+        self.camera = camera  # name recorded with this camera's events
+        # Coalesces per-frame detections; without it every unknown frame is alerted on
+        self.episodes = episodes
+        # Saves face crops off this thread; without it the whole frame is written inline
+        self.evidence = evidence
+        # Recently seen unknown faces, shared by every camera
+        self.visitors = visitors or VisitorCache(stats=stats)
+        self.tracker = tracker or FaceTracker()
+        self.door_controller = door_controller
+        self.logger = logger
+        self.email_notifier = email_notifier
+        self.stats = stats
+        self.greeted_this_session = set()  # Set to track who has been greeted
+
+    def process(self, frame, face_locations, face_encodings, captured_at=None):
+        """Match the faces found in one frame and act on them; returns their names"""
+        face_names = []
+        # Freshly encoded faces are matched in one batched call; faces skipped
+        # by the encoder (None) keep the identity of their track
+        tracked = self.tracker.update(face_locations, face_encodings, self.gallery.identify)
+        if self.stats:
+            encoded = sum(encoding is not None for encoding in face_encodings)
+            self.stats.increment('faces_encoded', encoded)
+            self.stats.increment('faces_skipped', len(face_encodings) - encoded)
+        for (name, distance, face_encoding), face_location in zip(tracked, face_locations):
+            if name is None:
+                # Not attributable this frame; it will be re-encoded on the next one
+                face_names.append("...")
+                continue
+            face_names.append(name)
+            new_episode = True
+            if self.episodes:
+                new_episode = self.episodes.observe(name, distance, face_encoding, self.camera, captured_at)
+
+            # Handle door access
+            if name != "Unknown":
+                # If a known person is found and not yet greeted, greet them and unlock door
+                if name not in self.greeted_this_session:
+                    self.greeted_this_session.add(name)
+                    announcer.announce(name, GREETING, key=f"greet:{name}")
+                    self.door_controller.unlock_door(name)
+                    # Time from the frame being captured to the relay going HIGH
+                    if self.stats and captured_at:
+                        self.stats.record('door_latency', time.time() - captured_at)
+                    self.logger.log_event("Authorized Access", name, self.camera, captured_at)
+                    # Update user access in database
+                    db_manager.update_user_access(name)
+            elif new_episode:
+                # Alert once per visit rather than on every frame the stranger is visible
+                self.handle_unknown(frame, face_encoding, captured_at, face_location)
+
+        return face_names
+
+    def handle_unknown(self, frame, face_encoding, captured_at=None, face_location=None):
+        """Log an unknown person and capture/email them unless they were just seen"""
+        # Log unknown person and send email notification
+        self.logger.log_event("Unknown Person Detected", details=self.camera, timestamp=captured_at)
+        print("[ALERT] Unknown person detected!")
+
+        # Speak "Unknown person detected" using text-to-speech
+        announcer.announce("Unknown person detected", ALERT)
+
+        if face_encoding is None:
+            return
+
+        # Each stranger gets a temporary visitor ID; a visitor seen before is only
+        # captured again after the cache's recapture interval
+        visitor = self.visitors.observe(face_encoding, captured_at)
+        if visitor.sightings > 1:
+            print(f"[INFO] Repeat unknown visitor {visitor.visitor_id} (seen {visitor.sightings} times)")
+        else:
+            print(f"[INFO] New unknown visitor {visitor.visitor_id}")
+
+        # Capture only one clear image per unknown person detection
+        if self.visitors.due_for_capture(visitor, captured_at):
+            subject = "Security Alert - Unknown Person Detected"
+            place = f" by camera {self.camera}" if self.camera else ""
+            repeat = (f"\nThis visitor ({visitor.visitor_id}) has been seen {visitor.sightings} times, first at "
+                      f"{datetime.fromtimestamp(visitor.first_seen).strftime('%Y-%m-%d %H:%M:%S')}."
+                      if visitor.sightings > 1 else "")
+            message = f"An unknown person was detected{place} at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{repeat}\n\nImage attached."
+
+            if self.evidence and face_location is not None:
+                # The crop is written in the background; the e-mail goes out once it exists
+                on_saved = None
+                if self.email_notifier.enabled:
+                    on_saved = lambda crop_path: self.email_notifier.send_notification(subject, message, crop_path)
+                self.evidence.capture(frame, face_location, face_encoding, self.camera,
+                                      captured_at, on_saved)
+            else:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                prefix = f"unknown_person_{self.camera}" if self.camera else "unknown_person"
+                image_filename = f"{prefix}_{timestamp}.jpg"
+                image_path = os.path.join(CAPTURE_DIR, image_filename)
+
+                # Save the current frame
+                cv2.imwrite(image_path, frame)
+                print(f"[CAPTURE] Image saved: {image_path}")
+
+                # Send email notification with captured image
+                if self.email_notifier.enabled:
+                    self.email_notifier.send_notification(subject, message, image_path)
+        else:
+            print(f"[INFO] {visitor.visitor_id} was captured recently, skipping capture")
+
+    def check_episodes(self):
+        """Close episodes nobody has been seen in for a while"""
+        if self.episodes:
+            self.episodes.expire()
+
+    def no_faces(self):
+        """Called for every displayed frame without faces"""
+        print("[ALERT] No face detected!")
+        announcer.announce("Unknown person detected", ALERT)
+
+
+def draw_results(frame, face_locations, face_names):
+    """Draw a labelled box around each face (locations in full-frame coordinates)"""
+    for (top, right, bottom, left), name in zip(face_locations, face_names):
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
+        cv2.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 0, 255), cv2.FILLED)
+        font = cv2.FONT_HERSHEY_DUPLEX
+        cv2.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
+
+
+def load_known_faces(store):
+    """Memory-map the consolidated gallery (converting old per-user .npy files once)"""
+    print("Loading known faces...")
+    if not os.path.exists(store.directory):
+        print(f"Warning: Directory '{store.directory}' not found. No known faces will be loaded.")
+        return FaceGallery()
+
+    try:
+        store.ensure_converted()
+        gallery = store.load_gallery()
+    except Exception as e:
+        print(f"   Error loading gallery from {store.index_path}: {e}")
+        return FaceGallery()
+
+    print(f" > Loaded {len(gallery)} encoding(s), gallery version {gallery.version}")
+    return gallery
+
+
+WINDOW_TITLE = 'Face Recognition Door System - Press "q" to quit'
+
+
+class FrameOutput:
+    """Where processed frames go: preview windows and/or the dashboard live view"""
+    def __init__(self, headless=False, publisher=None):
+        self.headless = headless  # no drawing, no windows, no display needed
+        self.publisher = publisher
+
+    def show(self, camera, index, frame, face_locations=(), face_names=()):
+        """Display one camera's frame (index 0 uses the original window title)"""
+        if not self.headless:
+            draw_results(frame, face_locations, face_names)
+            cv2.imshow(WINDOW_TITLE if index == 0 else f"{WINDOW_TITLE} [{camera}]", frame)
+            if self.publisher:
+                self.publisher.offer(camera, frame)
+        elif self.publisher:
+            # Headless: boxes are only drawn by the publisher, and only while someone watches
+            self.publisher.offer(camera, frame, face_locations, face_names)
+
+    def quit_requested(self):
+        """True when "q" was pressed in a preview window (stop headless units with Ctrl+C)"""
+        if self.headless:
+            return False
+        return cv2.waitKey(1) & 0xFF == ord('q')
+
+    def close(self):
+        if self.publisher:
+            self.publisher.stop()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+
+def run_serial(video_capture, decision, door_controller, logger, stats, gate=None, controller=None,
+               output=None, camera="cam0"):
+    """Original single-threaded loop: capture, detect, encode and decide on one thread"""
+    output = output or FrameOutput()
+    face_locations = []
+    face_names = []
+    gated = False
+    controller = controller or AdaptiveController(target_latency=0, stats=stats)
+
+    while True:
+        # Check if door should be relocked
+        door_controller.check_door_status()
+        decision.check_episodes()
+
+        # Grab a single frame of video
+        start = time.perf_counter()
+        ret, frame = video_capture.read()
+        captured_at = time.time()
+        if not ret:
+            print("Error: Failed to grab frame from webcam. Exiting.")
+            logger.log_event("Error", "Failed to grab frame from webcam")
+            break
+        stats.record('capture', time.perf_counter() - start)
+
+        # Only process the frames the controller picks, and only while something moves
+        process_this_frame = controller.should_process()
+        if process_this_frame:
+            gated = gate is not None and not gate.allow(frame, captured_at)
+            if gated:
+                face_locations = []
+                face_names = []
+        if process_this_frame and not gated:
+            # Downscale and convert BGR (OpenCV) to RGB (face_recognition)
+            scale = controller.scale
+            start = time.perf_counter()
+            rgb_small_frame = prepare_frame(frame, scale)
+            detect_start = time.perf_counter()
+            stats.record('preprocess', detect_start - start)
+
+            # Find all the faces and face encodings in the current frame of video
+            small_locations = face_recognition.face_locations(rgb_small_frame)
+            encode_start = time.perf_counter()
+            stats.record('detect', encode_start - detect_start)
+            face_encodings = encode_faces(rgb_small_frame, small_locations,
+                                          scale_boxes(decision.tracker.skip_boxes(), scale))
+            decide_start = time.perf_counter()
+            stats.record('encode', decide_start - encode_start)
+
+            face_locations = scale_boxes(small_locations, 1.0 / scale)
+            face_names = decision.process(frame, face_locations, face_encodings, captured_at)
+            stats.record('decision', time.perf_counter() - decide_start)
+            stats.record('end_to_end', time.time() - captured_at)
+            controller.update(time.perf_counter() - start, face_locations, scale)
+            if face_locations and gate:
+                gate.keep_awake()
+
+        # Check if no faces were detected and speak alert
+        if len(face_locations) == 0 and not gated:
+            decision.no_faces()
+
+        # Display the results
+        output.show(camera, 0, frame, face_locations, face_names)
+        stats.report()
+
+        if output.quit_requested():
+            break
+
+
+class Camera:
+    """Everything that belongs to one door: its stream, door controller and decision stage"""
+    def __init__(self, name, source, video_capture, door_controller, decision, gate=None,
+                 controller=None):
+        self.name = name
+        self.source = source
+        self.video_capture = video_capture
+        self.door_controller = door_controller
+        self.decision = decision
+        self.gate = gate
+        self.controller = controller
+        self.stream = None  # CameraStream, set once the pipeline is built
+        self.failed = False
+
+
+def run_pipelined(cameras, logger, stats, workers=None, model="hog", output=None):
+    """Staged loop: grabber threads -> shared detection worker processes -> per-camera decision stages"""
+    output = output or FrameOutput()
+    captures = []
+    for camera in cameras:
+        # Video files are replayed at their own frame rate instead of as fast as they decode
+        fps = camera.video_capture.get(cv2.CAP_PROP_FPS) if camera.source.is_file else 0
+        captures.append((camera.name, camera.video_capture, {
+            'gate': camera.gate,
+            'controller': camera.controller,
+            'skip_boxes': camera.decision.tracker.skip_boxes,
+            'pace': 1.0 / fps if fps and fps > 0 else 0.0,
+        }))
+    pipeline = RecognitionPipeline.for_captures(captures, workers=workers, stats=stats, model=model,
+                                                on_error=lambda message: logger.log_event("Error", message))
+    for camera, stream in zip(cameras, pipeline.streams):
+        camera.stream = stream
+        # The cameras share the detection workers
+        camera.controller.capacity = pipeline.workers / len(cameras)
+    pipeline.start()
+    try:
+        while True:
+            # Check if any door should be relocked
+            for camera in cameras:
+                camera.door_controller.check_door_status()
+                camera.decision.check_episodes()
+                if camera.stream.failed and not camera.failed:
+                    camera.failed = True
+                    print(f"Error: Failed to grab frame from camera {camera.name}.")
+                    logger.log_event("Error", f"Failed to grab frame from camera {camera.name}")
+
+            result = pipeline.next_result(timeout=0.05)
+            if result is None:
+                if pipeline.failed:
+                    print(f"Error: {pipeline.error or 'No camera is delivering frames'}. Exiting.")
+                    break
+                if output.quit_requested():
+                    break
+                continue
+
+            camera = cameras[result.stream.index]
+            stats.increment(f"frames:{camera.name}")
+            if result.gated:
+                # Motion gate skipped detection: just keep the preview alive
+                output.show(camera.name, result.stream.index, result.frame)
+                if output.quit_requested():
+                    break
+                continue
+
+            decide_start = time.perf_counter()
+            face_names = camera.decision.process(result.frame, result.face_locations,
+                                                 result.face_encodings, result.captured_at)
+            stats.record('decision', time.perf_counter() - decide_start)
+            stats.record('end_to_end', time.time() - result.captured_at)
+
+            if len(result.face_locations) == 0:
+                camera.decision.no_faces()
+            elif camera.gate:
+                camera.gate.keep_awake()
+
+            # Display the results
+            output.show(camera.name, result.stream.index, result.frame, result.face_locations, face_names)
+            stats.report()
+
+            if output.quit_requested():
+                break
+    finally:
+        pipeline.stop()
+
+
+class CameraSource(str):
+    """A --camera argument: a device index, a video file or a stream URL"""
+    @property
+    def is_device(self):
+        return self.isdigit()
+
+    @property
+    def is_file(self):
+        return not self.is_device and "://" not in self
+
+    def open(self):
+        return cv2.VideoCapture(int(self) if self.is_device else str(self))
+
+
 # --- Main Application ---
-def main():
+DEFAULT_RELAY_PINS = (18, 23, 24, 25, 12, 16)
+
+
+def open_cameras(sources, relay_pins, gpio, logger, email_notifier, gallery, stats, mode,
+                 refresh_interval, motion_sensitivity, idle_after, idle_fps, target_latency,
+                 episodes=None, evidence=None, visitors=None):
+    """Open every camera source and give each its own door, tracker, motion gate and controller"""
+    cameras = []
+    for i, source in enumerate(sources):
+        name = f"cam{i}"
+        video_capture = source.open()
+        if not video_capture.isOpened():
+            print(f"ERROR: Cannot open camera {name} ({source}). Is it connected and not in use?")
+            logger.log_event("Error", f"Cannot open camera {name}")
+            continue
+        if i >= len(relay_pins):
+            print(f"ERROR: No relay pin for camera {name}; pass one per camera with --relay-pins")
+            video_capture.release()
+            continue
+        # Only tag events with the camera when there is more than one
+        label = name if len(sources) > 1 else None
+        door_controller = DoorController(gpio, logger, email_notifier, relay_pins[i], label)
+        decision = DecisionStage(gallery, door_controller, logger, email_notifier, stats,
+                                 FaceTracker(refresh_interval=refresh_interval), label, episodes,
+                                 evidence, visitors)
+
+        # Skip detection entirely while the scene is empty
+        gate = None
+        if motion_sensitivity > 0:
+            gate = MotionGate(sensitivity=motion_sensitivity, idle_after=idle_after,
+                              idle_fps=idle_fps, stats=stats)
+
+        # Downscale chosen to fit the latency budget and frame skip to keep up with the
+        # camera (0 keeps them fixed). The serial loop starts at the original
+        # every-other-frame; the pipeline at every frame. The serial loop reads frames
+        # the camera has buffered, so it needs the camera's nominal rate to notice lag.
+        fps = video_capture.get(cv2.CAP_PROP_FPS) if mode == "serial" else 0
+        controller = AdaptiveController(target_latency=target_latency, initial_scale=FRAME_SCALE,
+                                        skip=2 if mode == "serial" else 1,
+                                        capture_fps=fps if fps and fps > 0 else 0.0,
+                                        stats=stats, name=label)
+        print(f"[CAMERA] {name}: {source} -> relay pin {relay_pins[i]}")
+        cameras.append(Camera(name, source, video_capture, door_controller, decision, gate, controller))
+    return cameras
+
+
+def main(mode="pipeline", workers=None, matcher="exact", nprobe=DEFAULT_NPROBE, reload_interval=2.0,
+         refresh_interval=10, motion_sensitivity=0.005, idle_after=5.0, idle_fps=2.0,
+         target_latency=0.15, sources=None, relay_pins=DEFAULT_RELAY_PINS, model="hog", headless=False,
+         live_fps=5.0, episode_quiet=10.0, email_digest=60.0, capture_quality=90,
+         capture_max_mb=500, capture_max_days=30, visitor_ttl=168.0, visitor_recapture=600.0,
+         persist_visitors=False, log_max_mb=10, log_max_days=30, log_keep=12, archive_after_days=0):
     # Initialize systems
-    logger = DoorLogger()
+    rotator = None
+    if log_max_mb > 0 or log_max_days > 0:
+        rotator = LogRotator("door_access.log", max_bytes=int(log_max_mb * 1024 * 1024),
+                             max_age=log_max_days * 86400, keep=log_keep)
+    logger = DoorLogger(asynchronous=True, rotator=rotator)
     email_notifier = EmailNotifier()
     gpio = GPIO if GPIO_AVAILABLE else SimulatedGPIO()
-    door_controller = DoorController(gpio, logger, email_notifier)
+    sources = [CameraSource(s) for s in (sources or ["0"])]
+    if mode == "serial" and len(sources) > 1:
+        print("FATAL ERROR: Serial mode supports a single camera; use --mode pipeline for several.")
+        logger.close()
+        sys.exit(1)
     
     logger.log_event("System Started")
     
-    # Get a reference to webcam #0 (the default one)
-    video_capture = cv2.VideoCapture(0)
-    if not video_capture.isOpened():
-        print("FATAL ERROR: Cannot open webcam. Is it connected and not in use by another application?")
-        logger.log_event("Error", "Cannot open webcam")
-        sys.exit(1)
+    # Load the gallery of known face encodings and their names. The change id is
+    # read first so nothing written while loading is missed by the watcher.
+    store = GalleryStore('known_faces', change_log=db_manager)
+    gallery_generation = db_manager.get_gallery_generation()
+    gallery = load_known_faces(store)
+    
+    if not len(gallery):
+        print("\nWarning: No known faces were loaded. The system will only detect 'Unknown' faces.")
+        print("Please add images to the 'known_faces' directory using register.py\n")
     
-    # Create arrays of known face encodings and their names
-    known_face_encodings = []
-    known_face_names = []
-    greeted_this_session = set() # Set to track who has been greeted
+    if matcher == "ivf":
+        # Approximate search for very large galleries; small ones stay brute force
+        gallery = IVFGallery.from_gallery(gallery, nprobe=nprobe)
+        if gallery.trained:
+            print(f"[MATCHER] IVF index with {gallery.nlist} cells, probing {gallery.nprobe}")
+        else:
+            print("[MATCHER] Gallery too small for an IVF index, using exact search")
     
-    # Define allowed image extensions
-    image_extensions = ('.jpg', '.jpeg', '.png')
-    known_faces_dir = 'known_faces'
+    # One gallery (and one worker pool) is shared by every camera; each camera
+    # has its own door, tracker, motion gate and adaptive controller
+    stats = PipelineStats()
+    announcer.stats = stats
+    if logger.writer:
+        logger.writer.stats = stats
+    if email_notifier.enabled:
+        # Alerts are sent from a background thread; bursts become one digest e-mail
+        email_notifier.start_dispatcher(email_digest, stats)
+    # Repeated detections of the same person become one episode row (written with the log events)
+    episodes = EpisodeTracker(logger.writer, quiet_period=episode_quiet) if episode_quiet > 0 else None
+    # Unknown-person face crops and thumbnails are written (and pruned) in the background
+    evidence = EvidenceWriter(db_manager, CAPTURE_DIR, crop_quality=capture_quality,
+                              max_bytes=int(capture_max_mb * 1024 * 1024), max_age_days=capture_max_days,
+                              stats=stats)
+    evidence.start()
+    # Unknown visitors are remembered for visitor_ttl hours, across restarts if persisted
+    visitors = VisitorCache(ttl=visitor_ttl * 3600, recapture_interval=visitor_recapture,
+                            writer=logger.writer if persist_visitors else None, stats=stats)
+    if persist_visitors:
+        loaded = visitors.load(db_manager.get_visitors(time.time() - visitors.ttl, visitors.capacity))
+        print(f"[VISITOR] {loaded} remembered unknown visitor(s) loaded")
+    cameras = open_cameras(sources, relay_pins, gpio, logger, email_notifier, gallery, stats, mode,
+                           refresh_interval, motion_sensitivity, idle_after, idle_fps, target_latency,
+                           episodes, evidence, visitors)
+    if not cameras:
+        print("FATAL ERROR: Cannot open any camera. Is it connected and not in use by another application?")
+        logger.log_event("Error", "Cannot open webcam")
+        evidence.stop()
+        logger.close()
+        sys.exit(1)
     
-    print("Loading known faces...")
-    # Load sample pictures and learn how to recognize them.
-    if os.path.exists(known_faces_dir):
-        for image_file in os.listdir(known_faces_dir):
-            if image_file.lower().endswith(image_extensions) and not image_file.endswith('_encoding.npy'):
-                # Skip individual face images, only load encoding files
-                continue
-            if image_file.endswith('_encoding.npy'):
-                try:
-                    # Extract name from encoding file name
-                    name = image_file.replace('_encoding.npy', '')
-                    print(f" > Loading encoding for {name}...")
-                    
-                    # Load precomputed encoding
-                    encoding_file = os.path.join(known_faces_dir, image_file)
-                    image_face_encoding = np.load(encoding_file)
-                    
-                    known_face_encodings.append(image_face_encoding)
-                    known_face_names.append(name)
-                except Exception as e:
-                    print(f"   Error loading encoding {image_file}: {e}")
-    else:
-        print(f"Warning: Directory '{known_faces_dir}' not found. No known faces will be loaded.")
+    print(f"...Done loading faces. Starting {len(cameras)} video stream(s) ({mode} mode).")
     
-    if not known_face_encodings:
-        print("\nWarning: No known faces were loaded. The system will only detect 'Unknown' faces.")
-        print("Please add images to the 'known_faces' directory using register.py\n")
+    # Old access log rows are moved to monthly archives once a day, keeping the table small
+    archiver = None
+    if archive_after_days > 0:
+        archiver = LogArchiver(LogArchive(db_manager), keep_days=archive_after_days)
+        archiver.start()
     
-    print("...Done loading faces. Starting video stream.")
+    # Pick up registrations and deletions while running
+    watcher = None
+    if reload_interval > 0:
+        watcher = GalleryWatcher(gallery, store, db_manager, gallery_generation, reload_interval)
+        watcher.start()
     
-    # Initialize some variables
-    face_locations = []
-    face_encodings = []
-    face_names = []
-    process_this_frame = True
-    last_unknown_capture_time = 0  # To track when we last captured an unknown person
-    last_unknown_face_encoding = None  # To track encoding of last unknown person
-    unknown_face_tolerance = 0.6  # Tolerance for comparing unknown faces
+    # Annotated frames for the dashboard's /live view, encoded only while someone watches
+    publisher = None
+    if live_fps > 0:
+        publisher = LivePublisher(LIVE_DIR, fps=live_fps, draw=draw_results, stats=stats)
+        publisher.start()
+    output = FrameOutput(headless, publisher)
     
     try:
-        while True:
-            # Check if door should be relocked
-            door_controller.check_door_status()
-            
-            # Grab a single frame of video
-            ret, frame = video_capture.read()
-            if not ret:
-                print("Error: Failed to grab frame from webcam. Exiting.")
-                logger.log_event("Error", "Failed to grab frame from webcam")
-                break
-            
-            # Only process every other frame of video to save time
-            if process_this_frame:
-                # Resize frame of video to 1/4 size for faster face recognition processing
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                
-                # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-                rgb_small_frame = np.ascontiguousarray(rgb_small_frame)
-                
-                # Find all the faces and face encodings in the current frame of video
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-                
-                face_names = []
-                for face_encoding in face_encodings:
-                    name = "Unknown"
-                    if known_face_encodings:
-                        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-                        face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = known_face_names[best_match_index]
-                    
-                    face_names.append(name)
-                    
-                    # Handle door access
-                    if name != "Unknown":
-                        # If a known person is found and not yet greeted, greet them and unlock door
-                        if name not in greeted_this_session:
-                            greeted_this_session.add(name)
-                            global_greeting_queue.put(name)
-                            door_controller.unlock_door(name)
-                            logger.log_event("Authorized Access", name)
-                            # Update user access in database
-                            db_manager.update_user_access(name)
-                    else:
-                        # Log unknown person and send email notification
-                        logger.log_event("Unknown Person Detected")
-                        print("[ALERT] Unknown person detected!")
-                        
-                        # Speak "Unknown person detected" using text-to-speech
-                        global_greeting_queue.put("Unknown person detected")
-                        
-                        # Check if this is likely the same unknown person as before
-                        should_capture = True
-                        current_time = time.time()
-                        
-                        # If we have a previous unknown face encoding, compare with current
-                        if last_unknown_face_encoding is not None:
-                            # Calculate distance between current and previous unknown face
-                            distance = face_recognition.face_distance([last_unknown_face_encoding], face_encoding)[0]
-                            # If distance is small (faces are similar), don't capture again
-                            if distance < unknown_face_tolerance:
-                                should_capture = False
-                                print("[INFO] Same unknown person detected, skipping capture")
-                        
-                        # Also apply time-based cooldown as backup
-                        if current_time - last_unknown_capture_time < 5:  # 5 second cooldown
-                            should_capture = False
-                            print("[INFO] Cooldown period active, skipping capture")
-                        
-                        # Capture only one clear image per unknown person detection
-                        if should_capture:
-                            # Save encoding for comparison with next unknown face
-                            last_unknown_face_encoding = face_encoding
-                            
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            image_filename = f"unknown_person_{timestamp}.jpg"
-                            image_path = os.path.join("captured_images", image_filename)
-                            
-                            # Save the current frame
-                            cv2.imwrite(image_path, frame)
-                            print(f"[CAPTURE] Image saved: {image_path}")
-                            
-                            # Send email notification with captured image
-                            if email_notifier.enabled:
-                                subject = "Security Alert - Unknown Person Detected"
-                                message = f"An unknown person was detected at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\nImage attached."
-                                email_notifier.send_notification(subject, message, image_path)
-                                
-                            # Update last capture time
-                            last_unknown_capture_time = current_time
-                
-            process_this_frame = not process_this_frame
-            
-            # Check if no faces were detected and speak alert
-            if len(face_locations) == 0:
-                # No faces detected in frame
-                print("[ALERT] No face detected!")
-                global_greeting_queue.put("Unknown person detected")
-            
-            # Display the results
-            for (top, right, bottom, left), name in zip(face_locations, face_names):
-                top *= 4
-                right *= 4
-                bottom *= 4
-                left *= 4
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 0, 255), cv2.FILLED)
-                font = cv2.FONT_HERSHEY_DUPLEX
-                cv2.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
-            
-            cv2.imshow('Face Recognition Door System - Press "q" to quit', frame)
-            
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+        if mode == "serial":
+            camera = cameras[0]
+            run_serial(camera.video_capture, camera.decision, camera.door_controller, logger, stats,
+                       camera.gate, camera.controller, output, camera.name)
+        else:
+            run_pipelined(cameras, logger, stats, workers, model, output)
     
+    except KeyboardInterrupt:
+        # The normal way to stop a headless unit
+        print("Interrupted, shutting down.")
     except TypeError as e:
         handle_library_error(e)
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         logger.log_event("Error", f"Unexpected error: {e}")
     finally:
-        # Release handle to the webcam and clean up GPIO
-        video_capture.release()
-        cv2.destroyAllWindows()
-        door_controller.cleanup()
+        # Release handles to the cameras and clean up GPIO
+        if watcher:
+            watcher.stop()
+        if archiver:
+            archiver.stop()
+        for camera in cameras:
+            camera.video_capture.release()
+            camera.door_controller.cleanup()
+        output.close()
+        if episodes:
+            episodes.close_all()
+            print(f"[EPISODE] {episodes.status()}")
+        print(f"[ANNOUNCE] {announcer.status()}")
+        print(f"[VISITOR] {visitors.status()}")
+        # Pending captures still queue their alert e-mails, so stop the writer first
+        evidence.stop()
+        email_notifier.close()
+        stats.report(force=True)
         logger.log_event("System Stopped")
+        # Flush queued log events before the process exits
+        logger.close()
 
 def speak_greetings():
     import pyttsx3
-    global global_greeting_queue
     engine = pyttsx3.init()
-    while True:
-        try:
-            greeting = global_greeting_queue.get(timeout=1)
-            if greeting == "QUIT":
-                break
-            engine.say(greeting)
-            engine.runAndWait()
-        except queue.Empty:
+    while not announcer.stopped:
+        greeting = announcer.next(timeout=1)
+        if greeting is None:
             continue
+        engine.say(greeting)
+        engine.runAndWait()
 
 
 if __name__ == "__main__":
     # Create captured_images directory if it doesn't exist
-    if not os.path.exists("captured_images"):
-        os.makedirs("captured_images")
+    if not os.path.exists(CAPTURE_DIR):
+        os.makedirs(CAPTURE_DIR)
     
-    # Initialize the greeting queue and thread
-    global_greeting_queue = queue.Queue()
+    # Initialize the greeting thread
     greeting_thread = threading.Thread(target=speak_greetings, daemon=True)
     
     # Start the greeting thread
     greeting_thread.start()
     
+    parser = argparse.ArgumentParser(description="Face Recognition Door System")
+    parser.add_argument("--mode", choices=["pipeline", "serial"], default="pipeline",
+                        help="pipeline: grabber thread + detection worker processes; "
+                             "serial: original single-threaded loop (for comparison)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of detection/encoding worker processes (default: CPUs - 1)")
+    parser.add_argument("--matcher", choices=["exact", "ivf"], default="exact",
+                        help="exact: brute-force search over all encodings; "
+                             "ivf: approximate inverted-file index for very large galleries")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE,
+                        help="IVF cells searched per face; higher is more accurate but slower")
+    parser.add_argument("--reload-interval", type=float, default=2.0,
+                        help="Seconds between checks for gallery changes (0 disables live reload)")
+    parser.add_argument("--refresh-interval", type=int, default=10,
+                        help="Re-encode a confidently tracked face every N processed frames "
+                             "(0 encodes every face on every frame)")
+    parser.add_argument("--motion-sensitivity", type=float, default=0.005,
+                        help="Fraction of pixels that must change to count as motion (0 disables the motion gate)")
+    parser.add_argument("--idle-after", type=float, default=5.0,
+                        help="Seconds without motion or faces before detection goes idle")
+    parser.add_argument("--idle-fps", type=float, default=2.0,
+                        help="Motion checks per second while idle")
+    parser.add_argument("--target-latency", type=float, default=150,
+                        help="Per-frame processing budget in ms used to adapt frame skip and "
+                             "resolution (0 keeps 1/4 scale and a fixed skip)")
+    parser.add_argument("--camera", action="append", default=None,
+                        help="Camera to watch: a device index, video file or RTSP/HTTP URL. "
+                             "Repeat for several doors (default: device 0)")
+    parser.add_argument("--relay-pins", type=lambda v: [int(p) for p in v.split(",")],
+                        default=list(DEFAULT_RELAY_PINS),
+                        help="Comma-separated BCM relay pins, one per --camera in order")
+    parser.add_argument("--detection-model", choices=["hog", "cnn"], default="hog",
+                        help="Face detector; with cnn, frames from several cameras are detected "
+                             "in one batch")
+    parser.add_argument("--headless", action="store_true",
+                        help="No preview windows or drawing (for units without a display; stop with Ctrl+C)")
+    parser.add_argument("--live-fps", type=float, default=5.0,
+                        help="Maximum frame rate of the dashboard /live view (0 disables it)")
+    parser.add_argument("--episode-quiet", type=float, default=10.0,
+                        help="Seconds without a detection before a person's episode is closed "
+                             "(0 logs and alerts on every detection as before)")
+    parser.add_argument("--email-digest", type=float, default=60.0,
+                        help="Alerts within this many seconds of the previous e-mail are merged "
+                             "into one digest (0 sends every alert separately)")
+    parser.add_argument("--capture-quality", type=int, default=90,
+                        help="JPEG quality of saved unknown-person face crops")
+    parser.add_argument("--capture-max-mb", type=float, default=500,
+                        help="Oldest captures are deleted beyond this total size (0 for no limit)")
+    parser.add_argument("--capture-max-days", type=float, default=30,
+                        help="Captures older than this many days are deleted (0 keeps them)")
+    parser.add_argument("--visitor-ttl", type=float, default=168,
+                        help="Hours an unknown visitor is remembered after last being seen")
+    parser.add_argument("--visitor-recapture", type=float, default=600,
+                        help="Seconds before the same unknown visitor is captured and e-mailed again")
+    parser.add_argument("--persist-visitors", action="store_true",
+                        help="Keep unknown visitors in the database so they are recognised after a restart")
+    parser.add_argument("--log-max-mb", type=float, default=10,
+                        help="Rotate door_access.log beyond this size (0 for no size limit)")
+    parser.add_argument("--log-max-days", type=float, default=30,
+                        help="Rotate door_access.log once its first entry is this old (0 for no age limit)")
+    parser.add_argument("--log-keep", type=int, default=12,
+                        help="Compressed rotated logs kept (0 keeps all)")
+    parser.add_argument("--archive-after-days", type=float, default=0,
+                        help="Move access log rows older than this into monthly archives once a day "
+                             "(0 disables; see log_archive.py to run it from cron)")
+    args = parser.parse_args()
+    
     try:
-        main()
+        main(mode=args.mode, workers=args.workers, matcher=args.matcher, nprobe=args.nprobe,
+             reload_interval=args.reload_interval, refresh_interval=args.refresh_interval,
+             motion_sensitivity=args.motion_sensitivity, idle_after=args.idle_after,
+             idle_fps=args.idle_fps, target_latency=args.target_latency / 1000.0,
+             sources=args.camera, relay_pins=args.relay_pins, model=args.detection_model,
+             headless=args.headless, live_fps=args.live_fps, episode_quiet=args.episode_quiet,
+             email_digest=args.email_digest, capture_quality=args.capture_quality,
+             capture_max_mb=args.capture_max_mb, capture_max_days=args.capture_max_days,
+             visitor_ttl=args.visitor_ttl, visitor_recapture=args.visitor_recapture,
+             persist_visitors=args.persist_visitors, log_max_mb=args.log_max_mb,
+             log_max_days=args.log_max_days, log_keep=args.log_keep,
+             archive_after_days=args.archive_after_days)
     finally:
-        global_greeting_queue.put("QUIT")
+        announcer.stop()
@@ -5,9 +5,15 @@ Migrates existing user data and logs to the new SQLite database.
 """
 
 import os
-import sqlite3
-from datetime import datetime
+import gzip
+import time
+import hashlib
+import argparse
 from database import db_manager
+from gallery_store import GalleryStore
+
+# Rows written per transaction when importing door_access.log
+LOG_CHUNK_ROWS = 50000
 
 def migrate_users():
     """Migrate existing users from known_faces directory to database"""
@@ -19,69 +25,130 @@ def migrate_users():
     
     migrated_count = 0
     
-    # Get all encoding files
-    for file in os.listdir(known_faces_dir):
-        if file.endswith('_encoding.npy'):
-            # Extract username from filename
-            username = file.replace('_encoding.npy', '')
-            
-            # Add user to database
-            if db_manager.add_user(username):
-                print(f"Migrated user: {username}")
-                migrated_count += 1
-            else:
-                print(f"User {username} already exists in database")
+    # Users come from the consolidated gallery (legacy .npy files are converted first)
+    store = GalleryStore(known_faces_dir, change_log=db_manager)
+    store.ensure_converted()
+    for username in store.names():
+        # Add user to database
+        if db_manager.add_user(username):
+            print(f"Migrated user: {username}")
+            migrated_count += 1
+        else:
+            print(f"User {username} already exists in database")
     
     print(f"Migrated {migrated_count} users to database")
 
-def migrate_logs():
-    """Migrate existing logs from door_access.log to database"""
-    log_file = 'door_access.log'
+def migrate_gallery():
+    """Convert per-user <name>_encoding.npy files into the consolidated gallery"""
+    store = GalleryStore('known_faces', change_log=db_manager)
+    if not store.legacy_files():
+        print("No legacy encoding files found. Skipping gallery conversion.")
+        return
     
+    # Legacy files are imported (and win over existing entries) but left in place
+    count = store.convert_legacy()
+    print(f"Converted {count} encoding files into gallery version {store.version()}")
+
+def open_log(log_file):
+    """Open a CSV log for binary reading, also when it was rotated and compressed (.gz)"""
+    return gzip.open(log_file, 'rb') if log_file.endswith('.gz') else open(log_file, 'rb')
+
+def log_fingerprint(log_file):
+    """Hash of the header and first entry, which identify a log file as long as it is only appended to"""
+    with open_log(log_file) as f:
+        head = f.readline()
+        first = f.readline()
+    if not first.endswith(b'\n'):
+        first = b''
+    return hashlib.sha1(head + first).hexdigest()
+
+def migrate_logs(log_file='door_access.log', chunk_rows=LOG_CHUNK_ROWS):
+    """
+    Stream door_access.log (or a rotated .gz log) into the database with the original timestamps.
+    Rows are inserted `chunk_rows` at a time, each chunk in one transaction
+    together with the position reached in the file, so running it again only
+    imports what was appended since (or what an interrupted run did not commit).
+    """
     if not os.path.exists(log_file):
-        print("No door_access.log file found. Skipping log migration.")
+        print(f"No {log_file} file found. Skipping log migration.")
         return
     
-    migrated_count = 0
+    source = os.path.abspath(log_file)
+    fingerprint = log_fingerprint(log_file)
+    position, total = 0, 0
+    mark = db_manager.get_import_mark(source)
+    if mark is not None:
+        position, total, seen = mark
+        if seen != fingerprint or (position > os.path.getsize(log_file) and not log_file.endswith('.gz')):
+            print(f"{log_file} was replaced since the last migration; importing it from the start")
+            position, total = 0, 0
     
+    migrated_count = 0
+    skipped = 0
+    events = []
+    start = time.perf_counter()
     try:
-        with open(log_file, 'r') as f:
-            # Skip header line
-            next(f)
-            
+        with open_log(log_file) as f:
+            f.seek(position)
             for line in f:
-                if line.strip():
-                    parts = line.strip().split(',', 2)
-                    if len(parts) == 3:
-                        timestamp_str, event, person = parts
-                        
-                        # Parse timestamp
-                        try:
-                            timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-                        except ValueError:
-                            timestamp = datetime.now()
-                        
-                        # Add to database
-                        db_manager.log_access_event(event, person if person != "N/A" else None)
-                        migrated_count += 1
-        
-        print(f"Migrated {migrated_count} log entries to database")
+                if not line.endswith(b'\n'):
+                    break  # still being written; picked up next time
+                position += len(line)
+                text = line.decode('utf-8', errors='replace').strip()
+                if not text or text == "Timestamp,Event,Person":
+                    continue
+                parts = text.split(',', 2)
+                if len(parts) != 3:
+                    skipped += 1
+                    continue
+                timestamp_str, event, person = parts
+                # Original local time; converted to UTC by the database
+                events.append((timestamp_str, event, person if person != "N/A" else None, None))
+                
+                if len(events) >= chunk_rows:
+                    inserted = db_manager.import_access_logs(source, events, position, total + migrated_count,
+                                                             fingerprint)
+                    migrated_count += inserted
+                    skipped += len(events) - inserted
+                    events = []
+                    elapsed = time.perf_counter() - start
+                    print(f"  {migrated_count} log entries ({migrated_count / elapsed:.0f} rows/s)")
         
+        # Also moves the mark past trailing blank or malformed lines
+        inserted = db_manager.import_access_logs(source, events, position, total + migrated_count, fingerprint)
+        migrated_count += inserted
+        skipped += len(events) - inserted
     except Exception as e:
-        print(f"Error migrating logs: {e}")
+        print(f"Error migrating logs: {e}. Run the migration again to continue from the last committed entry.")
+        return None
+    
+    elapsed = time.perf_counter() - start
+    rate = f" ({migrated_count / elapsed:.0f} rows/s)" if migrated_count and elapsed > 0 else ""
+    print(f"Migrated {migrated_count} log entries to database in {elapsed:.1f}s{rate}"
+          + (f", skipped {skipped} malformed line(s)" if skipped else "")
+          + (f"; {total} were imported by earlier runs" if total else ""))
+    return migrated_count
 
 def main():
     """Main migration function"""
+    parser = argparse.ArgumentParser(description="Migrate users and logs to the SQLite database")
+    parser.add_argument('--log-file', default='door_access.log', help="CSV access log to import")
+    parser.add_argument('--chunk-rows', type=int, default=LOG_CHUNK_ROWS, help="Log rows per transaction")
+    args = parser.parse_args()
+    
     print("Starting data migration to SQLite database...")
     
     # Initialize database (creates tables if they don't exist)
     db_manager.init_database()
     
+    # Consolidate encodings
+    migrate_gallery()
+    
     # Migrate users
     migrate_users()
     
     # Migrate logs
-    migrate_logs()
+    migrate_logs(args.log_file, args.chunk_rows)
     
     print("Data migration completed!")
 
@@ -0,0 +1,91 @@
+"""
+Motion gating for the face detector.
+
+A tiny grayscale copy of each frame is compared against a running background
+model; face detection only runs while something in the scene moves (or a
+face was seen recently). After a quiet period the gate drops into an idle
+mode in which motion is only checked a few times per second, and it returns
+to full rate on the first frame that shows motion.
+"""
+
+import time
+import threading
+
+import cv2
+
+
+class MotionGate:
+    """Frame-differencing gate that decides whether a frame is worth running detection on"""
+    def __init__(self, sensitivity=0.005, pixel_threshold=25, width=160,
+                 idle_after=5.0, idle_fps=2.0, background_rate=0.05, stats=None):
+        self.sensitivity = sensitivity  # fraction of pixels that must change
+        self.pixel_threshold = pixel_threshold  # grey-level change that counts as motion
+        self.width = width
+        self.idle_after = idle_after  # seconds without motion or faces before idling
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else 0.0
+        self.background_rate = background_rate
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.background = None
+        self.last_activity = 0.0
+        self.last_checked = 0.0
+        self.idle = False
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.wakeups = 0
+
+    def _motion_ratio(self, frame):
+        """Fraction of pixels that differ from the background, updating the background"""
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype('float32')
+        if self.background is None:
+            self.background = gray
+            return 1.0
+        diff = cv2.absdiff(gray, self.background)
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+        _, mask = cv2.threshold(diff, self.pixel_threshold, 1, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / float(mask.size)
+
+    def allow(self, frame, captured_at=None):
+        """True if detection should run on this frame"""
+        now = captured_at or time.time()
+        with self.lock:
+            if self.idle and now - self.last_checked < self.idle_interval:
+                # Idle mode: frames between the low-rate checks are not even looked at
+                self._skipped()
+                return False
+            previous_check = self.last_checked
+            self.last_checked = now
+            self.frames_checked += 1
+            moved = self._motion_ratio(frame) >= self.sensitivity
+
+            if moved:
+                self.last_activity = now
+                if self.idle:
+                    self.idle = False
+                    self.wakeups += 1
+                    if self.stats:
+                        # Motion can have started at most one idle interval ago
+                        self.stats.record('wake_latency', now - previous_check)
+                    print("[MOTION] Motion detected, resuming full-rate detection")
+                return True
+
+            if now - self.last_activity < self.idle_after:
+                # Keep detecting for a while so a person standing still is not missed
+                return True
+
+            if not self.idle:
+                self.idle = True
+                print("[MOTION] Scene idle, dropping to low-rate motion checks")
+            self._skipped()
+            return False
+
+    def keep_awake(self, now=None):
+        """Called when faces are present so the gate does not idle in front of someone"""
+        self.last_activity = now or time.time()
+
+    def _skipped(self):
+        self.frames_skipped += 1
+        if self.stats:
+            self.stats.increment('frames_gated')
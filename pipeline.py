@@ -0,0 +1,479 @@
+"""
+Staged recognition pipeline for the face recognition door system.
+
+Each camera is read by a dedicated grabber thread that only ever keeps the
+newest frame, face detection and encoding run in one pool of worker processes
+shared by all cameras (so dlib is not bound by the GIL), and the caller's
+thread acts as the decision stage that owns the door and greeting state.
+"""
+
+import os
+import time
+import threading
+import queue
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from tracker import encode_faces
+from adaptive import AdaptiveController
+
+# Default downscale applied before detection (1/4 size, as in the serial loop)
+FRAME_SCALE = 0.25
+
+
+# --- Per-stage statistics ---
+class StageStats:
+    """Collects timing samples and throughput for a single pipeline stage"""
+    def __init__(self, name, window=500):
+        self.name = name
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, duration):
+        """Record one sample (in seconds) for this stage"""
+        with self.lock:
+            self.samples.append(duration)
+            self.count += 1
+
+    def snapshot(self):
+        """Return count, throughput and latency figures for this stage"""
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+        elapsed = max(time.time() - self.started, 1e-9)
+        if not samples:
+            return {'stage': self.name, 'count': count, 'per_sec': 0.0,
+                    'mean_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        return {
+            'stage': self.name,
+            'count': count,
+            'per_sec': count / elapsed,
+            'mean_ms': 1000.0 * sum(samples) / len(samples),
+            'p95_ms': 1000.0 * samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+            'max_ms': 1000.0 * samples[-1],
+        }
+
+
+class PipelineStats:
+    """Registry of StageStats with periodic console reporting"""
+    def __init__(self, report_interval=10.0):
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.report_interval = report_interval
+        self.last_report = time.time()
+
+    def stage(self, name):
+        """Get (or create) the stats object for a stage"""
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats(name)
+            return self.stages[name]
+
+    def record(self, name, duration):
+        """Record a sample for the named stage"""
+        self.stage(name).record(duration)
+
+    def increment(self, name, amount=1):
+        """Add to a named event counter (reported as a rate)"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        """Set a named current value (e.g. the chosen scale)"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def summary(self):
+        """Return a snapshot of every stage"""
+        with self.lock:
+            stages = list(self.stages.values())
+        return [s.snapshot() for s in stages]
+
+    def report(self, force=False):
+        """Print per-stage throughput and latency if the interval has elapsed"""
+        now = time.time()
+        if not force and now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        for snap in self.summary():
+            print(f"[STATS] {snap['stage']:<14} n={snap['count']:<6} "
+                  f"{snap['per_sec']:6.1f}/s  mean={snap['mean_ms']:7.1f}ms  "
+                  f"p95={snap['p95_ms']:7.1f}ms  max={snap['max_ms']:7.1f}ms")
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        elapsed = max(now - self.started, 1e-9)
+        for name, total in counters:
+            print(f"[STATS] {name:<14} n={total:<6} {total / elapsed:6.1f}/s")
+        if gauges:
+            print("[STATS] " + "  ".join(f"{name}={value:.3g}" for name, value in gauges))
+
+
+# --- Frame preparation ---
+def scale_boxes(boxes, factor):
+    """Scale (top, right, bottom, left) boxes between detection and full-frame coordinates"""
+    return [tuple(int(round(v * factor)) for v in box) for box in boxes]
+
+
+def prepare_frame(frame, scale=FRAME_SCALE):
+    """Downscale a BGR frame and convert it to the contiguous RGB array face_recognition expects"""
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    return np.ascontiguousarray(rgb_small_frame)
+
+
+# --- Worker process side ---
+def _init_worker():
+    """Load the dlib models once per worker process"""
+    global face_recognition
+    import face_recognition
+
+
+def _warm_up(delay):
+    """No-op task that keeps a worker busy briefly, so the pool starts every worker"""
+    time.sleep(delay)
+    return os.getpid()
+
+
+def detect_and_encode(rgb_small_frames, skip_boxes, model="hog"):
+    """
+    Detect all faces in one or more prepared frames and encode those not already
+    tracked (runs in a worker process). Frames of equal size are detected in a
+    single batch with the CNN model. Returns per-frame locations and encodings
+    plus the average detect and encode time per frame.
+    """
+    import face_recognition
+    start = time.perf_counter()
+    if model == "cnn" and len(rgb_small_frames) > 1 and len({f.shape for f in rgb_small_frames}) == 1:
+        face_locations = face_recognition.batch_face_locations(rgb_small_frames,
+                                                               batch_size=len(rgb_small_frames))
+    else:
+        face_locations = [face_recognition.face_locations(f, model=model) for f in rgb_small_frames]
+    detected = time.perf_counter()
+    face_encodings = [encode_faces(f, locations, skip)
+                      for f, locations, skip in zip(rgb_small_frames, face_locations, skip_boxes)]
+    encoded = time.perf_counter()
+    count = len(rgb_small_frames)
+    return face_locations, face_encodings, (detected - start) / count, (encoded - detected) / count
+
+
+# --- Capture stage ---
+class FrameGrabber(threading.Thread):
+    """Reads one camera continuously and keeps only the newest frame"""
+    def __init__(self, video_capture, stats=None, condition=None, pace=0.0):
+        super().__init__(daemon=True)
+        self.video_capture = video_capture
+        self.stats = stats
+        # Shared between the grabbers of all cameras so one waiter hears about any new frame
+        self.condition = condition or threading.Condition()
+        self.pace = pace  # minimum seconds between frames (replaying video files in real time)
+        self.frame = None
+        self.frame_id = 0
+        self.captured_at = 0.0
+        self.consumed_id = 0
+        self.dropped = 0
+        self.failed = False
+        self.running = True
+
+    def run(self):
+        while self.running:
+            start = time.perf_counter()
+            ret, frame = self.video_capture.read()
+            captured_at = time.time()
+            if not ret:
+                with self.condition:
+                    self.failed = True
+                    self.condition.notify_all()
+                break
+            if self.stats:
+                self.stats.record('capture', time.perf_counter() - start)
+            with self.condition:
+                # An unread frame is overwritten rather than queued
+                if self.frame_id > self.consumed_id:
+                    self.dropped += 1
+                self.frame = frame
+                self.frame_id += 1
+                self.captured_at = captured_at
+                self.condition.notify_all()
+            if self.pace:
+                time.sleep(max(0.0, self.pace - (time.perf_counter() - start)))
+
+    def poll(self):
+        """Return a frame newer than the last one handed out, or None (caller holds no lock)"""
+        with self.condition:
+            if self.frame_id <= self.consumed_id:
+                return None
+            self.consumed_id = self.frame_id
+            return self.frame_id, self.frame, self.captured_at
+
+    def latest(self, timeout=1.0):
+        """Wait for a frame newer than the last one handed out; None on timeout or failure"""
+        with self.condition:
+            if self.frame_id <= self.consumed_id and not self.failed:
+                self.condition.wait(timeout)
+        return self.poll()
+
+    def stop(self):
+        self.running = False
+
+
+class CameraStream:
+    """One camera feeding the shared pipeline, with its own gate, controller and tracker hook"""
+    def __init__(self, index, name, video_capture, stats, condition=None, gate=None,
+                 controller=None, skip_boxes=None, pace=0.0):
+        self.index = index
+        self.name = name
+        self.grabber = FrameGrabber(video_capture, stats, condition, pace)
+        self.gate = gate
+        # Without a controller every newest frame is processed at the default scale
+        self.controller = controller or AdaptiveController(target_latency=0, initial_scale=FRAME_SCALE,
+                                                           skip=1, stats=stats)
+        # Callable returning the (full-frame) boxes of tracked faces that need no re-encoding
+        self.skip_boxes = skip_boxes or (lambda: [])
+        self.last_delivered_id = 0
+
+    @property
+    def failed(self):
+        return self.grabber.failed
+
+
+class PipelineResult:
+    """Detection output for one frame, handed to the decision stage"""
+    def __init__(self, stream, frame_id, frame, captured_at, face_locations, face_encodings, gated=False):
+        # face_locations are in full-frame coordinates
+        self.stream = stream
+        self.frame_id = frame_id
+        self.frame = frame
+        self.captured_at = captured_at
+        self.face_locations = face_locations
+        self.face_encodings = face_encodings
+        self.gated = gated  # True if the motion gate skipped detection on this frame
+
+
+# --- Detection / encoding stage ---
+class RecognitionPipeline:
+    """Feeds the newest frames of one or more cameras through a shared detect/encode process pool"""
+    def __init__(self, streams, workers=None, stats=None, model="hog", on_error=None, max_restarts=5,
+                 max_results=None):
+        self.streams = streams
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.stats = stats or PipelineStats()
+        self.model = model
+        # With the CNN model all ready cameras go to one worker as a batch;
+        # HOG has no batch mode, so frames are spread over the workers instead
+        self.batch = model == "cnn" and len(streams) > 1
+        # Bounded like the grabbers' single frame slot: if the decision loop falls behind,
+        # the oldest results (full-resolution frames) are dropped instead of piling up
+        self.results = queue.Queue(maxsize=max_results or 2 * (len(streams) + self.workers))
+        self.dropped_results = 0
+        self.in_flight = threading.Semaphore(self.workers)
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.dispatcher = None
+        self.running = False
+        self.next_stream = 0
+        self.stale_results = 0
+        # Called with a message when a worker dies (e.g. DoorLogger's log_event("Error", ...))
+        self.on_error = on_error or (lambda message: None)
+        self.max_restarts = max_restarts  # pool restarts in a row without a result before giving up
+        self.restarts = 0
+        self.error = None
+
+    @classmethod
+    def for_captures(cls, captures, workers=None, stats=None, model="hog", on_error=None):
+        """Build a pipeline whose streams share one frame-ready condition"""
+        stats = stats or PipelineStats()
+        condition = threading.Condition()
+        streams = [CameraStream(i, name, capture, stats, condition, **kwargs)
+                   for i, (name, capture, kwargs) in enumerate(captures)]
+        return cls(streams, workers, stats, model, on_error)
+
+    @property
+    def failed(self):
+        """True once every camera has stopped delivering frames or the dispatcher has died"""
+        if self.error or (self.dispatcher is not None and not self.dispatcher.is_alive()):
+            return True
+        return all(stream.failed for stream in self.streams)
+
+    def _new_executor(self, warm=False):
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        if warm:
+            # ProcessPoolExecutor forks its workers lazily on submit; start them (and load
+            # their models) now, before the grabber and dispatcher threads exist
+            for future in [executor.submit(_warm_up, 0.05) for _ in range(self.workers)]:
+                future.result()
+        return executor
+
+    def _replace_executor(self, broken):
+        """
+        Swap a pool whose worker died (segfault, OOM kill) for a new one. Several
+        futures fail with the same pool, so only the first caller replaces it.
+        """
+        with self.executor_lock:
+            if self.executor is not broken or not self.running:
+                return
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                self.error = f"Detection workers crashed {self.restarts} times in a row"
+                print(f"[PIPELINE] {self.error}; giving up")
+                self.on_error(self.error)
+                return
+            message = f"Detection worker died; restarting the worker pool ({self.restarts}/{self.max_restarts})"
+            print(f"[PIPELINE] {message}")
+            self.on_error(message)
+            self.executor = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Start the worker pool, the grabber threads and the dispatcher thread"""
+        self.executor = self._new_executor(warm=True)
+        self.running = True
+        for stream in self.streams:
+            stream.grabber.start()
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self.dispatcher.start()
+        print(f"[PIPELINE] Started with {len(self.streams)} camera(s) and "
+              f"{self.workers} detection worker(s)")
+
+    def _ready_frames(self):
+        """
+        Round-robin over the cameras for frames worth detecting on; gated frames
+        are passed straight through for display. Returns at most one frame unless
+        batching, and starts after the last camera served so none is starved.
+        """
+        jobs = []
+        count = len(self.streams)
+        for offset in range(count):
+            stream = self.streams[(self.next_stream + offset) % count]
+            latest = stream.grabber.poll()
+            if latest is None:
+                continue
+            frame_id, frame, captured_at = latest
+            if not stream.controller.should_process():
+                continue
+            if stream.gate and not stream.gate.allow(frame, captured_at):
+                # Nothing moving: hand the frame on for display only
+                self._put_result(PipelineResult(stream, frame_id, frame, captured_at, [], [], gated=True))
+                continue
+            jobs.append((stream, frame_id, frame, captured_at, stream.controller.scale))
+            if not self.batch:
+                self.next_stream = (stream.index + 1) % count
+                break
+        return jobs
+
+    def _dispatch(self):
+        """Submit the newest frame(s) whenever a worker slot is free"""
+        try:
+            self._dispatch_loop()
+        except Exception as e:
+            # Leaves the thread dead, so `failed` turns True and the caller stops
+            self.error = f"Pipeline dispatcher failed: {e}"
+            print(f"[PIPELINE] {self.error}")
+            self.on_error(self.error)
+
+    def _dispatch_loop(self):
+        condition = self.streams[0].grabber.condition
+        while self.running and not self.error:
+            if not self.in_flight.acquire(timeout=0.5):
+                continue
+            jobs = self._ready_frames()
+            if not jobs:
+                self.in_flight.release()
+                if self.failed:
+                    break
+                # Sleep until any camera delivers a frame; idle gates keep this cheap
+                with condition:
+                    condition.wait(0.05)
+                continue
+            start = time.perf_counter()
+            rgb_small_frames = [prepare_frame(frame, scale) for _, _, frame, _, scale in jobs]
+            skip_boxes = [scale_boxes(stream.skip_boxes(), scale) for stream, _, _, _, scale in jobs]
+            self.stats.record('preprocess', (time.perf_counter() - start) / len(jobs))
+            submitted = time.perf_counter()
+            executor = self.executor
+            try:
+                future = executor.submit(detect_and_encode, rgb_small_frames, skip_boxes, self.model)
+            except BrokenProcessPool:
+                # A worker died; these frames are dropped and the next ones go to a new pool
+                self.in_flight.release()
+                self._replace_executor(executor)
+                continue
+            except RuntimeError:
+                # Executor shut down underneath us
+                self.in_flight.release()
+                break
+            future.add_done_callback(lambda f, j=jobs, sub=submitted, ex=executor: self._collect(f, j, sub, ex))
+
+    def _collect(self, future, jobs, submitted, executor):
+        self.in_flight.release()
+        try:
+            all_locations, all_encodings, detect_time, encode_time = future.result()
+        except BrokenProcessPool:
+            self._replace_executor(executor)
+            return
+        except Exception as e:
+            print(f"[PIPELINE] Worker failed on {len(jobs)} frame(s): {e}")
+            return
+        self.restarts = 0
+        self.stats.record('worker_total', time.perf_counter() - submitted)
+        for (stream, frame_id, frame, captured_at, scale), face_locations, face_encodings in \
+                zip(jobs, all_locations, all_encodings):
+            self.stats.record('detect', detect_time)
+            self.stats.record('encode', encode_time)
+            face_locations = scale_boxes(face_locations, 1.0 / scale)
+            stream.controller.update(detect_time + encode_time, face_locations, scale)
+            self._put_result(PipelineResult(stream, frame_id, frame, captured_at,
+                                            face_locations, face_encodings))
+
+    def _put_result(self, result):
+        """Queue a result for the decision stage, dropping the oldest one if the queue is full"""
+        while True:
+            try:
+                self.results.put_nowait(result)
+                return
+            except queue.Full:
+                try:
+                    self.results.get_nowait()
+                    self.dropped_results += 1
+                except queue.Empty:
+                    pass
+
+    def next_result(self, timeout=0.1):
+        """Return the next in-order result of any camera, or None if nothing is ready"""
+        while True:
+            try:
+                result = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            # Workers can finish out of order; an older frame is never worth acting on
+            stream = result.stream
+            if result.frame_id < stream.last_delivered_id:
+                self.stale_results += 1
+                continue
+            stream.last_delivered_id = result.frame_id
+            return result
+
+    def stop(self):
+        """Stop all stages and shut the worker pool down"""
+        self.running = False
+        for stream in self.streams:
+            stream.grabber.stop()
+        if self.dispatcher:
+            self.dispatcher.join(timeout=2)
+        for stream in self.streams:
+            stream.grabber.join(timeout=2)
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        dropped = sum(stream.grabber.dropped for stream in self.streams)
+        print(f"[PIPELINE] Stopped. Frames overwritten before use: {dropped}, "
+              f"stale results dropped: {self.stale_results}, results dropped while the decision "
+              f"loop was behind: {self.dropped_results}")
@@ -1,4 +1,3 @@
-import face_recognition
 import cv2
 import os
 import sys
@@ -6,6 +5,8 @@ import time
 from datetime import datetime
 import numpy as np
 from database import db_manager
+from gallery_store import GalleryStore
+from encoding_cache import default_cache
 
 def capture_user_images(name, num_images=3):
     """
@@ -69,12 +70,13 @@ def encode_user_faces(name):
         print(f"Error: No images found for user {name}")
         return False
     
+    # Images encoded before (e.g. when re-averaging after adding a picture) come from the cache
+    cache = default_cache('known_faces')
     encodings = []
     for image_file in image_files:
         try:
             image_path = os.path.join('known_faces', image_file)
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
+            _, face_encodings = cache.encode_file(image_path)
             
             if len(face_encodings) == 0:
                 print(f"Warning: No faces found in {image_file}. Skipping.")
@@ -86,6 +88,9 @@ def encode_user_faces(name):
         except Exception as e:
             print(f"Error processing image {image_file}: {e}")
     
+    print(f"Encoding cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+    cache.close()
+    
     if not encodings:
         print("Error: No valid face encodings generated")
         return False
@@ -93,11 +98,15 @@ def encode_user_faces(name):
     # Calculate the average encoding
     avg_encoding = np.mean(encodings, axis=0)
     
-    # Save the average encoding as a numpy array
-    encoding_path = os.path.join('known_faces', f"{name}_encoding.npy")
-    np.save(encoding_path, avg_encoding)
+    # Save the average encoding into the consolidated gallery
+    store = GalleryStore('known_faces', change_log=db_manager)
+    store.ensure_converted()
+    version = store.put(name, avg_encoding)
+    
+    print(f"Average face encoding saved to {store.index_path} (version {version})")
     
-    print(f"Average face encoding saved as {encoding_path}")
+    # Record the user as trained (adds them to the database if needed)
+    db_manager.save_enrollment(name, version, [os.path.join('known_faces', f) for f in sorted(image_files)])
     return True
 
 def register_user():
@@ -114,15 +123,18 @@ def register_user():
         return
     
     # Check if user already exists
+    store = GalleryStore('known_faces', change_log=db_manager)
+    store.ensure_converted()
     existing_files = [f for f in os.listdir('known_faces') if f.startswith(f"{name}_") and (f.endswith('.jpg') or f.endswith('_encoding.npy'))]
-    if existing_files:
+    if existing_files or name in store:
         response = input(f"User {name} already exists with {len(existing_files)} files. Overwrite? (y/n): ").strip().lower()
         if response != 'y':
             print("Registration cancelled")
             return
-        # Delete existing files
+        # Delete existing files and gallery entry
         for file in existing_files:
             os.remove(os.path.join('known_faces', file))
+        store.remove(name)
     
     # Capture user images
     num_images = input("How many images to capture? (default: 3): ").strip()
@@ -143,8 +155,6 @@ def register_user():
     
     print(f"Successfully registered user: {name} with {num_images} images")
     
-    # Add user to database
-    db_manager.add_user(name)
     print(f"User {name} added to database")
 
 if __name__ == "__main__":
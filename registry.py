@@ -0,0 +1,169 @@
+"""
+Cached registry of enrolled users for the web dashboard.
+
+The dashboard used to build its user list on every page load by listing
+known_faces/ twice, checking list membership for every image and merging the
+result with all database users. The database is now authoritative. Each
+`users` row records whether the user is trained, the gallery version their
+encoding was written to, and their image paths. UserRegistry keeps one sorted
+copy of those rows in memory. Triggers log the name of every user inserted,
+deleted or re-enrolled (by the dashboard or register.py) in `user_changes`,
+and the copy re-reads only those users. Pages and searches are then served
+from memory. The door system's per-entry updates of last_seen and
+access_count are not logged; those two columns are read fresh for the users
+on the page being served. Changes already applied are pruned from
+`user_changes`.
+"""
+
+import os
+import bisect
+import threading
+
+from gallery_store import LEGACY_SUFFIX
+
+# Beyond this many changed users a full reload is cheaper than patching
+FULL_RELOAD_AFTER = 2000
+# Applied user changes are deleted from user_changes once this many have accumulated
+PRUNE_AFTER = 1000
+
+
+class UserRegistry:
+    """Sorted, in-memory view of the users table, reloaded when it changes"""
+    def __init__(self, db, store, directory='known_faces'):
+        self.db = db
+        self.store = store  # GalleryStore, used to reconcile users enrolled before the registry existed
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.generation = None  # id of the last user change applied
+        self.pruned_to = 0
+        self.synced = False
+        self.entries = []  # user dicts sorted by name
+        self.names = []  # parallel to entries, for bisect
+        self.search_keys = []  # lower-case names, parallel to entries
+        self.by_name = {}
+        self.reloads = 0
+        self.patches = 0
+
+    def sync(self):
+        """
+        Bring the users table in line with known_faces/ and the gallery: users
+        that only exist as images or gallery entries are added, and trained
+        flags and image paths are corrected. Runs once per process.
+        """
+        images = {}
+        legacy = set()
+        if os.path.isdir(self.directory):
+            for file in os.listdir(self.directory):
+                if file.endswith(LEGACY_SUFFIX):
+                    legacy.add(file[:-len(LEGACY_SUFFIX)])
+                elif file.endswith('.jpg') and '_' in file and not file.startswith('.'):
+                    images.setdefault(file.rsplit('_', 1)[0], []).append(os.path.join(self.directory, file))
+        trained = set(self.store.names()) | legacy
+        version = self.store.version() if trained else None
+        rows = {user[0]: user for user in self.db.get_user_registry()}
+
+        changes = []
+        for name in set(rows) | set(images) | trained:
+            paths = sorted(images.get(name, []))
+            is_trained = name in trained
+            row = rows.get(name)
+            if row is not None and row[1] == is_trained and sorted(row[3]) == paths:
+                continue
+            encoding_version = row[2] if row is not None and row[2] is not None else version
+            changes.append((name, is_trained, encoding_version if is_trained else None, paths))
+        if changes:
+            self.db.save_enrollments(changes)
+            print(f"[REGISTRY] Reconciled {len(changes)} user(s) with {self.directory}")
+        self.synced = True
+        return len(changes)
+
+    def refresh(self):
+        """Apply changes to the users table since the last call; one cheap query when there are none"""
+        if not self.synced:
+            self.sync()
+        generation = self.db.get_user_generation()
+        if generation == self.generation:
+            return False
+        with self.lock:
+            changed = None
+            if self.generation is not None:
+                changed = self.db.get_user_changes(self.generation)
+            if changed is None or len(changed) > FULL_RELOAD_AFTER:
+                entries = [self._entry(row) for row in self.db.get_user_registry()]
+                self.entries = entries
+                self.names = [entry['name'] for entry in entries]
+                self.search_keys = [name.lower() for name in self.names]
+                self.by_name = dict(zip(self.names, entries))
+                self.reloads += 1
+            else:
+                # Copy-on-write, so a page being served keeps a consistent list
+                entries, names, keys = list(self.entries), list(self.names), list(self.search_keys)
+                rows = {row[0]: row for row in self.db.get_user_registry(changed)}
+                for name in changed:
+                    index = bisect.bisect_left(names, name)
+                    if index < len(names) and names[index] == name:
+                        del entries[index], names[index], keys[index]
+                        self.by_name.pop(name, None)
+                    if name in rows:
+                        entry = self._entry(rows[name])
+                        entries.insert(index, entry)
+                        names.insert(index, name)
+                        keys.insert(index, name.lower())
+                        self.by_name[name] = entry
+                self.entries, self.names, self.search_keys = entries, names, keys
+                self.patches += 1
+            self.generation = generation
+        if generation - self.pruned_to >= PRUNE_AFTER:
+            self.db.prune_user_changes(generation)
+            self.pruned_to = generation
+        return True
+
+    def _with_access(self, entries):
+        """Copies of `entries` with last_seen and access_count as they are now"""
+        access = self.db.get_user_access(entry['name'] for entry in entries)
+        fresh = []
+        for entry in entries:
+            entry = dict(entry)
+            if entry['name'] in access:
+                entry['last_seen'], count = access[entry['name']]
+                entry['access_count'] = count or 0
+            fresh.append(entry)
+        return fresh
+
+    def _entry(self, row):
+        name, trained, version, paths, created_at, last_seen, access_count = row
+        return {
+            'name': name,
+            'trained': trained,
+            'encoding_version': version,
+            'image_paths': paths,
+            'created_at': created_at,
+            'last_seen': last_seen,
+            'access_count': access_count or 0
+        }
+
+    def invalidate(self):
+        """Force a full reload on next use (changes to users are normally noticed on their own)"""
+        self.generation = None
+
+    def users(self):
+        self.refresh()
+        return self.entries
+
+    def get(self, name):
+        self.refresh()
+        entry = self.by_name.get(name)
+        return self._with_access([entry])[0] if entry else None
+
+    def page(self, query=None, page=1, per_page=50, trained=None):
+        """One page of users whose name contains `query` (case-insensitive); returns (users, total)"""
+        self.refresh()
+        with self.lock:
+            entries, keys = self.entries, self.search_keys
+        if query:
+            query = query.lower()
+            entries = [entry for entry, key in zip(entries, keys) if query in key]
+        if trained is not None:
+            entries = [entry for entry in entries if entry['trained'] == trained]
+        start = (page - 1) * per_page
+        return self._with_access(entries[start:start + per_page]), len(entries)
@@ -0,0 +1,57 @@
+"""
+Regression tests for IVFGallery's row-to-cell bookkeeping.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ann_index import IVFGallery
+
+
+def trained_gallery(size=1200, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(size=(size, 128)).astype(np.float32)
+    gallery = IVFGallery(encodings, [f"n{i}" for i in range(size)])
+    assert gallery.train()
+    return gallery, rng
+
+
+def assert_consistent(gallery):
+    """Every row is filed in exactly the cell _assign says, and nothing else is"""
+    assert len(gallery._assign) == gallery._size
+    filed = sorted(row for members in gallery._lists for row in members)
+    assert filed == list(range(gallery._size))
+    for cell, members in enumerate(gallery._lists):
+        assert all(gallery._assign[row] == cell for row in members)
+
+
+def test_add_many_with_existing_name_on_trained_index():
+    gallery, rng = trained_gallery()
+    gallery.add_many(['n1', 'new1'], rng.normal(size=(2, 128)))
+    assert_consistent(gallery)
+    # Removing and adding afterwards must find every row where _assign says it is
+    assert gallery.remove('n5')
+    gallery.add('new2', rng.normal(size=128))
+    assert_consistent(gallery)
+    assert gallery.match(gallery._matrix[[gallery._rows['new1']]], nprobe=gallery.nlist)[0][0][0] == 'new1'
+
+
+def test_add_many_with_repeated_name_on_trained_index():
+    gallery, rng = trained_gallery()
+    gallery.add_many(['dup', 'dup', 'other'], rng.normal(size=(3, 128)))
+    assert_consistent(gallery)
+    assert gallery._size == 1202
+
+
+def test_add_many_new_names_on_trained_index():
+    gallery, rng = trained_gallery()
+    gallery.add_many(['a', 'b', 'c'], rng.normal(size=(3, 128)))
+    assert_consistent(gallery)
+    assert gallery.remove('a')
+    assert_consistent(gallery)
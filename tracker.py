@@ -0,0 +1,160 @@
+"""
+Cross-frame face tracking for the face recognition door system.
+
+Detections are associated with existing tracks by box overlap (IoU), with a
+centroid-distance fallback for faces that moved further than their own
+width. A track whose identity was established with high confidence does not
+need its face re-encoded every frame: its box is handed to the encoder as a
+"skip box" until the track is due for a refresh, becomes ambiguous or is lost.
+"""
+
+import threading
+import itertools
+
+import numpy as np
+
+# Faces whose detected box overlaps a skip box this much are not re-encoded
+SKIP_IOU = 0.5
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid_distance(a, b):
+    """Distance between box centres, relative to the size of box a"""
+    ay, ax = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    by, bx = (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+    size = max(a[2] - a[0], a[1] - a[3], 1)
+    return float(np.hypot(ay - by, ax - bx)) / size
+
+
+def needs_encoding(face_locations, skip_boxes, threshold=SKIP_IOU):
+    """For each detected face, False if it sits on a confidently identified track"""
+    return [not any(iou(location, box) >= threshold for box in skip_boxes)
+            for location in face_locations]
+
+
+def encode_faces(rgb_small_frame, face_locations, skip_boxes=()):
+    """Encode only faces not covered by a skip box; skipped faces get None"""
+    import face_recognition
+    wanted = needs_encoding(face_locations, skip_boxes)
+    to_encode = [location for location, want in zip(face_locations, wanted) if want]
+    encoded = iter(face_recognition.face_encodings(rgb_small_frame, to_encode) if to_encode else [])
+    return [next(encoded) if want else None for want in wanted]
+
+
+class Track:
+    """One face followed across frames"""
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = None
+        self.distance = None
+        self.encoding = None
+        self.age = 0  # processed frames since the track was created
+        self.misses = 0  # consecutive processed frames without a detection
+        self.since_encode = 0  # processed frames since the face was last encoded
+
+
+class FaceTracker:
+    """IoU/centroid tracker that decides which faces have to be re-encoded"""
+    def __init__(self, iou_threshold=0.3, centroid_threshold=0.5, max_misses=3,
+                 refresh_interval=10, confident_distance=0.45, unknown_distance=0.7):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_misses = max_misses
+        self.refresh_interval = refresh_interval
+        self.confident_distance = confident_distance  # known faces at least this close
+        self.unknown_distance = unknown_distance  # unknown faces at least this far
+        self.tracks = []
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def is_confident(self, track):
+        """True if the track's identity can be trusted without re-encoding"""
+        if track.name is None or track.encoding is None:
+            return False
+        if track.name == "Unknown":
+            return track.distance is None or track.distance >= self.unknown_distance
+        return track.distance is not None and track.distance <= self.confident_distance
+
+    def skip_boxes(self):
+        """Boxes of confident, currently visible tracks that are not due for a refresh"""
+        with self.lock:
+            return [t.box for t in self.tracks
+                    if t.misses == 0 and t.since_encode < self.refresh_interval and self.is_confident(t)]
+
+    def _associate(self, face_locations):
+        """Greedy one-to-one matching; returns (detection -> track, ambiguous detection indices)"""
+        pairs = []
+        overlaps = [0] * len(face_locations)
+        for d, location in enumerate(face_locations):
+            for t, track in enumerate(self.tracks):
+                score = iou(location, track.box)
+                if score >= self.iou_threshold:
+                    overlaps[d] += 1
+                    pairs.append((score, d, t))
+                elif centroid_distance(track.box, location) <= self.centroid_threshold:
+                    # Fast movement: rank below every real overlap
+                    pairs.append((score - 1.0, d, t))
+        assigned, used = {}, set()
+        for score, d, t in sorted(pairs, reverse=True):
+            if d not in assigned and t not in used:
+                assigned[d] = self.tracks[t]
+                used.add(t)
+        # A face overlapping several tracks (people crossing) cannot reuse an identity
+        ambiguous = {d for d, count in enumerate(overlaps) if count > 1}
+        return assigned, ambiguous
+
+    def update(self, face_locations, face_encodings, identify):
+        """
+        Associate one frame's detections with tracks.
+
+        face_encodings holds None for faces that were not re-encoded;
+        identify(encodings) -> [(name, distance), ...] is called once for
+        the freshly encoded faces. Returns (name, distance, encoding) per
+        face, with name None when a skipped face could not be attributed.
+        """
+        with self.lock:
+            assigned, ambiguous = self._associate(face_locations)
+            fresh = [i for i, encoding in enumerate(face_encodings) if encoding is not None]
+            identified = dict(zip(fresh, identify([face_encodings[i] for i in fresh]))) if fresh else {}
+
+            results = []
+            seen = set()
+            for i, location in enumerate(face_locations):
+                track = assigned.get(i)
+                if track is None:
+                    track = Track(next(self._ids), location)
+                    self.tracks.append(track)
+                seen.add(track.id)
+                track.box = location
+                track.misses = 0
+                track.age += 1
+                if i in identified:
+                    track.name, track.distance = identified[i]
+                    track.encoding = face_encodings[i]
+                    track.since_encode = 0
+                    results.append((track.name, track.distance, track.encoding))
+                elif i not in ambiguous and self.is_confident(track):
+                    track.since_encode += 1
+                    results.append((track.name, track.distance, track.encoding))
+                else:
+                    # Skipped by the encoder but no longer attributable; re-encode next frame
+                    track.name = None
+                    results.append((None, None, None))
+
+            for track in self.tracks:
+                if track.id not in seen:
+                    track.misses += 1
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+            return results
@@ -0,0 +1,164 @@
+"""
+Short-term memory of unknown visitors.
+
+The decision stage used to remember only the last unknown encoding plus a
+5-second global cooldown. Two strangers taking turns in view were therefore
+captured and e-mailed again and again, while a genuinely new stranger inside
+the cooldown was not captured at all. VisitorCache instead remembers up to
+`capacity` unknown faces. Each face gets a stable temporary visitor ID and is
+matched against all remembered faces with one vectorized distance
+computation. Visitors not seen for `ttl` seconds expire; when the cache is
+full, the least recently seen visitor is evicted. With a writer, visitors are
+also stored in the `visitors` table and reloaded at start-up, so a stranger
+who comes back the next day is recognised as a repeat visitor.
+"""
+
+import time
+import uuid
+import threading
+
+import numpy as np
+
+
+class Visitor:
+    """One remembered unknown face"""
+    def __init__(self, visitor_id, encoding, first_seen, last_seen=None, sightings=1):
+        self.visitor_id = visitor_id
+        self.encoding = encoding
+        self.first_seen = first_seen
+        self.last_seen = last_seen or first_seen
+        self.sightings = sightings
+        self.last_captured = 0.0
+
+    def record(self):
+        """Row for DatabaseManager.log_access_events"""
+        return (self.visitor_id, self.first_seen, self.last_seen, self.sightings,
+                np.asarray(self.encoding, dtype=np.float32).tobytes())
+
+
+class VisitorCache:
+    """Bounded TTL/LRU cache of unknown face encodings with temporary visitor IDs"""
+    def __init__(self, capacity=512, ttl=7 * 86400.0, tolerance=0.6, recapture_interval=600.0,
+                 writer=None, stats=None):
+        self.capacity = capacity
+        self.ttl = ttl  # visitors not seen for this long are forgotten
+        self.tolerance = tolerance  # faces closer than this are the same visitor
+        self.recapture_interval = recapture_interval  # least time between two captures of one visitor
+        self.writer = writer  # EventWriter (or anything with put_visitor); None keeps visitors in memory
+        self.stats = stats
+        self.lock = threading.Lock()
+        # Slot i holds visitors[i] and its encoding in row i; free slots are None
+        self.encodings = np.zeros((capacity, 128), dtype=np.float64)
+        self.sq_norms = np.zeros(capacity)
+        self.last_seen = np.full(capacity, -np.inf)
+        self.visitors = [None] * capacity
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def load(self, rows):
+        """Fill the cache from (visitor_id, first_seen, last_seen, sightings, encoding) rows, newest first"""
+        now = time.time()
+        with self.lock:
+            for visitor_id, first_seen, last_seen, sightings, blob in rows:
+                if self.size >= self.capacity or now - last_seen > self.ttl:
+                    break
+                encoding = np.frombuffer(blob, dtype=np.float32).astype(np.float64)
+                self._store(self.size, Visitor(visitor_id, encoding, first_seen, last_seen, sightings))
+            self._publish()
+        return self.size
+
+    def observe(self, encoding, seen_at=None):
+        """Return the Visitor this unknown face belongs to, remembering it if it is new"""
+        seen_at = seen_at or time.time()
+        with self.lock:
+            self._expire(seen_at)
+            slot = self._match(encoding)
+            if slot is not None:
+                visitor = self.visitors[slot]
+                visitor.last_seen = max(visitor.last_seen, seen_at)
+                visitor.sightings += 1
+                self.last_seen[slot] = visitor.last_seen
+                self.hits += 1
+                if self.stats:
+                    self.stats.increment('visitor_hits')
+            else:
+                visitor = Visitor(f"visitor-{uuid.uuid4().hex[:8]}", np.asarray(encoding, dtype=np.float64),
+                                  seen_at)
+                self._store(self._free_slot(), visitor)
+                self.misses += 1
+                if self.stats:
+                    self.stats.increment('visitor_misses')
+            self._publish()
+        if self.writer:
+            self.writer.put_visitor(visitor.record())
+        return visitor
+
+    def due_for_capture(self, visitor, now=None):
+        """True (and the capture is counted) if this visitor was not captured recently"""
+        now = now or time.time()
+        with self.lock:
+            if now - visitor.last_captured < self.recapture_interval:
+                return False
+            visitor.last_captured = now
+            return True
+
+    def _match(self, encoding):
+        if not self.size:
+            return None
+        # One matrix-vector product against every slot: |e - x|^2 = |e|^2 - 2 e.x + |x|^2.
+        # Free and expired slots never match.
+        encoding = np.asarray(encoding, dtype=np.float64)
+        sq_distances = self.sq_norms - 2.0 * (self.encodings @ encoding) + encoding @ encoding
+        sq_distances[np.isneginf(self.last_seen)] = np.inf
+        slot = int(np.argmin(sq_distances))
+        return slot if sq_distances[slot] < self.tolerance ** 2 else None
+
+    def _free_slot(self):
+        # Free slots sort first (-inf); when full, the least recently seen visitor makes room
+        slot = int(np.argmin(self.last_seen))
+        if self.visitors[slot] is not None:
+            self._drop(slot)
+            self.evicted += 1
+        return slot
+
+    def _expire(self, now):
+        for slot in np.flatnonzero(np.isfinite(self.last_seen) & (now - self.last_seen > self.ttl)):
+            self._drop(slot)
+            self.expired += 1
+
+    def _store(self, slot, visitor):
+        self.visitors[slot] = visitor
+        self.encodings[slot] = visitor.encoding
+        self.sq_norms[slot] = self.encodings[slot] @ self.encodings[slot]
+        self.last_seen[slot] = visitor.last_seen
+        self.size += 1
+
+    def _drop(self, slot):
+        self.visitors[slot] = None
+        self.last_seen[slot] = -np.inf
+        self.size -= 1
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _publish(self):
+        if self.stats:
+            self.stats.set_gauge('visitor_cache_size', self.size)
+            self.stats.set_gauge('visitor_hit_rate', self.hit_rate())
+
+    def status(self):
+        """Cache size and how often an unknown face was a visitor seen before"""
+        with self.lock:
+            return {
+                'size': self.size,
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate(),
+                'evicted': self.evicted,
+                'expired': self.expired,
+            }
@@ -1,15 +1,16 @@
 import os
 import json
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
 import csv
 from datetime import datetime
 from database import db_manager
-import face_recognition
-import numpy as np
+from gallery_store import GalleryStore
+from registry import UserRegistry
+from live_view import LIVE_DIR, BOUNDARY, mjpeg_stream
+from log_stream import LogWatcher
+from log_archive import LogArchive, merge_pages
+from enrollment import EnrollmentQueue
 import base64
-import io
-from PIL import Image
-import traceback
 
 app = Flask(__name__)
 
@@ -19,24 +20,155 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # Path configurations
 LOG_FILE = 'door_access.log'
 KNOWN_FACES_DIR = 'known_faces'
+USERS_PER_PAGE = 48
+
+gallery_store = GalleryStore(KNOWN_FACES_DIR, change_log=db_manager)
+# In-memory copy of the users table, reloaded only when a user is added, changed or removed
+registry = UserRegistry(db_manager, gallery_store, KNOWN_FACES_DIR)
+# Face encoding for registrations runs in worker processes, not in the request
+enrollments = EnrollmentQueue(gallery_store, db_manager, KNOWN_FACES_DIR)
+# Monthly archives of old access logs, read only when a request asks for them
+log_archive = LogArchive(db_manager)
 
 @app.route('/')
 def index():
     """Main dashboard page showing registered users"""
-    users = get_registered_users()
-    return render_template('index.html', users=users)
+    users, total = registry.page(per_page=USERS_PER_PAGE)
+    return render_template('index.html', users=users, total=total)
 
 @app.route('/logs')
 def logs():
-    """API endpoint to get all logs as JSON"""
-    logs = read_access_logs()
-    return jsonify(logs)
+    """
+    API endpoint to get logs as JSON, newest first.
+    
+    Query parameters: limit (default 100, max 1000), before/after (cursors from
+    the X-Cursor-Older/X-Cursor-Newer headers of a previous page), event,
+    person, since/until (UTC 'YYYY-MM-DD[ HH:MM:SS]'), since_id (only rows
+    logged after that id, oldest first; poll again with the last id received),
+    archive=1 (also search the monthly archives of old logs).
+    
+    Responses carry an ETag; a poll with If-None-Match gets 304 Not Modified
+    without any query as long as nothing new was logged or archived.
+    """
+    try:
+        limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+        before = parse_log_cursor(request.args.get('before'))
+        after = parse_log_cursor(request.args.get('after'))
+        since_id = request.args.get('since_id')
+        since_id = int(since_id) if since_id else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid cursor"}), 400
+    
+    # Every new event gets a higher id, so the newest id (plus the rows archived) identifies the data version
+    etag = f"logs-{db_manager.get_latest_log_id()}-{db_manager.get_archive_generation()}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+    
+    db_logs = db_manager.query_access_logs(limit, before=before, after=after,
+                                           event_type=request.args.get('event'),
+                                           person_name=request.args.get('person'),
+                                           since=request.args.get('since'),
+                                           until=request.args.get('until'),
+                                           since_id=since_id)
+    if request.args.get('archive') in ('1', 'true') and since_id is None:
+        archived = log_archive.query(limit, before=before, after=after,
+                                     event_type=request.args.get('event'),
+                                     person_name=request.args.get('person'),
+                                     since=request.args.get('since'),
+                                     until=request.args.get('until'))
+        db_logs = merge_pages(db_logs, archived, limit, newer=bool(after and not before))
+    response = jsonify(format_access_logs(db_logs))
+    if db_logs and since_id is None:
+        # Cursors for the neighbouring pages; the body stays a plain list
+        response.headers['X-Cursor-Newer'] = log_cursor(db_logs[0])
+        response.headers['X-Cursor-Older'] = log_cursor(db_logs[-1])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/logs/archives')
+def logs_archives():
+    """Monthly archives of old access logs: month, rows, time range and size"""
+    return jsonify([{'month': month, 'rows': rows, 'first': first, 'last': last, 'bytes': size,
+                     'archived_at': archived_at}
+                    for month, path, rows, first, last, size, archived_at in db_manager.get_log_archives()])
+
+@app.route('/logs/stream')
+def logs_stream():
+    """
+    Server-Sent Events stream of new access events ('access' events with the
+    log id as event id). Reconnecting clients send Last-Event-ID and receive
+    what they missed; ?since_id= does the same for the first connection.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid event id"}), 400
+    return Response(log_watcher.stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/episodes')
+def episodes():
+    """API endpoint to get recent episodes (one row per visit instead of per detection)"""
+    limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+    rows = db_manager.get_episodes(limit, person_name=request.args.get('person'),
+                                   open_only=request.args.get('open') == '1')
+    return jsonify([{
+        'id': row[0],
+        'person': row[1],
+        'camera': row[2],
+        'started_at': row[3],
+        'last_seen': row[4],
+        'detections': row[5],
+        'best_distance': row[6],
+        'open': not row[7]
+    } for row in rows])
+
+def log_cursor(db_log):
+    """Opaque pagination cursor for one access_logs row"""
+    return f"{db_log[1]}|{db_log[0]}"
+
+def parse_log_cursor(cursor):
+    """Inverse of log_cursor; None if no cursor was given"""
+    if not cursor:
+        return None
+    timestamp, _, log_id = cursor.rpartition('|')
+    if not timestamp:
+        raise ValueError(cursor)
+    return timestamp, int(log_id)
+
+@app.route('/live')
+def live():
+    """MJPEG live view of a door camera, published by the running door system"""
+    camera = request.args.get('camera', 'cam0')
+    if not camera.replace('_', '').isalnum():
+        return jsonify({"status": "error", "message": "Invalid camera name"}), 400
+    # Clamped: 0 or a negative rate would break the stream's frame interval
+    fps = max(0.5, min(request.args.get('fps', 5.0, type=float), 30.0))
+    return Response(mjpeg_stream(camera, LIVE_DIR, fps),
+                    mimetype=f'multipart/x-mixed-replace; boundary={BOUNDARY}')
 
 @app.route('/users')
 def users():
-    """Page to manage registered users"""
-    users = get_registered_users()
-    return render_template('users.html', users=users)
+    """Page to manage registered users (first page; the rest is fetched from /api/users)"""
+    users, total = registry.page(per_page=USERS_PER_PAGE)
+    return render_template('users.html', users=users, total=total, per_page=USERS_PER_PAGE)
+
+@app.route('/api/users')
+def api_users():
+    """
+    API endpoint to page through registered users, ordered by name.
+    
+    Query parameters: q (case-insensitive name search), page (from 1),
+    per_page (default 48, max 500), trained (1 or 0).
+    """
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', USERS_PER_PAGE, type=int), 500))
+    trained = request.args.get('trained')
+    users, total = registry.page(request.args.get('q', '').strip(), page, per_page,
+                                 trained=None if trained is None else trained == '1')
+    return jsonify({'users': users, 'total': total, 'page': page, 'per_page': per_page})
 
 @app.route('/register')
 def register():
@@ -45,7 +177,10 @@ def register():
 
 @app.route('/register_user', methods=['POST'])
 def register_user():
-    """API endpoint to register a new user with face capture"""
+    """
+    API endpoint to register a new user with face capture. Returns a job id at
+    once (status 'queued'); poll /jobs/<id> until it is 'done' or 'failed'.
+    """
     try:
         # Get form data
         user_name = request.form.get('name')
@@ -62,86 +197,40 @@ def register_user():
             os.makedirs(KNOWN_FACES_DIR)
         
         # Check if user already exists
+        gallery_store.ensure_converted()
         existing_files = [f for f in os.listdir(KNOWN_FACES_DIR) if f.startswith(f"{user_name}_") and (f.endswith('.jpg') or f.endswith('_encoding.npy'))]
-        if existing_files:
+        if existing_files or user_name in gallery_store or enrollments.is_pending(user_name):
             return jsonify({"status": "error", "message": f"User {user_name} already exists. Please choose a different name or delete the existing user."})
         
-        # Save the image directly to known_faces folder
+        # Decode in memory; nothing is written until the face has been encoded
         try:
             # Remove data URL prefix if present
             if image_data.startswith('data:image'):
                 image_data = image_data.split(',')[1]
             
             # Decode base64 image data
-            image_bytes = base64.b64decode(image_data)
-            
-            # Save image file directly (single image)
-            image_path = os.path.join(KNOWN_FACES_DIR, f"{user_name}_1.jpg")
-            with open(image_path, "wb") as f:
-                f.write(image_bytes)
-            
-            # Generate face encoding immediately
-            if generate_single_user_encoding(user_name):
-                # Add user to database
-                db_manager.add_user(user_name)
-                return jsonify({"status": "success", "message": f"User {user_name} registered successfully with face capture."})
-            else:
-                # Clean up the saved image if encoding fails
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-                return jsonify({"status": "error", "message": "Failed to generate face encoding. Please ensure a clear face image with good lighting."})
-                
+            image_bytes = base64.b64decode(image_data, validate=True)
         except Exception as e:
-            return jsonify({"status": "error", "message": f"Failed to save face image: {str(e)}"})
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"Failed to register user: {str(e)}"})
-
-def generate_single_user_encoding(name):
-    """
-    Generate face encoding for a user from a single captured image
-    """
-    try:
-        # Look for the single image file
-        image_file = f"{name}_1.jpg"
-        image_path = os.path.join(KNOWN_FACES_DIR, image_file)
-        
-        if not os.path.exists(image_path):
-            print(f"Error: Image file not found for user {name}")
-            return False
+            return jsonify({"status": "error", "message": f"Invalid face image: {str(e)}"})
         
         try:
-            # Load image with PIL first to ensure it's valid
-            image = Image.open(image_path)
-            image = image.convert('RGB')  # Ensure RGB format
-            image_array = np.array(image)
-            
-            # Then process with face_recognition
-            face_encodings = face_recognition.face_encodings(image_array)
-            
-            if len(face_encodings) == 0:
-                print(f"Warning: No faces found in {image_file}.")
-                return False
-            elif len(face_encodings) > 1:
-                print(f"Warning: Multiple faces found in {image_file}. Using the first one.")
-            
-            # Use the first face encoding
-            encoding = face_encodings[0]
-            
-            # Save the encoding as a numpy array
-            encoding_path = os.path.join(KNOWN_FACES_DIR, f"{name}_encoding.npy")
-            np.save(encoding_path, encoding)
-            
-            print(f"Face encoding saved as {encoding_path}")
-            return True
-        except Exception as e:
-            print(f"Error processing image {image_file}: {e}")
-            traceback.print_exc()
-            return False
-        
+            job = enrollments.submit(user_name, image_bytes)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)})
+        if job is None:
+            return jsonify({"status": "error", "message": "Too many registrations in progress. Please try again shortly."}), 503
+        return jsonify({"status": "queued", "job_id": job.id,
+                        "message": f"Encoding the face of {user_name}..."}), 202
     except Exception as e:
-        print(f"Error generating encoding: {e}")
-        traceback.print_exc()
-        return False
+        return jsonify({"status": "error", "message": f"Failed to register user: {str(e)}"})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a registration job: queued, running, done or failed, with a message"""
+    job = enrollments.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.as_dict())
 
 @app.route('/add_user', methods=['POST'])
 def add_user():
@@ -158,7 +247,7 @@ def add_user():
             os.makedirs(KNOWN_FACES_DIR)
             
         existing_files = [f for f in os.listdir(KNOWN_FACES_DIR) if f.startswith(f"{user_name}_") and (f.endswith('.jpg') or f.endswith('_encoding.npy'))]
-        if existing_files:
+        if existing_files or user_name in gallery_store:
             # User already exists, return error
             return jsonify({"status": "error", "message": f"User {user_name} already exists"})
         
@@ -180,6 +269,7 @@ def delete_user(username):
                 if file.startswith(f"{username}_") and (file.endswith('.jpg') or file.endswith('_encoding.npy')):
                     file_path = os.path.join(KNOWN_FACES_DIR, file)
                     os.remove(file_path)
+            gallery_store.remove(username)
             
         # Also delete user from database
         db_manager.delete_user(username)
@@ -190,77 +280,27 @@ def delete_user(username):
 
 def read_access_logs():
     """Read access logs from the database"""
+    return format_access_logs(db_manager.get_recent_access_logs(100))  # Get last 100 logs
+
+def format_access_logs(db_logs):
+    """Convert access_logs rows to the JSON shape used by the dashboard"""
     logs = []
-    db_logs = db_manager.get_recent_access_logs(100)  # Get last 100 logs
     for db_log in db_logs:
         logs.append({
+            'id': db_log[0],
             'timestamp': db_log[1],  # timestamp
             'event': db_log[2],      # event_type
-            'person': db_log[3] or "N/A"  # person_name
+            'person': db_log[3] or "N/A",  # person_name
+            'details': db_log[4]
         })
     return logs
 
+# One poller for all /logs/stream clients, started with the first one
+log_watcher = LogWatcher(db_manager, format_access_logs)
+
 def get_registered_users():
-    """Get list of registered users from database"""
-    db_users = db_manager.get_all_users()
-    users = []
-    user_dict = {}  # Use a dictionary to avoid duplicates
-    
-    # First, process users from database
-    for db_user in db_users:
-        user_dict[db_user[1]] = {
-            'name': db_user[1],
-            'trained': False,  # Will be updated if encoding exists
-            'created_at': db_user[2],
-            'last_seen': db_user[3],
-            'access_count': db_user[4]
-        }
-    
-    # Then, check for image files and encodings
-    if os.path.exists(KNOWN_FACES_DIR):
-        encoding_files = [f for f in os.listdir(KNOWN_FACES_DIR) if f.endswith('_encoding.npy')]
-        
-        for file in os.listdir(KNOWN_FACES_DIR):
-            if file.endswith('.jpg') and '_' in file and not file.startswith('.'):
-                # Extract username from filename (before the _number.jpg part)
-                parts = file.split('_')
-                if len(parts) >= 2:
-                    username = '_'.join(parts[:-1])
-                    # Check if encoding file exists
-                    encoding_file = f"{username}_encoding.npy"
-                    trained = encoding_file in encoding_files
-                    
-                    if username in user_dict:
-                        # Update existing user
-                        user_dict[username]['trained'] = trained
-                    else:
-                        # Add new user from image files
-                        user_dict[username] = {
-                            'name': username,
-                            'trained': trained,
-                            'created_at': None,
-                            'last_seen': None,
-                            'access_count': 0
-                        }
-            elif file.endswith('_encoding.npy'):
-                # Handle encoding files directly
-                username = file.replace('_encoding.npy', '')
-                if username not in user_dict:
-                    # Add user from encoding file if not in database
-                    user_dict[username] = {
-                        'name': username,
-                        'trained': True,
-                        'created_at': None,
-                        'last_seen': None,
-                        'access_count': 0
-                    }
-                else:
-                    # Ensure trained status is set correctly
-                    user_dict[username]['trained'] = True
-    
-    # Convert dictionary to list
-    users = list(user_dict.values())
-    return users
+    """Get list of registered users (with trained status) from the cached registry"""
+    return registry.users()
 
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist